@@ -0,0 +1,62 @@
+"""Helpers shared by the benchmark scripts: latency summaries and result files."""
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))]
+
+
+def summarize(samples_ms: List[float], digits: int = 3) -> Dict[str, float]:
+    ordered = sorted(samples_ms)
+    if not ordered:
+        return {"n": 0}
+    return {
+        "n": len(ordered),
+        "p50_ms": round(percentile(ordered, 50), digits),
+        "p95_ms": round(percentile(ordered, 95), digits),
+        "p99_ms": round(percentile(ordered, 99), digits),
+        "mean_ms": round(statistics.fmean(ordered), digits),
+        "max_ms": round(ordered[-1], digits),
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def environment() -> Dict[str, object]:
+    """Where and when a run happened, stored with its results."""
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def report(benchmark: str, settings: Dict[str, object], results: Dict[str, object], output: Optional[str]) -> None:
+    """Print the results as JSON and, with ``output``, save them for ``compare.py``."""
+    document = {"benchmark": benchmark, "environment": environment(), "settings": settings, "results": results}
+    print(json.dumps(document, indent=2))
+    if output:
+        with open(output, "w") as f:
+            json.dump(document, f, indent=2)
+        print(f"Saved results to {output}", file=sys.stderr)
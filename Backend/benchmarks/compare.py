@@ -0,0 +1,66 @@
+"""
+Compare two benchmark result files written with ``--output``.
+
+Prints every latency (``*_ms``) and throughput (``*_rps``) figure side by
+side with the relative change, and exits with status 1 when a figure other
+than a maximum got worse by more than ``--threshold`` percent, so it can
+gate CI:
+
+    python benchmarks/compare.py before.json after.json --threshold 10
+"""
+import argparse
+import json
+import sys
+from typing import Dict, Iterator, Tuple
+
+
+def _figures(node, path: str = "") -> Iterator[Tuple[str, float]]:
+    if isinstance(node, dict):
+        for key, value in node.items():
+            yield from _figures(value, f"{path}.{key}" if path else key)
+    elif isinstance(node, (int, float)) and not isinstance(node, bool) and path.endswith(("_ms", "_rps")):
+        yield path, float(node)
+
+
+def compare(before: Dict, after: Dict, threshold: float) -> int:
+    old = dict(_figures(before.get("results", before)))
+    new = dict(_figures(after.get("results", after)))
+    regressions = 0
+    width = max((len(k) for k in old.keys() & new.keys()), default=10)
+    print(f"{'figure':<{width}}  {'before':>12}  {'after':>12}  {'change':>8}")
+    for key in sorted(old.keys() & new.keys()):
+        a, b = old[key], new[key]
+        change = (b - a) / a * 100 if a else 0.0
+        # Latencies should go down, throughput up; single worst samples are too noisy to gate on
+        if key.endswith("max_ms"):
+            worse = False
+        else:
+            worse = change > threshold if key.endswith("_ms") else change < -threshold
+        regressions += worse
+        print(f"{key:<{width}}  {a:>12.3f}  {b:>12.3f}  {change:>+7.1f}%{'  <- worse' if worse else ''}")
+    for label, keys in (("before", old.keys() - new.keys()), ("after", new.keys() - old.keys())):
+        if keys:
+            print(f"{len(keys)} figure(s) only in {label}, e.g. {min(keys)}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=10.0, help="percent change counted as a regression")
+    args = parser.parse_args()
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    if before.get("benchmark") != after.get("benchmark"):
+        print(f"Warning: comparing {before.get('benchmark')} with {after.get('benchmark')}", file=sys.stderr)
+    regressions = compare(before, after, args.threshold)
+    if regressions:
+        print(f"{regressions} figure(s) worse by more than {args.threshold}%", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
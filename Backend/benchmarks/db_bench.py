@@ -0,0 +1,190 @@
+"""
+Chat database benchmark: stock SQLite settings vs the tuned engine.
+
+Builds a database with ``--messages`` chat turns spread over ``--sessions``
+sessions, copies it, and runs the same workload against
+
+* ``baseline``: default pragmas (rollback journal, synchronous=FULL) and
+  no secondary indexes, like chat_data.db files created by older versions
+* ``tuned``: the pragmas from ``src.database.db`` plus the indexes created
+  by ``migrate()``
+
+Workload: single-turn commits, loading a session's recent history,
+exporting a whole session, and the per-model stats (legacy COUNT per
+session vs the grouped aggregate).
+
+Run from the Backend folder:
+
+    python benchmarks/db_bench.py --messages 1000000 --sessions 20000
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sqlalchemy import create_engine, event  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from src.database.db import Base, _sqlite_pragmas, migrate  # noqa: E402
+from src.models.chat_models import ChatConversations, ChatSession  # noqa: E402
+from src.utils.chat_helper import model_usage_query  # noqa: E402
+
+MODELS = ["llama3:latest", "mistral:latest", "codellama:latest", "phi3:mini", "gemma:2b"]
+
+
+def build(path, messages, sessions, seed):
+    """Write the dataset with plain sqlite3 (fast bulk load, no indexes besides the primary keys)."""
+    rng = random.Random(seed)
+    engine = create_engine(f"sqlite:///{path}")
+    # Tables as shipped before the composite indexes existed
+    for table in Base.metadata.sorted_tables:
+        table.create(engine, checkfirst=True)
+    engine.dispose()
+
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    for index in ("ix_chat_sessions_created_at", "ix_chat_sessions_model_created_at", "ix_chat_convs_session_id_created_at"):
+        conn.execute(f"DROP INDEX IF EXISTS {index}")
+
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    session_ids = [str(uuid4()) for _ in range(sessions)]
+    conn.executemany(
+        "INSERT INTO chat_sessions (id, title, created_at, modified_at, model) VALUES (?, ?, ?, ?, ?)",
+        [(sid, f"Chat {i}", start + timedelta(minutes=i), start + timedelta(minutes=i), rng.choice(MODELS))
+         for i, sid in enumerate(session_ids)],
+    )
+    batch = []
+    for i in range(messages):
+        created = start + timedelta(seconds=i)
+        batch.append((str(uuid4()), rng.choice(session_ids), f"question {i} " + "lorem ipsum " * rng.randint(2, 20),
+                      f"answer {i} " + "dolor sit amet " * rng.randint(5, 60), created, created))
+        if len(batch) == 50_000:
+            conn.executemany("INSERT INTO chat_convs VALUES (?, ?, ?, ?, ?, ?)", batch)
+            batch = []
+    if batch:
+        conn.executemany("INSERT INTO chat_convs VALUES (?, ?, ?, ?, ?, ?)", batch)
+    conn.commit()
+    conn.close()
+    return session_ids
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    return {
+        "p50_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        "mean_ms": round(statistics.fmean(samples), 3),
+    }
+
+
+def legacy_model_usage(db, limit=None):
+    """The stats loop this replaced: one COUNT per session."""
+    sessions = db.query(ChatSession).filter(ChatSession.model.isnot(None))
+    if limit:
+        sessions = sessions.limit(limit)
+    counts = {}
+    for session in sessions.all():
+        entry = counts.setdefault(session.model, {"sessions": 0, "messages": 0})
+        entry["sessions"] += 1
+        entry["messages"] += db.query(ChatConversations).filter(ChatConversations.session_id == session.id).count()
+    return counts
+
+
+def run(path, tuned, session_ids, args):
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    if tuned:
+        event.listen(engine, "connect", _sqlite_pragmas)
+        t0 = time.perf_counter()
+        migrate(engine)
+        migrate_ms = (time.perf_counter() - t0) * 1000
+    Session = sessionmaker(bind=engine)
+    rng = random.Random(args.seed + 1)
+    results = {"migrate_ms": round(migrate_ms, 1)} if tuned else {}
+    db = Session()
+
+    def history():
+        sid = rng.choice(session_ids)
+        db.query(ChatConversations).filter(ChatConversations.session_id == sid).order_by(
+            ChatConversations.created_at.desc()).limit(64).all()
+
+    def export():
+        sid = rng.choice(session_ids)
+        db.query(ChatConversations).filter(ChatConversations.session_id == sid).order_by(
+            ChatConversations.created_at).all()
+
+    def write_turn():
+        sid = rng.choice(session_ids)
+        db.add(ChatConversations(session_id=sid, user_message="benchmark question", assistant_response="benchmark answer"))
+        db.commit()
+
+    results["write_turn"] = timed(write_turn, args.writes)
+    results["history_64"] = timed(history, args.reads)
+    results["export_session"] = timed(export, args.reads)
+    results["stats_grouped"] = timed(lambda: db.execute(model_usage_query()).all(), 3)
+
+    sample = min(args.legacy_sample, len(session_ids))
+    legacy = timed(lambda: legacy_model_usage(db, sample), 1)
+    legacy["sessions_sampled"] = sample
+    legacy["extrapolated_ms"] = round(legacy["mean_ms"] * len(session_ids) / sample, 1)
+    results["stats_legacy_n_plus_1"] = legacy
+
+    db.close()
+    engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--sessions", type=int, default=20_000)
+    parser.add_argument("--reads", type=int, default=200, help="history/export queries per configuration")
+    parser.add_argument("--writes", type=int, default=200, help="single-turn commits per configuration")
+    parser.add_argument("--legacy-sample", type=int, default=200, help="sessions timed for the N+1 stats loop")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--workdir", default=None, help="keep the generated databases here")
+    parser.add_argument("--output", default=None, help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="privateprompt-dbbench-")
+    os.makedirs(workdir, exist_ok=True)
+    baseline_path = os.path.join(workdir, "baseline.db")
+    tuned_path = os.path.join(workdir, "tuned.db")
+    try:
+        t0 = time.perf_counter()
+        session_ids = build(baseline_path, args.messages, args.sessions, args.seed)
+        shutil.copyfile(baseline_path, tuned_path)
+        print(f"Built {args.messages} messages in {args.sessions} sessions in {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+
+        results = {
+            "messages": args.messages,
+            "sessions": args.sessions,
+            "baseline": run(baseline_path, False, session_ids, args),
+            "tuned": run(tuned_path, True, session_ids, args),
+        }
+        print(json.dumps(results, indent=2))
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
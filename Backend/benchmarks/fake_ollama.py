@@ -0,0 +1,344 @@
+"""
+Stand-in Ollama server for benchmarks and load tests.
+
+Implements the parts of the Ollama HTTP API the backend uses
+(``/api/chat``, ``/api/generate``, ``/api/embeddings``, ``/api/embed``,
+``/api/tags``, ``/api/ps``, ``/api/show``, ``/api/version``) with tunable
+timing, so backend overhead can be measured without a GPU or real models:
+
+* ``--load-ms``: paid by the first generation of a model (cold start)
+* ``--ttft-ms``: prompt evaluation, i.e. the wait before the first token
+* ``--tokens-per-second`` and ``--answer-tokens``: generation speed and length
+* ``--parallel``: generations running at once; the rest queue, like
+  ``OLLAMA_NUM_PARALLEL``
+* ``--jitter``: random +/- fraction applied to every delay
+
+Streaming requests get one NDJSON chunk per token. Answers carry the
+``eval_count``/``eval_duration`` style fields real Ollama reports. Like
+Ollama, a request without a prompt only loads the model, ``keep_alive``
+sets how long it stays loaded (5 minutes by default) and ``keep_alive: 0``
+unloads it.
+
+Run it on its own and point the backend at it:
+
+    python benchmarks/fake_ollama.py --port 11435 --tokens-per-second 40
+    OLLAMA_HOST=http://127.0.0.1:11435 uvicorn src.index:app
+
+or use ``serve_in_thread`` from another script (see ``load_bench.py``).
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+import socket
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+DEFAULT_MODELS = "llama3:latest,codellama:latest,nomic-embed-text:latest"
+WORDS = ("the", "model", "answer", "local", "private", "prompt", "data", "query", "token", "session",
+         "context", "vector", "stream", "chat", "result", "value", "server", "request", "fast", "simple")
+_DURATION_UNITS = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+# Reported for models loaded with a negative keep_alive
+_FOREVER = datetime(2318, 1, 1, tzinfo=timezone.utc)
+
+
+def _keep_alive(value) -> float:
+    """Seconds in a keep_alive (a number of seconds or a duration such as "30m"); negative keeps the model forever."""
+    if value is None:
+        return 300.0
+    try:
+        return float(value)
+    except ValueError:
+        seconds = sum(float(n) * _DURATION_UNITS[u] for n, u in re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value))
+        return -seconds if value.startswith("-") else seconds
+
+
+def _text(part: dict) -> str:
+    return part.get("response") or (part.get("message") or {}).get("content", "")
+
+
+class FakeOllama:
+    def __init__(self, models=DEFAULT_MODELS.split(","), load_ms=0.0, ttft_ms=50.0, tokens_per_second=50.0,
+                 answer_tokens=64, parallel=4, embed_ms=5.0, embedding_dim=768, context_length=8192,
+                 jitter=0.0, seed=7):
+        self.models = list(models)
+        self.load_ms = load_ms
+        self.ttft_ms = ttft_ms
+        self.tokens_per_second = tokens_per_second
+        self.answer_tokens = answer_tokens
+        self.embed_ms = embed_ms
+        self.embedding_dim = embedding_dim
+        self.context_length = context_length
+        self.jitter = jitter
+        self._rng = random.Random(seed)
+        self._parallel = asyncio.Semaphore(parallel)
+        # Loaded model -> when it gets unloaded
+        self._loaded = {}
+        self.calls = {}
+        self.app = Starlette(routes=[
+            Route("/api/chat", self.chat, methods=["POST"]),
+            Route("/api/generate", self.generate, methods=["POST"]),
+            Route("/api/embeddings", self.embeddings, methods=["POST"]),
+            Route("/api/embed", self.embed, methods=["POST"]),
+            Route("/api/tags", self.tags, methods=["GET"]),
+            Route("/api/ps", self.ps, methods=["GET"]),
+            Route("/api/show", self.show, methods=["POST"]),
+            Route("/api/version", self.version, methods=["GET"]),
+            Route("/fake/stats", self.stats, methods=["GET"]),
+        ])
+
+    # ----- timing ------------------------------------------------------------------
+
+    def _delay(self, ms: float) -> float:
+        if self.jitter:
+            ms *= 1 + self._rng.uniform(-self.jitter, self.jitter)
+        return max(0.0, ms / 1000)
+
+    def _count(self, route: str) -> None:
+        self.calls[route] = self.calls.get(route, 0) + 1
+
+    def _expire(self) -> None:
+        now = datetime.now(timezone.utc)
+        for model in [m for m, expires in self._loaded.items() if expires <= now]:
+            del self._loaded[model]
+
+    def _keep(self, model: str, keep_alive) -> None:
+        seconds = _keep_alive(keep_alive)
+        if seconds == 0:
+            self._loaded.pop(model, None)
+        else:
+            self._loaded[model] = _FOREVER if seconds < 0 else datetime.now(timezone.utc) + timedelta(seconds=seconds)
+
+    def _digest(self, model: str) -> str:
+        return hashlib.sha256(model.encode()).hexdigest()
+
+    def _answer(self, prompt: str, body: dict):
+        """Deterministic tokens for a prompt; JSON when the request asks for it."""
+        if body.get("format") == "json":
+            text = json.dumps({"prompt": " ".join(prompt.split()[:32]), "tables": []})
+            return [text[i:i + 4] for i in range(0, len(text), 4)]
+        rng = random.Random(hashlib.md5(prompt.encode()).digest())
+        tokens = (body.get("options") or {}).get("num_predict") or self.answer_tokens
+        return [rng.choice(WORDS) + " " for _ in range(max(1, tokens))]
+
+    async def _generation(self, model: str, prompt: str, body: dict, chunk):
+        """Yield response chunks for one generation, sleeping like a model would."""
+        started = time.perf_counter()
+        async with self._parallel:
+            load = await self._load(model)
+            self._keep(model, body.get("keep_alive"))
+            prompt_eval = self._delay(self.ttft_ms)
+            await asyncio.sleep(prompt_eval)
+            tokens = self._answer(prompt, body)
+            per_token = self._delay(1000 / self.tokens_per_second) if self.tokens_per_second > 0 else 0.0
+            eval_started = time.perf_counter()
+            for token in tokens:
+                if per_token:
+                    await asyncio.sleep(per_token)
+                yield chunk(token, False)
+            eval_duration = time.perf_counter() - eval_started
+        final = chunk("", True)
+        final.update(
+            done_reason="stop",
+            total_duration=int((time.perf_counter() - started) * 1e9),
+            load_duration=int(load * 1e9),
+            prompt_eval_count=max(1, len(prompt) // 4),
+            prompt_eval_duration=int(prompt_eval * 1e9),
+            eval_count=len(tokens),
+            eval_duration=max(1, int(eval_duration * 1e9)),
+        )
+        yield final
+
+    async def _load(self, model: str) -> float:
+        self._expire()
+        if model in self._loaded:
+            return 0.0
+        load = self._delay(self.load_ms)
+        await asyncio.sleep(load)
+        return load
+
+    async def _load_only(self, model: str, body: dict, chunk) -> dict:
+        """A request without a prompt: load the model, or unload it with keep_alive 0."""
+        started = time.perf_counter()
+        if _keep_alive(body.get("keep_alive")) == 0:
+            self._loaded.pop(model, None)
+            reason, load = "unload", 0.0
+        else:
+            reason, load = "load", await self._load(model)
+            self._keep(model, body.get("keep_alive"))
+        final = chunk("", True)
+        final.update(done_reason=reason, total_duration=int((time.perf_counter() - started) * 1e9),
+                     load_duration=int(load * 1e9))
+        return final
+
+    async def _respond(self, request: Request, route: str, prompt_of, chunk_of):
+        self._count(route)
+        body = await request.json()
+        model = body.get("model", "")
+        if model not in self.models:
+            return JSONResponse({"error": f"model '{model}' not found"}, status_code=404)
+        created_at = datetime.now(timezone.utc).isoformat()
+
+        def chunk(token, done):
+            return {"model": model, "created_at": created_at, **chunk_of(token), "done": done}
+
+        if not body.get("prompt") and not body.get("messages"):
+            return JSONResponse(await self._load_only(model, body, chunk))
+        generation = self._generation(model, prompt_of(body), body, chunk)
+        if body.get("stream", True):
+            async def lines():
+                async for part in generation:
+                    yield json.dumps(part) + "\n"
+            return StreamingResponse(lines(), media_type="application/x-ndjson")
+        text = ""
+        async for part in generation:
+            text += _text(part)
+        part.update(chunk_of(text))
+        return JSONResponse(part)
+
+    # ----- routes ------------------------------------------------------------------
+
+    async def chat(self, request: Request):
+        return await self._respond(
+            request, "chat",
+            lambda body: "\n".join(m.get("content", "") for m in body.get("messages", [])),
+            lambda token: {"message": {"role": "assistant", "content": token}}
+        )
+
+    async def generate(self, request: Request):
+        return await self._respond(
+            request, "generate",
+            lambda body: f"{body.get('system', '')}\n{body.get('prompt', '')}",
+            lambda token: {"response": token}
+        )
+
+    def _vector(self, text: str) -> list:
+        seed = int.from_bytes(hashlib.md5(text.encode()).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.embedding_dim)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    async def embeddings(self, request: Request):
+        self._count("embeddings")
+        body = await request.json()
+        await asyncio.sleep(self._delay(self.embed_ms))
+        return JSONResponse({"embedding": self._vector(body.get("prompt", ""))})
+
+    async def embed(self, request: Request):
+        self._count("embed")
+        body = await request.json()
+        texts = body.get("input", "")
+        texts = [texts] if isinstance(texts, str) else texts
+        await asyncio.sleep(self._delay(self.embed_ms))
+        return JSONResponse({"model": body.get("model"), "embeddings": [self._vector(t) for t in texts]})
+
+    def _model(self, name: str) -> dict:
+        family = name.split(":")[0]
+        return {
+            "name": name,
+            "model": name,
+            "modified_at": "2024-01-01T00:00:00Z",
+            "size": 4_000_000_000,
+            "digest": self._digest(name),
+            "details": {"format": "gguf", "family": family, "parameter_size": "8B", "quantization_level": "Q4_0"},
+        }
+
+    async def tags(self, request: Request):
+        self._count("tags")
+        return JSONResponse({"models": [self._model(name) for name in self.models]})
+
+    async def ps(self, request: Request):
+        self._count("ps")
+        self._expire()
+        return JSONResponse({"models": [
+            {**self._model(name), "size_vram": 4_000_000_000, "expires_at": expires.isoformat()}
+            for name, expires in self._loaded.items()
+        ]})
+
+    async def show(self, request: Request):
+        self._count("show")
+        body = await request.json()
+        name = body.get("model") or body.get("name", "")
+        if name not in self.models:
+            return JSONResponse({"error": f"model '{name}' not found"}, status_code=404)
+        family = name.split(":")[0]
+        return JSONResponse({
+            "details": self._model(name)["details"],
+            "model_info": {"general.architecture": family, f"{family}.context_length": self.context_length},
+            "template": "{{ .Prompt }}",
+        })
+
+    async def version(self, request: Request):
+        return JSONResponse({"version": "0.0.0-fake"})
+
+    async def stats(self, request: Request):
+        return JSONResponse({"calls": self.calls, "loaded": sorted(self._loaded)})
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def serve_in_thread(app, port: int, host: str = "127.0.0.1") -> uvicorn.Server:
+    """Run an ASGI app with uvicorn on a daemon thread; set ``server.should_exit`` to stop it."""
+    server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name=f"uvicorn-{port}", daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError(f"Server on port {port} failed to start")
+        time.sleep(0.01)
+    server.thread = thread
+    return server
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--models", default=DEFAULT_MODELS, help="comma-separated installed models")
+    parser.add_argument("--load-ms", type=float, default=0.0, help="cold start of a model's first generation")
+    parser.add_argument("--ttft-ms", type=float, default=50.0, help="prompt evaluation before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="0 answers at once")
+    parser.add_argument("--answer-tokens", type=int, default=64)
+    parser.add_argument("--parallel", type=int, default=4, help="generations at once; the rest queue")
+    parser.add_argument("--embed-ms", type=float, default=5.0)
+    parser.add_argument("--embedding-dim", type=int, default=768)
+    parser.add_argument("--context-length", type=int, default=8192)
+    parser.add_argument("--jitter", type=float, default=0.0, help="random +/- fraction applied to every delay")
+
+
+def from_arguments(args: argparse.Namespace) -> FakeOllama:
+    return FakeOllama(
+        models=[m.strip() for m in args.models.split(",") if m.strip()],
+        load_ms=args.load_ms,
+        ttft_ms=args.ttft_ms,
+        tokens_per_second=args.tokens_per_second,
+        answer_tokens=args.answer_tokens,
+        parallel=args.parallel,
+        embed_ms=args.embed_ms,
+        embedding_dim=args.embedding_dim,
+        context_length=args.context_length,
+        jitter=args.jitter,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    add_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(from_arguments(args).app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""
+Load test of the backend API against the stand-in Ollama server.
+
+Starts ``fake_ollama`` and the FastAPI app (each on its own uvicorn thread,
+with a throwaway data directory), seeds ``--sessions`` chats of
+``--turns`` turns through ``/chat/import`` and then drives each scenario
+with ``--concurrency`` clients until ``--requests`` requests are done:
+
+* ``chat``: POST /chat/{model}/{session_id}, whole answer
+* ``chat_stream``: the same streamed, also reporting time to the first byte
+* ``history``: GET /chat/chat_history/{session_id}, latest 50 turns
+* ``stats``: GET /chat/sessions/stats
+* ``export``: GET /chat/export/{session_id}
+* ``transcribe``: POST /chat/transcribe with a generated WAV recording
+  (skipped when speech recognition is unavailable)
+
+Every scenario reports throughput and p50/p95/p99 latency, plus the mean
+per request stage taken from ``/metrics``, which shows where time went
+when a figure moves.
+
+Run from the Backend folder:
+
+    python benchmarks/load_bench.py --concurrency 8 --requests 200 --output load.json
+
+The load generator shares the process (and the GIL) with the app. For
+cleaner numbers start ``fake_ollama.py`` and the backend separately and
+pass ``--url``; the backend then has to be pointed at the fake itself.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import json
+import logging
+import math
+import os
+import random
+import re
+import shutil
+import struct
+import sys
+import tempfile
+import time
+import wave
+from collections import Counter
+from uuid import uuid4
+
+import httpx
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks import fake_ollama  # noqa: E402
+from benchmarks.common import report, summarize  # noqa: E402
+
+SCENARIOS = ("chat", "chat_stream", "history", "stats", "export", "transcribe")
+_STAGE = re.compile(r'_stage_duration_seconds_(sum|count)\{stage="([^"]+)"\} (\S+)')
+
+
+class Skip(Exception):
+    pass
+
+
+class Context:
+    def __init__(self, args, sessions):
+        self.args = args
+        self.sessions = sessions
+        self.rng = random.Random(args.seed)
+        self.audio = _wav(args.audio_seconds)
+
+
+def _wav(seconds: float, rate: int = 16000) -> bytes:
+    """A mono 16-bit recording of a 440 Hz tone."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        frames = int(seconds * rate)
+        f.writeframes(b"".join(struct.pack("<h", int(8000 * math.sin(2 * math.pi * 440 * i / rate)))
+                               for i in range(frames)))
+    return buffer.getvalue()
+
+
+def _seed_records(sessions, turns, model, rng):
+    yield {"type": "export", "format": "privateprompt-chats", "version": 1}
+    for number, session_id in enumerate(sessions):
+        yield {"type": "session", "session_id": session_id, "title": f"Benchmark chat {number}", "model": model}
+        for turn in range(turns):
+            topic = rng.choice(fake_ollama.WORDS)
+            yield {
+                "type": "turn",
+                "session_id": session_id,
+                "user_message": f"Question {turn} about the {topic} in chat {number}?",
+                "assistant_response": " ".join(rng.choice(fake_ollama.WORDS) for _ in range(rng.randint(20, 120))),
+            }
+
+
+async def seed(client: httpx.AsyncClient, args) -> list:
+    sessions = [str(uuid4()) for _ in range(args.sessions)]
+    body = "".join(json.dumps(r) + "\n" for r in _seed_records(sessions, args.turns, args.model, random.Random(args.seed)))
+    started = time.perf_counter()
+    response = await client.post("/chat/import", params={"reindex": str(args.reindex).lower()}, content=body,
+                                 headers={"Content-Type": "application/x-ndjson"}, timeout=None)
+    response.raise_for_status()
+    if args.reindex:
+        # Wait until the turns are searchable, so chat retrieval sees them
+        await client.post("/chat/rag/flush", timeout=None)
+    print(f"Seeded {args.sessions} sessions x {args.turns} turns in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    return sessions
+
+
+# ----- scenarios ---------------------------------------------------------------------
+
+async def chat(client, ctx, i):
+    session_id = ctx.rng.choice(ctx.sessions)
+    response = await client.post(f"/chat/{ctx.args.model}/{session_id}",
+                                 params={"q": f"Benchmark question {i}: what about the {ctx.rng.choice(fake_ollama.WORDS)}?",
+                                         "stream": "false"})
+    return response.status_code, None
+
+
+async def chat_stream(client, ctx, i):
+    session_id = ctx.rng.choice(ctx.sessions)
+    started = time.perf_counter()
+    first_byte = None
+    async with client.stream("POST", f"/chat/{ctx.args.model}/{session_id}",
+                             params={"q": f"Streamed question {i} about the {ctx.rng.choice(fake_ollama.WORDS)}?",
+                                     "stream": "true"}) as response:
+        async for chunk in response.aiter_bytes():
+            if chunk and first_byte is None:
+                first_byte = (time.perf_counter() - started) * 1000
+    return response.status_code, first_byte
+
+
+async def history(client, ctx, i):
+    response = await client.get(f"/chat/chat_history/{ctx.rng.choice(ctx.sessions)}", params={"limit": 50, "order": "desc"})
+    return response.status_code, None
+
+
+async def stats(client, ctx, i):
+    response = await client.get("/chat/sessions/stats")
+    return response.status_code, None
+
+
+async def export(client, ctx, i):
+    response = await client.get(f"/chat/export/{ctx.rng.choice(ctx.sessions)}")
+    return response.status_code, None
+
+
+async def transcribe(client, ctx, i):
+    response = await client.post("/chat/transcribe", files={"file": ("bench.wav", ctx.audio, "audio/wav")})
+    if i == 0 and response.status_code in (400, 503):
+        raise Skip(response.text)
+    return response.status_code, None
+
+
+# ----- runner ------------------------------------------------------------------------
+
+async def _stage_totals(client):
+    """Per-stage (seconds, count) from /metrics; empty when metrics are off."""
+    try:
+        response = await client.get("/metrics")
+    except httpx.HTTPError:
+        return {}
+    totals = {}
+    if response.status_code == 200:
+        for kind, stage, value in _STAGE.findall(response.text):
+            totals.setdefault(stage, [0.0, 0])[0 if kind == "sum" else 1] = float(value)
+    return totals
+
+
+async def run_scenario(client, name, ctx):
+    fn = globals()[name]
+    args = ctx.args
+    try:
+        for i in range(max(1, args.warmup)):
+            await fn(client, ctx, i)
+    except Skip as e:
+        print(f"{name}: skipped ({e})", file=sys.stderr)
+        return {"skipped": str(e)[:200]}
+
+    before = await _stage_totals(client)
+    latencies, first_bytes, statuses = [], [], Counter()
+    numbers = itertools.count()
+
+    async def worker():
+        while (i := next(numbers)) < args.requests:
+            started = time.perf_counter()
+            try:
+                status, first_byte = await fn(client, ctx, i + args.warmup)
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+                continue
+            statuses[str(status)] += 1
+            if status < 400:
+                latencies.append((time.perf_counter() - started) * 1000)
+                if first_byte is not None:
+                    first_bytes.append(first_byte)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    wall = time.perf_counter() - started
+    after = await _stage_totals(client)
+
+    result = {
+        **summarize(latencies),
+        "errors": args.requests - len(latencies),
+        "statuses": dict(statuses),
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else 0.0,
+    }
+    if first_bytes:
+        result["first_byte"] = summarize(first_bytes)
+    stages = {}
+    for stage, (total, count) in after.items():
+        old_total, old_count = before.get(stage, (0.0, 0))
+        if count > old_count:
+            stages[stage] = {"n": int(count - old_count), "mean_ms": round((total - old_total) / (count - old_count) * 1000, 3)}
+    if stages:
+        result["stages"] = stages
+    print(f"{name}: p50 {result.get('p50_ms')} ms, p99 {result.get('p99_ms')} ms, "
+          f"{result['throughput_rps']} req/s, {result['errors']} errors", file=sys.stderr)
+    return result
+
+
+async def drive(url, args):
+    limits = httpx.Limits(max_connections=args.concurrency + 2, max_keepalive_connections=args.concurrency + 2)
+    async with httpx.AsyncClient(base_url=url, timeout=args.timeout, limits=limits) as client:
+        sessions = await seed(client, args)
+        ctx = Context(args, sessions)
+        return {name: await run_scenario(client, name, ctx) for name in args.scenarios}
+
+
+def _start_backend(args, workdir):
+    """Point the app at the fake Ollama and a fresh data directory, then serve it."""
+    ollama_url = args.ollama_url
+    fake = None
+    if not ollama_url:
+        fake = fake_ollama.serve_in_thread(fake_ollama.from_arguments(args).app, fake_ollama.free_port())
+        ollama_url = f"http://127.0.0.1:{fake.config.port}"
+    os.environ.update({
+        "OLLAMA_HOST": ollama_url,
+        "PRIVATEPROMPT_DATA_DIR": os.path.join(workdir, "data"),
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'chat_data.db')}",
+        "VECTOR_STORE_PATH": os.path.join(workdir, "vector_db"),
+        "MODEL_CATALOG_OFFLINE": "1",
+    })
+    from src.index import app
+    backend = fake_ollama.serve_in_thread(app, fake_ollama.free_port())
+    return backend, fake
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=None, help="benchmark an already running backend instead")
+    parser.add_argument("--ollama-url", default=None, help="use this Ollama instead of starting the fake one")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated, from: " + ", ".join(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=5, help="unmeasured requests per scenario")
+    parser.add_argument("--sessions", type=int, default=20, help="chats seeded before the run")
+    parser.add_argument("--turns", type=int, default=20, help="turns per seeded chat")
+    parser.add_argument("--no-reindex", dest="reindex", action="store_false", help="don't embed the seeded turns for RAG")
+    parser.add_argument("--model", default="llama3:latest")
+    parser.add_argument("--audio-seconds", type=float, default=3.0)
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--workdir", default=None, help="keep the backend's data here")
+    parser.add_argument("--output", default=None, help="write the results as JSON to this file")
+    fake_ollama.add_arguments(parser)
+    args = parser.parse_args()
+    args.scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="privateprompt-loadbench-")
+    servers = []
+    # Only warnings from the client, not a line per request
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    # The app prints progress, also while shutting down; keep stdout for the JSON report
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            url = args.url
+            if not url:
+                backend, fake = _start_backend(args, workdir)
+                servers = [s for s in (backend, fake) if s is not None]
+                url = f"http://127.0.0.1:{backend.config.port}"
+            results = asyncio.run(drive(url, args))
+        finally:
+            for server in servers:
+                server.should_exit = True
+                server.thread.join(timeout=30)
+            if not args.workdir:
+                shutil.rmtree(workdir, ignore_errors=True)
+    report("load", {k: v for k, v in vars(args).items() if k not in ("output", "workdir")}, results, args.output)
+
+if __name__ == "__main__":
+    main()
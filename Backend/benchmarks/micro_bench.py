@@ -0,0 +1,193 @@
+"""
+Per-component microbenchmarks, run in-process against a throwaway data
+directory:
+
+* ``rag``: ``RAGEngine.add_to_store`` one document at a time, ``add_many``
+  in batches, and ``retrieve`` across all sessions and within one session,
+  for new queries and repeated (embedding-cached) ones
+* ``db``: ``save_conversation``, ``get_chat_history`` (latest 50 turns),
+  ``get_model_usage`` and ``search_conversations`` on ``--messages`` turns
+* ``parse``: ``extract_json_from_text`` on fenced, bare, missing and
+  large (``--large-kb``) model answers
+
+Each figure is the latency of one call. Run from the Backend folder:
+
+    python benchmarks/micro_bench.py --output micro.json
+    python benchmarks/compare.py micro-before.json micro.json
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from uuid import uuid4
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.common import report, summarize  # noqa: E402
+from benchmarks.fake_ollama import WORDS  # noqa: E402
+
+SUITES = ("rag", "db", "parse")
+MODELS = ["llama3:latest", "mistral:latest", "codellama:latest"]
+
+
+def timed(fn, repeat):
+    samples = []
+    for i in range(repeat):
+        started = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - started) * 1000)
+    return summarize(samples, digits=4)
+
+
+async def timed_async(fn, repeat):
+    samples = []
+    for i in range(repeat):
+        started = time.perf_counter()
+        await fn(i)
+        samples.append((time.perf_counter() - started) * 1000)
+    return summarize(samples, digits=4)
+
+
+def _sentence(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def bench_rag(args, workdir):
+    from src.utils.rag_instance import RAGEngine
+
+    rng = random.Random(args.seed)
+    engine = RAGEngine(db_path=os.path.join(workdir, "rag_bench"))
+    if not engine.load():
+        raise RuntimeError("RAG engine failed to initialize (see the log above)")
+    sessions = [str(uuid4()) for _ in range(10)]
+    results = {}
+    results["add_to_store"] = timed(
+        lambda i: engine.add_to_store(f"{i} {_sentence(rng, rng.randint(20, 80))}",
+                                      {"type": "user_message", "session_id": rng.choice(sessions)}),
+        args.documents
+    )
+    batch = 64
+    results["add_many_64"] = timed(
+        lambda i: engine.add_many([f"batch {i} {j} {_sentence(rng, rng.randint(20, 80))}" for j in range(batch)],
+                                  [{"type": "user_message", "session_id": rng.choice(sessions)} for _ in range(batch)]),
+        max(1, args.documents // batch)
+    )
+    results["retrieve_global"] = timed(lambda i: engine.retrieve(f"question {i} {_sentence(rng, 8)}", k=5), args.queries)
+    results["retrieve_session"] = timed(
+        lambda i: engine.retrieve(f"session question {i} {_sentence(rng, 8)}", k=5, session_id=rng.choice(sessions)),
+        args.queries
+    )
+    results["retrieve_repeated_query"] = timed(lambda i: engine.retrieve("what is the private model context", k=5), args.queries)
+    engine.flush(10)
+    return results
+
+
+async def bench_db(args):
+    from sqlalchemy import insert
+
+    from src.database.db import AsyncSessionLocal, async_engine, migrate
+    from src.models.chat_models import ChatConversations, ChatSession
+    from src.utils.chat_helper import get_chat_history, get_model_usage, save_conversation
+    from src.utils.chat_search import search_conversations
+
+    rng = random.Random(args.seed)
+    migrate()
+    sessions = [str(uuid4()) for _ in range(max(1, args.messages // 50))]
+    results = {}
+    try:
+        async with AsyncSessionLocal() as db:
+            await db.execute(insert(ChatSession), [{"id": sid, "title": f"Chat {n}", "model": rng.choice(MODELS)}
+                                                   for n, sid in enumerate(sessions)])
+            await db.execute(insert(ChatConversations), [
+                {"id": str(uuid4()), "session_id": rng.choice(sessions), "user_message": f"question {n} {_sentence(rng, 12)}",
+                 "assistant_response": _sentence(rng, rng.randint(20, 120))}
+                for n in range(args.messages)
+            ])
+            await db.commit()
+
+        results["save_conversation"] = await timed_async(
+            lambda i: save_conversation(rng.choice(sessions), f"benchmark question {i}", _sentence(rng, 40)), args.writes
+        )
+        results["get_chat_history_50"] = await timed_async(
+            lambda i: get_chat_history(rng.choice(sessions), limit=50, descending=True), args.reads
+        )
+        async with AsyncSessionLocal() as db:
+            results["get_model_usage"] = await timed_async(lambda i: get_model_usage(db), max(1, args.reads // 10))
+            results["search_conversations"] = await timed_async(
+                lambda i: search_conversations(db, f"{rng.choice(WORDS)} {rng.choice(WORDS)}"), args.reads
+            )
+    finally:
+        # aiosqlite connections run on their own threads, which would keep the process alive
+        await async_engine.dispose()
+    return results
+
+
+def bench_parse(args):
+    from src.utils.PromptGenerator import extract_json_from_text
+
+    payload = {"prompt": "List the ten most recent orders with their customers", "tables": ["orders", "customers"]}
+    prose = "The schema has orders and customers. " * (args.large_kb * 1024 // 38)
+    cases = {
+        "fenced": f"Here is the prompt:\n```json\n{json.dumps(payload)}\n```\nLet me know if you need more.",
+        "bare": f"Sure! {json.dumps(payload)} Hope that helps.",
+        "missing": "I could not produce a prompt for this schema, sorry.",
+        "large": f"{prose}\n```json\n{json.dumps(payload)}\n```",
+    }
+    return {f"extract_json_{name}": timed(lambda i, text=text: extract_json_from_text(text), args.iterations)
+            for name, text in cases.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--suites", default=",".join(SUITES), help="comma-separated, from: " + ", ".join(SUITES))
+    parser.add_argument("--documents", type=int, default=300, help="documents added to the RAG store")
+    parser.add_argument("--queries", type=int, default=200, help="retrieve calls per variant")
+    parser.add_argument("--messages", type=int, default=20_000, help="chat turns in the benchmark database")
+    parser.add_argument("--reads", type=int, default=200)
+    parser.add_argument("--writes", type=int, default=200)
+    parser.add_argument("--iterations", type=int, default=2000, help="calls per parsing case")
+    parser.add_argument("--large-kb", type=int, default=256, help="size of the large parsing case")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--workdir", default=None, help="keep the generated data here")
+    parser.add_argument("--output", default=None, help="write the results as JSON to this file")
+    args = parser.parse_args()
+    suites = [s.strip() for s in args.suites.split(",") if s.strip()]
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        parser.error(f"unknown suites: {', '.join(sorted(unknown))}")
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="privateprompt-microbench-")
+    # Before the first src import, which reads the configuration
+    os.environ.update({
+        "PRIVATEPROMPT_DATA_DIR": os.path.join(workdir, "data"),
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'chat_data.db')}",
+        "VECTOR_STORE_PATH": os.path.join(workdir, "vector_db"),
+    })
+    os.makedirs(os.environ["PRIVATEPROMPT_DATA_DIR"], exist_ok=True)
+    results = {}
+    try:
+        # The helpers print progress; keep stdout for the JSON report
+        with contextlib.redirect_stdout(sys.stderr):
+            for suite in suites:
+                started = time.perf_counter()
+                if suite == "rag":
+                    results["rag"] = bench_rag(args, workdir)
+                elif suite == "db":
+                    results["db"] = asyncio.run(bench_db(args))
+                else:
+                    results["parse"] = bench_parse(args)
+                print(f"{suite}: done in {time.perf_counter() - started:.1f}s")
+        report("micro", {k: v for k, v in vars(args).items() if k not in ("output", "workdir")}, results, args.output)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
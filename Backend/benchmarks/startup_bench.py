@@ -0,0 +1,168 @@
+"""
+Startup benchmark and import-time profile of the backend.
+
+Each run starts a fresh interpreter, so nothing is cached in-process:
+
+* ``import``: ``python -X importtime -c "import src.index"``, reporting
+  the total import time, peak RSS after the import and the slowest
+  modules by cumulative and self time (the profile to read when the
+  import figure regresses)
+* ``serve`` (with ``--serve``): uvicorn serving the app, timing the
+  first answered request and the moment ``GET /ready`` turns 200, i.e.
+  when background warm-ups (embedding model, Vosk) are done
+
+Run from the Backend folder:
+
+    python benchmarks/startup_bench.py --runs 5 --serve --output startup.json
+    python benchmarks/compare.py startup-before.json startup.json
+"""
+import argparse
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.common import BACKEND_DIR, report  # noqa: E402
+from benchmarks.fake_ollama import free_port  # noqa: E402
+
+_IMPORT_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+# Prints the peak RSS in KiB (Linux) after importing the app
+_RSS_PROBE = "import resource, src.index; print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)"
+
+
+def _env(workdir):
+    """Throwaway data locations, so profiling never touches the real database or vector store."""
+    return {
+        **os.environ,
+        "PRIVATEPROMPT_DATA_DIR": os.path.join(workdir, "data"),
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'chat_data.db')}",
+        "VECTOR_STORE_PATH": os.path.join(workdir, "vector_db"),
+        "MODEL_CATALOG_OFFLINE": "1",
+    }
+
+
+def profile_import(env):
+    """One ``-X importtime`` run: (total ms, {module: (self ms, cumulative ms)})."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import src.index"],
+                            cwd=BACKEND_DIR, env=env, capture_output=True, text=True)
+    if result.returncode:
+        raise RuntimeError(f"Importing the app failed:\n{result.stderr[-2000:]}")
+    modules = {}
+    total = 0.0
+    for line in result.stderr.splitlines():
+        match = _IMPORT_LINE.match(line)
+        if not match:
+            continue
+        own, cumulative, indent, name = match.groups()
+        modules[name] = (int(own) / 1000, int(cumulative) / 1000)
+        if not indent:
+            # Top-level imports, in the order the interpreter made them
+            total += int(cumulative) / 1000
+    return total, modules
+
+
+def peak_rss_mb(env):
+    result = subprocess.run([sys.executable, "-c", _RSS_PROBE], cwd=BACKEND_DIR, env=env, capture_output=True, text=True)
+    if result.returncode:
+        return None
+    return round(int(result.stdout.strip().splitlines()[-1]) / 1024, 1)
+
+
+def time_serve(env, timeout):
+    """Start uvicorn; ms until the first answered request and until /ready is 200."""
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "src.index:app", "--port", str(port), "--log-level", "warning"],
+                              cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    first_response = ready = None
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=5) as client:
+            while time.perf_counter() - started < timeout and server.poll() is None:
+                try:
+                    if first_response is None:
+                        client.get("/")
+                        first_response = (time.perf_counter() - started) * 1000
+                    if client.get("/ready").status_code == 200:
+                        ready = (time.perf_counter() - started) * 1000
+                        break
+                except httpx.TransportError:
+                    pass
+                time.sleep(0.02)
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+    return first_response, ready
+
+
+def _median(values):
+    values = [v for v in values if v is not None]
+    return round(statistics.median(values), 1) if values else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per measurement")
+    parser.add_argument("--top", type=int, default=15, help="slowest modules listed in the profile")
+    parser.add_argument("--serve", action="store_true", help="also time serving the first request and readiness")
+    parser.add_argument("--serve-timeout", type=float, default=300.0)
+    parser.add_argument("--workdir", default=None, help="keep the generated data here")
+    parser.add_argument("--output", default=None, help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="privateprompt-startupbench-")
+    env = _env(workdir)
+    try:
+        totals, profiles = [], []
+        for _ in range(args.runs):
+            total, modules = profile_import(env)
+            totals.append(total)
+            profiles.append(modules)
+        # Per-module medians across runs smooth out disk cache effects
+        names = set.intersection(*(set(p) for p in profiles))
+        median = {name: (statistics.median(p[name][0] for p in profiles), statistics.median(p[name][1] for p in profiles))
+                  for name in names}
+        app_ms = median.get("src.index", (0, 0))[1]
+        results = {
+            "import": {
+                "total_ms": _median(totals),
+                "app_ms": round(app_ms, 1),
+                "peak_rss_mb": peak_rss_mb(env),
+                "modules": len(median),
+                "slowest_cumulative": [
+                    {"module": name, "cumulative": round(c, 1), "self": round(s, 1)}
+                    for name, (s, c) in sorted(median.items(), key=lambda item: -item[1][1])[:args.top]
+                ],
+                "slowest_self": [
+                    {"module": name, "self": round(s, 1)}
+                    for name, (s, c) in sorted(median.items(), key=lambda item: -item[1][0])[:args.top]
+                ],
+            }
+        }
+        if args.serve:
+            firsts, readies = [], []
+            for _ in range(args.runs):
+                first, ready = time_serve(env, args.serve_timeout)
+                firsts.append(first)
+                readies.append(ready)
+            results["serve"] = {"first_response_ms": _median(firsts), "ready_ms": _median(readies),
+                                "never_ready": sum(r is None for r in readies)}
+        print(f"Import {results['import']['total_ms']} ms, peak RSS {results['import']['peak_rss_mb']} MB", file=sys.stderr)
+        report("startup", {k: v for k, v in vars(args).items() if k not in ("output", "workdir")}, results, args.output)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,89 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
 
+from .. import config
+
 # Absolute path to database file inside database/ folder
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.path.join(BASE_DIR, "..", "database", "chat_data.db")
-DB_URI = f"sqlite:///{os.path.abspath(DB_PATH)}"
-engine = create_engine(DB_URI, echo=False, connect_args={"check_same_thread": False})
+DB_URI = config.DATABASE_URL or f"sqlite:///{os.path.abspath(DB_PATH)}"
+
+# Async driver used for each backend by the request path
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+
+
+def async_url(url: str) -> str:
+    """Swap the driver of a sync database URL for its asyncio counterpart."""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for database backend '{backend}'")
+    return parsed.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}").render_as_string(hide_password=False)
+
+
+IS_SQLITE = make_url(DB_URI).get_backend_name() == "sqlite"
+_sqlite_connect_args = {"check_same_thread": False, "timeout": config.DB_BUSY_TIMEOUT_MS / 1000} if IS_SQLITE else {}
+
+# Sync engine: startup migrations, scripts and benchmarks
+engine = create_engine(
+    DB_URI,
+    echo=False,
+    connect_args=_sqlite_connect_args,
+    pool_size=config.DB_POOL_SIZE,
+    max_overflow=config.DB_MAX_OVERFLOW,
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Async engine: everything on the request path
+async_engine = create_async_engine(
+    async_url(DB_URI),
+    echo=False,
+    connect_args=_sqlite_connect_args,
+    pool_size=config.DB_POOL_SIZE,
+    max_overflow=config.DB_MAX_OVERFLOW,
+)
+# Rows stay usable after commit; request code never relies on lazy refreshes
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    """WAL lets readers run alongside the writer; the rest trades a little durability and memory for speed."""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA synchronous={config.DB_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA mmap_size={config.DB_MMAP_BYTES}")
+    cursor.execute(f"PRAGMA cache_size=-{config.DB_CACHE_KIB}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute(f"PRAGMA busy_timeout={config.DB_BUSY_TIMEOUT_MS}")
+    cursor.close()
+
+
+if IS_SQLITE:
+    event.listen(engine, "connect", _sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", _sqlite_pragmas)
+
+
+def migrate(bind=engine):
+    """
+    Bring an existing chat_data.db up to the current schema.
+
+    ``create_all`` only creates missing tables, so indexes added to tables
+    that already exist are created here, as is the full-text search index.
+    Safe to run on every startup.
+    """
+    Base.metadata.create_all(bind=bind)
+    with bind.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+        if connection.dialect.name == "sqlite":
+            from .fts import ensure_chat_fts
+            ensure_chat_fts(connection)
+            # Refresh planner statistics where they are missing or stale (cheap when nothing changed)
+            connection.exec_driver_sql("PRAGMA optimize")
@@ -0,0 +1,52 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Full-text index over chat turns (SQLite FTS5, external content).
+#
+# The index stores only tokens; text is read back from chat_convs by rowid.
+# Triggers keep it in step with every insert, edit and delete inside the
+# same transaction, whichever code path writes the row.
+# VACUUM may renumber chat_convs rowids; run rebuild_chat_fts() afterwards.
+FTS_TABLE = "chat_convs_fts"
+
+_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        user_message, assistant_response,
+        content='chat_convs', content_rowid='rowid',
+        tokenize='porter unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS chat_convs_fts_insert AFTER INSERT ON chat_convs BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, user_message, assistant_response)
+        VALUES (new.rowid, new.user_message, new.assistant_response);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS chat_convs_fts_delete AFTER DELETE ON chat_convs BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, user_message, assistant_response)
+        VALUES ('delete', old.rowid, old.user_message, old.assistant_response);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS chat_convs_fts_update AFTER UPDATE OF user_message, assistant_response ON chat_convs BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, user_message, assistant_response)
+        VALUES ('delete', old.rowid, old.user_message, old.assistant_response);
+        INSERT INTO {FTS_TABLE}(rowid, user_message, assistant_response)
+        VALUES (new.rowid, new.user_message, new.assistant_response);
+    END""",
+]
+
+
+def rebuild_chat_fts(connection) -> None:
+    """Re-index every turn from chat_convs."""
+    connection.exec_driver_sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def ensure_chat_fts(connection) -> None:
+    """
+    Create the index and its triggers if missing, and (re)build it when it
+    does not cover every stored turn, e.g. on databases from older versions.
+    """
+    for statement in _DDL:
+        connection.exec_driver_sql(statement)
+    indexed = connection.exec_driver_sql(f"SELECT COUNT(*) FROM {FTS_TABLE}_docsize").scalar()
+    stored = connection.exec_driver_sql("SELECT COUNT(*) FROM chat_convs").scalar()
+    if indexed != stored:
+        logger.info(f"Building chat search index ({stored} turns, {indexed} indexed)")
+        rebuild_chat_fts(connection)
@@ -1,17 +1,54 @@
+import time
+_import_started = time.perf_counter()
+
 from fastapi import FastAPI
 from .routes import chat, model_ops, system
-from .database.db import engine
-from .models.chat_models import Base
-from .database.db import engine
+from .database.db import async_engine, migrate
+from .models import chat_models  # noqa: F401 (registers the tables)
+from .utils.ollama_client import ollama
+from .utils.rag_instance import rag
+from .utils.speech import speech_engine
+from .utils.model_catalog import model_catalog
+from .utils.model_registry import model_registry
+from .utils.model_lifecycle import model_lifecycle
+from .utils.document_ingest import shutdown_pool
+from .utils.metrics import MetricsMiddleware
+from .utils.startup import startup
+from . import config
+from starlette.concurrency import run_in_threadpool
 from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 import os
 
+# Heavy libraries (torch, sentence-transformers, Vosk, PyPDF2) are imported on first use, not here
+startup.timings["import_seconds"] = round(time.perf_counter() - _import_started, 3)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    Base.metadata.create_all(bind=engine)
+    # Creates missing tables and indexes, also on databases from older versions
+    with startup.step("migrate"):
+        await run_in_threadpool(migrate)
+    startup.database = "ready"
+    # Models load in the background; GET /ready reports when they are warm
+    if config.RAG_PRELOAD:
+        rag.warm_up()
+    if config.STT_PRELOAD:
+        speech_engine.warm_up()
+    model_catalog.warm_up()
+    model_registry.start()
+    # Preloads MODEL_PRELOAD, then keeps used models loaded and unloads idle ones over budget
+    model_lifecycle.start()
+    print(f"[Startup] App imported in {startup.timings['import_seconds']}s, "
+          f"database migrated in {startup.timings['migrate_seconds']}s; serving requests")
     yield
+    await model_lifecycle.stop()
+    await model_registry.stop()
+    shutdown_pool()
+    # Write out chat turns still waiting in the RAG ingestion queue
+    await run_in_threadpool(rag.flush, 10)
+    await ollama.aclose()
+    await async_engine.dispose()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -45,6 +82,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Added last so it is outermost and also times the other middleware
+if config.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 # # Optional: Serve React build files (for production)
 # if os.path.exists("build"):
 #     app.mount("/static", StaticFiles(directory="build/static"), name="static")
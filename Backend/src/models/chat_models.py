@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, ForeignKey, Text
+from sqlalchemy import Column, String, DateTime, ForeignKey, Text, Integer, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone
 from uuid import uuid4
@@ -13,6 +13,13 @@ class ChatSession(Base):
     modified_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
     convs = relationship("ChatConversations", back_populates="session", cascade="all, delete")
     model = Column(String, nullable=True)
+    summary = relationship("ChatSummary", back_populates="session", uselist=False, cascade="all, delete")
+
+    __table_args__ = (
+        # Session lists, newest first, optionally filtered by model
+        Index("ix_chat_sessions_created_at", "created_at"),
+        Index("ix_chat_sessions_model_created_at", "model", "created_at"),
+    )
 
 
 class ChatConversations(Base):
@@ -28,3 +35,20 @@ class ChatConversations(Base):
     modified_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
 
     session = relationship("ChatSession", back_populates="convs")
+
+    __table_args__ = (
+        # History, export and stats all filter by session and order by time
+        Index("ix_chat_convs_session_id_created_at", "session_id", "created_at"),
+    )
+
+
+class ChatSummary(Base):
+    __tablename__ = "chat_summaries"
+
+    session_id = Column(String, ForeignKey("chat_sessions.id"), primary_key=True)
+    summary = Column(Text, nullable=False, default="")
+    summarized_turns = Column(Integer, nullable=False, default=0)  # Oldest turns folded into the summary
+
+    updated_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+
+    session = relationship("ChatSession", back_populates="summary")
@@ -1,32 +1,49 @@
 import logging
-from fastapi import APIRouter, Body, HTTPException, Depends, Query,File, UploadFile
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Body, HTTPException, Depends, Query,File, UploadFile, Request, Response, WebSocket, WebSocketDisconnect, Header
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from ..utils.chat_helper import (
     save_conversation,
     edit_title,
     get_chat_history,
-    edit_conversation
+    edit_conversation,
+    get_model_usage
 )
 from ..utils.session_manager import create_chat_session,delete_chat_session
-from ..utils.requests_helper import curl
-from ..database.db import SessionLocal
+from ..utils.ollama_client import ollama
+from ..utils.scheduler import scheduler, SchedulerOverloaded
+from ..utils.model_lifecycle import model_lifecycle
+from ..utils.context_builder import assemble_context, model_context_length, token_budget, token_counter
+from ..utils.summarizer import summarizer
+from ..utils.generation_cache import cached_request, is_deterministic
+from ..utils.speech import SpeechError, SpeechUnavailable, audio_format, iter_upload, speech_engine, transcribe, transcribe_stream
+from .. import config
+from ..database.db import AsyncSessionLocal, IS_SQLITE
 from ..utils.rag_instance import rag
-from ..models.chat_models import ChatSession, ChatConversations
+from ..utils.embedding_cache import embedding_cache
+from ..utils.pagination import etag_matches, keyset, make_etag, page
+from ..utils.chat_search import search_conversations
+from ..utils.document_ingest import DocumentError, get_job, list_jobs, start_ingest
+from ..utils.metrics import stage
+from ..utils.chat_transfer import ChatImportError, export_ndjson, export_session_json, import_chats, iter_ndjson, records_from_json
+from ..models.chat_models import ChatSession, ChatConversations, ChatSummary
 from typing import List, Dict, Any, Optional
+from contextlib import aclosing
 from datetime import datetime, timezone
 from pydantic import BaseModel
-from fastapi.responses import JSONResponse
-from vosk import Model, KaldiRecognizer
-import wave
-import os
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
 import json
-from pydub import AudioSegment
+import time
 # Pydantic models for request/response validation
 class ChatRequest(BaseModel):
     message: str
     use_rag: bool = True
     max_tokens: Optional[int] = None
     temperature: Optional[float] = 0.7
+    stream: bool = False
+    rag_scope: str = "session"
 
 class TitleUpdateRequest(BaseModel):
     title: str
@@ -35,21 +52,19 @@ class MessageEditRequest(BaseModel):
     user_message: Optional[str] = None
     assistant_response: Optional[str] = None
 
-def get_db():
+async def get_db():
     """
     Database dependency for FastAPI.
-    Creates a new database session for each request and ensures proper cleanup.
+    Creates a new async database session for each request and ensures proper cleanup.
     Perfect for local desktop application with privacy guarantees.
     """
-    db = SessionLocal()
-    try:
-        yield db
-    except Exception as e:
-        logger.error(f"Database session error: {e}")
-        db.rollback()
-        raise
-    finally:
-        db.close()
+    async with AsyncSessionLocal() as db:
+        try:
+            yield db
+        except Exception as e:
+            logger.error(f"Database session error: {e}")
+            await db.rollback()
+            raise
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -57,58 +72,134 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-# Load Vosk model (update path as needed)
-MODEL_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../models/vosk-model-small-en-us-0.15"))
-print("MODEL_PATH:", MODEL_PATH)
-print("Contents:", os.listdir(MODEL_PATH))
-model = Model(MODEL_PATH)
-
-
 @router.post("/transcribe")
 async def transcribe_audio(file: UploadFile = File(...)):
-    # Save uploaded file temporarily
-    temp_path = "temp_audio.webm"
-    with open(temp_path, "wb") as f:
-        f.write(await file.read())
-
-    audio = AudioSegment.from_file(temp_path, format="webm")
-    audio = audio.set_frame_rate(16000).set_channels(1)
-    wav_path = "temp_audio.wav"
-    audio.export(wav_path, format="wav", parameters=["-acodec", "pcm_s16le"])
-
-    wf = wave.open(wav_path, "rb")
-    print("Sample rate:", wf.getframerate())
-    print("Channels:", wf.getnchannels())
-    print("Sample width:", wf.getsampwidth())
-    rec = KaldiRecognizer(model, wf.getframerate())
-    rec.SetWords(True)
-
-    results = []
-    while True:
-        data = wf.readframes(4000)
-        if len(data) == 0:
-            break
-        if rec.AcceptWaveform(data):
-            res = rec.Result()
-            results.append(res)
-    final_res = rec.FinalResult()
-    results.append(final_res)
-    wf.close()
-    os.remove(temp_path)
-    # Extract text from results
-    text = " ".join([json.loads(r).get("text", "") for r in results])
-    print("Vosk transcription text:", text)
+    """Transcribe a finished recording; decoding and recognition run off the event loop."""
+    fmt = audio_format(file.filename, file.content_type)
+    try:
+        text = await transcribe(iter_upload(file), fmt)
+    except SpeechUnavailable as e:
+        logger.error(f"Transcription unavailable: {e}")
+        raise HTTPException(status_code=503, detail=str(e))
+    except SpeechError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    logger.info(f"Transcribed {fmt} upload: {len(text)} chars")
     return JSONResponse({"text": text})
 
 
+@router.websocket("/transcribe/ws")
+async def transcribe_audio_ws(
+    websocket: WebSocket,
+    format: str = Query("webm", description="Container of the binary frames or pcm for raw 16 kHz s16le mono"),
+    words: bool = Query(False, description="Include word timings in result events")
+):
+    """
+    Live transcription: the client sends audio as binary frames (e.g.
+    MediaRecorder chunks) and a text frame ``end`` when done; partial and
+    final results come back as JSON messages in the meantime.
+    """
+    await websocket.accept()
+
+    async def frames():
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            if message.get("bytes"):
+                yield message["bytes"]
+            elif (message.get("text") or "").strip().lower() == "end":
+                return
+
+    try:
+        async with aclosing(transcribe_stream(frames(), format, words)) as events:
+            async for event in events:
+                await websocket.send_json(event)
+        await websocket.close()
+    except WebSocketDisconnect:
+        logger.info("Transcription socket closed by the client")
+    except SpeechError as e:
+        logger.warning(f"Live transcription failed: {e}")
+        await websocket.send_json({"type": "error", "message": str(e)})
+        await websocket.close(code=1011 if isinstance(e, SpeechUnavailable) else 1003)
+
+
+@router.get("/transcribe/stats", status_code=200)
+def transcription_stats():
+    """Speech model state and load time, recognizer pool utilization and wait times."""
+    return speech_engine.stats()
+
+
+@router.post("/pdf_context/{model}/{session_id}", status_code=202)
+async def add_document_context(
+    model: str,
+    session_id: str,
+    file: UploadFile = File(...),
+    wait: bool = Query(False, description="Answer once the document is indexed instead of right away")
+):
+    """
+    Add a PDF, text or markdown file to this session's RAG context.
+
+    The file is parsed, chunked and embedded in the background (PDF pages
+    and embeddings in worker processes); the answer carries a ``job_id``
+    whose progress ``/chat/pdf_context/jobs/{job_id}`` reports.
+    """
+    try:
+        job = await start_ingest(file, session_id, model)
+    except DocumentError as e:
+        return JSONResponse({"success": False, "message": str(e)}, status_code=400)
+    except RuntimeError as e:
+        return JSONResponse({"success": False, "message": str(e)}, status_code=503)
+    logger.info(f"Ingesting {job.filename} ({job.size} bytes) for session {session_id} as job {job.id}")
+    if not wait:
+        return {"success": True, "message": f"Adding {job.filename} to the chat context in the background.", **job.to_dict()}
+
+    await job.done.wait()
+    if job.status != "done":
+        return JSONResponse({"success": False, "message": f"Failed to read {job.filename}: {job.error}", **job.to_dict()}, status_code=500)
+    return JSONResponse({
+        "success": True,
+        "message": f"Added {job.filename} to the chat context ({job.chunks_stored} passages from {job.pages_done} pages).",
+        **job.to_dict()
+    })
+
+
+@router.get("/pdf_context/jobs", status_code=200)
+def document_jobs(session_id: Optional[str] = Query(None)):
+    """Recent document ingestion jobs, newest first."""
+    return {"jobs": list_jobs(session_id)}
+
+
+@router.get("/pdf_context/jobs/{job_id}", status_code=200)
+def document_job(job_id: str):
+    """Status and progress (pages parsed, chunks stored) of a document ingestion job."""
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+
+@router.delete("/pdf_context/jobs/{job_id}", status_code=200)
+async def cancel_document_job(job_id: str):
+    """Stop an ingestion job; chunks stored so far stay searchable."""
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not job.done.is_set():
+        job.task.cancel()
+        await job.done.wait()
+    return job.to_dict()
+
+
 @router.get("/session_id", status_code=200)
-def get_chat_id(model: str):
+async def get_chat_id(model: str):
     """Create a new chat session - keeping your original endpoint for compatibility."""
     try:
-        result = create_chat_session(model)
+        result = await create_chat_session(model)
         if not result.get("success"):
             raise HTTPException(status_code=400, detail=result.get("error", "Failed to create session"))
-        
+        # Load the model while the user types the first message
+        model_lifecycle.preload_soon(model, "new session")
+
         return {
             "session_id": result["session_id"], 
             "model": model,
@@ -119,115 +210,301 @@ def get_chat_id(model: str):
         logger.exception("Failed to create chat session")
         raise HTTPException(status_code=500, detail="Internal server error")
 
-@router.post("/{llm_model}/{session_id}")
-def chat_model(llm_model: str, session_id: str, q: str):
-    """Enhanced version of your original chat endpoint with better error handling and context."""
-    db = SessionLocal()
+async def _load_chat_state(db: AsyncSession, session_id: str):
+    """The session row, its running summary and a block-aligned window of recent turns."""
+    # Check if session exists
+    session = await db.get(ChatSession, str(session_id))
+    if not session:
+        raise HTTPException(status_code=404, detail="Chat session not found")
+
+    # Load a block-aligned window of recent turns; the assembler trims it to the budget.
+    # Turns already folded into the running summary are replaced by the summary.
+    summary = await db.get(ChatSummary, session_id)
+    summarized_turns = summary.summarized_turns if summary else 0
+    total_turns = await db.scalar(
+        select(func.count()).select_from(ChatConversations).where(ChatConversations.session_id == session_id)
+    )
+    block = max(1, config.CONTEXT_HISTORY_BLOCK)
+    first_turn = max(0, total_turns - config.CONTEXT_MAX_HISTORY_TURNS)
+    first_turn = max(summarized_turns, -(-first_turn // block) * block)
+    result = await db.execute(
+        select(ChatConversations.user_message, ChatConversations.assistant_response).where(
+            ChatConversations.session_id == session_id
+        ).order_by(ChatConversations.created_at).offset(first_turn)
+    )
+    history = [tuple(row) for row in result.all()]
+    return session, summary, first_turn, history
+
+
+def _retrieve_context(q: str, session_id: str, rag_scope: str):
+    """Retrieve RAG context using your existing setup (blocking: embeds the query)."""
+    if rag_scope == "none" or not rag.load():
+        return []
     try:
-        # Check if session exists
-        session = db.query(ChatSession).filter(ChatSession.id == str(session_id)).first()
-        if not session:
-            raise HTTPException(status_code=404, detail="Chat session not found")
+        docs = rag.retrieve(q, k=5, session_id=session_id if rag_scope == "session" else None)
+        if docs:
+            logger.info(f"Retrieved {len(docs)} relevant documents from RAG")
+        return docs
+    except Exception as e:
+        logger.warning(f"RAG retrieval failed: {e}")
+        return []  # Fallback to empty list
 
-        # Get recent chat history for context (last 5 conversations to maintain context)
-        recent_conversations = db.query(ChatConversations).filter(
-            ChatConversations.session_id == session_id
-        ).order_by(ChatConversations.created_at.desc()).limit(5).all()
-        
-        # Build conversation history for context
-        conversation_history = []
-        for conv in reversed(recent_conversations):  # Reverse to get chronological order
-            conversation_history.append({"role": "user", "content": conv.user_message})
-            if conv.assistant_response:
-                conversation_history.append({"role": "assistant", "content": conv.assistant_response})
-
-        # Retrieve RAG context using your existing setup
-        rag_context = ""
-        docs = []
-        if rag.is_initialized:
-            try:
-                docs = rag.retrieve(q, k=5)
-                if docs:
-                    rag_context = "\n\n".join(doc.page_content for doc in docs)
-                    logger.info(f"Retrieved {len(docs)} relevant documents from RAG")
-            except Exception as e:
-                logger.warning(f"RAG retrieval failed: {e}")
-                docs = []  # Fallback to empty list
-
-        # Construct messages following your original pattern but enhanced
-        all_messages = []
-        
-        # Add conversation history for context
-        all_messages.extend(conversation_history)
-        
-        # Add RAG context and user message based on your original logic
-        if not docs:  # Following your original pattern
-            all_messages.append({"role": "user", "content": q})
-        else:
-            # Add system message with RAG context
-            system_content = f"Use the following context to inform your response when relevant:\n{rag_context}"
-            all_messages.append({"role": "system", "content": system_content})
-            all_messages.append({"role": "user", "content": q})
-
-        # Get model response using your existing curl helper
-        response = curl(
-            "chat", "POST",
-            {
-                "model": llm_model,
-                "stream": False,
-                "messages": all_messages,
-            }
+
+async def _build_chat_messages(session_id: str, q: str, llm_model: str, budget: int, rag_scope: str = "session"):
+    """
+    Load the session, recent history and RAG context for a chat turn.
+
+    ``rag_scope`` limits retrieval to this session's chunks ("session"),
+    searches every session ("global") or skips it ("none"). Everything is
+    fitted into ``budget`` tokens by the context assembler.
+
+    The database session is closed again before generation starts, so no
+    connection is held while the model is answering.
+
+    Returns the session row, the message list for Ollama, the retrieved docs
+    and the token breakdown.
+    """
+    with stage("history_load"):
+        async with AsyncSessionLocal() as db:
+            session, summary, first_turn, history = await _load_chat_state(db, session_id)
+
+    with stage("retrieval"):
+        docs = await run_in_threadpool(_retrieve_context, q, session_id, rag_scope)
+
+    with stage("prompt_build"):
+        all_messages, breakdown = assemble_context(
+            llm_model, q, history, first_turn, [doc.page_content for doc in docs], budget,
+            summary=summary.summary if summary else None
         )
+    breakdown["summarized_turns"] = summary.summarized_turns if summary else 0
+    # Only report the chunks that made it into the prompt
+    docs = docs[:breakdown["rag_chunks"]]
 
-        # Validate response structure (keeping your original validation)
-        if not response or "message" not in response or "content" not in response["message"]:
-            raise ValueError("Invalid LLM response: missing 'message.content'")
+    return session, all_messages, docs, breakdown
 
-        assistant_reply = response["message"]["content"]
 
-        # Store in RAG using your existing method
-        if rag.is_initialized:
-            try:
-                rag.add_to_store(q, metadata={"type": "user_message", "session_id": session_id})
-                rag.add_to_store(assistant_reply, metadata={"type": "assistant_response", "session_id": session_id})
-            except Exception as e:
-                logger.warning(f"Failed to add to RAG: {e}")
+def _queue_for_rag(session_id: str, q: str, assistant_reply: str):
+    # Queue both sides for RAG; embedding and index writes happen in the background
+    if rag.load():
+        try:
+            rag.enqueue(q, metadata={"type": "user_message", "session_id": session_id})
+            rag.enqueue(assistant_reply, metadata={"type": "assistant_response", "session_id": session_id})
+        except Exception as e:
+            logger.warning(f"Failed to add to RAG: {e}")
 
-        # Save to database using your existing helper
-        save_conversation(session_id, user_message=q, assistant_message=assistant_reply)
 
-        # Set chat title to first user message if not already set
-        if session.title=="New Chat":
-            session.title = q[:100]  # Limit title length if needed
-            db.commit()
+async def _persist_chat_turn(session_id: str, q: str, assistant_reply: str):
+    """Store a finished exchange in RAG and the database; the database write is a single transaction."""
+    # Enqueueing may block briefly when the ingestion queue is full (backpressure)
+    with stage("rag_enqueue"):
+        await run_in_threadpool(_queue_for_rag, session_id, q, assistant_reply)
+    with stage("db_write"):
+        await save_conversation(session_id, user_message=q, assistant_message=assistant_reply)
 
-        # Update session modified time
-        session.modified_at = datetime.now(timezone.utc)
-        db.commit()
 
-        return {
+def _chat_payload(llm_model: str, messages: List[Dict[str, str]], stream: bool,
+                  temperature: Optional[float] = None) -> Dict[str, Any]:
+    payload = {"model": llm_model, "stream": stream, "messages": messages}
+    options = {}
+    if config.OLLAMA_NUM_CTX:
+        options["num_ctx"] = config.OLLAMA_NUM_CTX
+    if temperature is not None:
+        options["temperature"] = temperature
+    if options:
+        payload["options"] = options
+    return payload
+
+
+def _sse(event: Dict[str, Any]) -> str:
+    return f"data: {json.dumps(event)}\n\n"
+
+
+async def _stream_chat(session: ChatSession, llm_model: str, q: str, messages: List[Dict[str, str]], docs, breakdown, ticket,
+                       temperature: Optional[float] = None):
+    """
+    Relay Ollama's token stream to the client as server-sent events.
+
+    Emits one ``token`` event per chunk and a final ``done`` event carrying
+    time-to-first-token. The exchange is persisted once the stream completes.
+    The scheduler slot held by ``ticket`` is released when the stream ends.
+    """
+    started = time.perf_counter()
+    first_token_at = None
+    parts = []
+    final_chunk = {}
+    try:
+        yield _sse({
+            "type": "start",
+            "model_used": llm_model,
+            "rag_context_used": bool(docs),
+            "queue_wait_ms": round(ticket.wait_ms, 1),
+            "context_tokens": breakdown
+        })
+
+        async for chunk in ollama.stream("chat", _chat_payload(llm_model, messages, stream=True, temperature=temperature)):
+            if "error" in chunk:
+                logger.error(f"Streaming chat failed: {chunk['error']}")
+                yield _sse({"type": "error", "detail": chunk["error"]})
+                return
+
+            token = chunk.get("message", {}).get("content", "")
+            if token:
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                parts.append(token)
+                yield _sse({"type": "token", "content": token})
+
+            if chunk.get("done"):
+                final_chunk = chunk
+                break
+
+        scheduler.release(ticket)
+        token_counter.calibrate(llm_model, messages, final_chunk.get("prompt_eval_count"))
+        assistant_reply = "".join(parts)
+        await _persist_chat_turn(session.id, q, assistant_reply)
+        summarizer.schedule(session.id, llm_model)
+
+        ttft_ms = round((first_token_at - started) * 1000, 1) if first_token_at else None
+        total_ms = round((time.perf_counter() - started) * 1000, 1)
+        logger.info(f"Streamed chat for {session.id}: ttft={ttft_ms}ms total={total_ms}ms")
+
+        yield _sse({
+            "type": "done",
             "response": assistant_reply,
             "model_used": llm_model,
             "rag_context_used": bool(docs),
+            "time_to_first_token_ms": ttft_ms,
+            "total_time_ms": total_ms,
+            "queue_wait_ms": round(ticket.wait_ms, 1),
+            "eval_count": final_chunk.get("eval_count"),
+            "prompt_eval_count": final_chunk.get("prompt_eval_count"),
+            "context_tokens": breakdown,
             "privacy_status": "Response generated locally"
-        }
+        })
+    except Exception as e:
+        logger.exception(f"Error while streaming chat: {str(e)}")
+        yield _sse({"type": "error", "detail": str(e)})
+    finally:
+        scheduler.release(ticket)
+
+
+# Registered before the catch-all /{llm_model}/{session_id} route below
+@router.post("/rag/flush", status_code=200)
+async def flush_rag(timeout: float = Query(30.0, ge=0, description="Seconds to wait for pending documents")):
+    """Block until every queued chat turn has been embedded and written to the vector store."""
+    flushed = await run_in_threadpool(rag.flush, timeout)
+    return {"flushed": flushed, "ingestion": rag.ingestion_stats()}
+
+
+async def _cached_chat(payload: Dict[str, Any], llm_model: str, session_id: str, cache_control: Optional[str]):
+    """Deterministic chat through the generation cache; only a miss takes a scheduler slot."""
+    waited = {"ms": 0.0}
+
+    async def generate(path, data):
+        async with scheduler.slot(llm_model, session_id) as ticket:
+            waited["ms"] = ticket.wait_ms
+            return await ollama.request(path, "POST", data)
+
+    response, cache_status = await cached_request("chat", payload, cache_control, send=generate)
+    return response, cache_status, waited["ms"]
+
+
+async def _chat_reply(session_id: str, q: str, llm_model: str, all_messages, docs, breakdown,
+                      response: Dict[str, Any], queue_wait_ms: float, cache_status: str):
+    # Validate response structure (keeping your original validation)
+    if not response or "message" not in response or "content" not in response["message"]:
+        raise ValueError("Invalid LLM response: missing 'message.content'")
+
+    assistant_reply = response["message"]["content"]
+    if cache_status != "hit":
+        token_counter.calibrate(llm_model, all_messages, response.get("prompt_eval_count"))
+    breakdown["prompt_eval_count"] = response.get("prompt_eval_count")
+
+    await _persist_chat_turn(session_id, q, assistant_reply)
+    summarizer.schedule(session_id, llm_model)
+
+    return {
+        "response": assistant_reply,
+        "model_used": llm_model,
+        "rag_context_used": bool(docs),
+        "queue_wait_ms": round(queue_wait_ms, 1),
+        "context_tokens": breakdown,
+        "cache": cache_status,
+        "privacy_status": "Response generated locally"
+    }
+
+
+@router.post("/{llm_model}/{session_id}")
+async def chat_model(
+    llm_model: str,
+    session_id: str,
+    q: str,
+    stream: bool = False,
+    rag_scope: str = Query("session", pattern="^(session|global|none)$"),
+    temperature: Optional[float] = Query(None, ge=0, le=2, description="Sampling temperature; Ollama's default when omitted"),
+    cache_control: Optional[str] = Header(None, description="no-cache skips the generation cache lookup, no-store bypasses it")
+):
+    """
+    Enhanced version of your original chat endpoint with better error handling and context.
+
+    With ``stream=true`` the answer is sent token by token as server-sent events.
+    ``rag_scope`` picks which stored chats RAG may draw from. Non-streamed
+    answers at temperature 0 are served from the generation cache when the
+    same prompt was answered by the same model build before.
+    """
+    try:
+        budget = token_budget(await model_context_length(llm_model))
+        session, all_messages, docs, breakdown = await _build_chat_messages(
+            session_id, q, llm_model, budget, rag_scope
+        )
 
+        payload = _chat_payload(llm_model, all_messages, stream=False, temperature=temperature)
+        if not stream and is_deterministic(payload):
+            response, cache_status, wait_ms = await _cached_chat(payload, llm_model, session_id, cache_control)
+            return await _chat_reply(session_id, q, llm_model, all_messages, docs, breakdown, response,
+                                     queue_wait_ms=wait_ms, cache_status=cache_status)
+
+        # Wait for a generation slot; raises SchedulerOverloaded when the queue is full
+        ticket = await scheduler.acquire(llm_model, session_id)
+
+        if stream:
+            # The generator owns the slot from here and releases it when done
+            return StreamingResponse(
+                _stream_chat(session, llm_model, q, all_messages, docs, breakdown, ticket, temperature),
+                media_type="text/event-stream",
+                # Safety net in case the stream is never consumed
+                background=BackgroundTask(scheduler.release, ticket)
+            )
+
+        # Get model response through the shared pooled Ollama client
+        try:
+            response = await ollama.request("chat", "POST", payload)
+        finally:
+            scheduler.release(ticket)
+
+        return await _chat_reply(session_id, q, llm_model, all_messages, docs, breakdown, response,
+                                 queue_wait_ms=ticket.wait_ms, cache_status="bypass")
+
+    except HTTPException:
+        raise
+    except SchedulerOverloaded as e:
+        logger.warning(f"Shedding chat request for {llm_model}: {e}")
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         logger.exception(f"Error in chat_model: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        db.close()
 
 @router.post("/sessions/{session_id}/messages")
-def send_message_enhanced(
+async def send_message_enhanced(
     session_id: str,
     request: ChatRequest,
-    db: Session = Depends(get_db)
+    cache_control: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db)
 ):
     """Alternative enhanced endpoint that uses the same logic as your original but with structured input."""
     try:
         # Validate session exists
-        session = db.query(ChatSession).filter(ChatSession.id == session_id).first()
+        session = await db.get(ChatSession, session_id)
         if not session:
             raise HTTPException(status_code=404, detail="Chat session not found")
 
@@ -237,7 +514,13 @@ def send_message_enhanced(
             raise HTTPException(status_code=400, detail="Session has no associated model")
 
         # Call your existing chat_model function logic
-        return chat_model(model, session_id, request.message)
+        if request.rag_scope not in ("session", "global", "none"):
+            raise HTTPException(status_code=422, detail="rag_scope must be 'session', 'global' or 'none'")
+        rag_scope = request.rag_scope if request.use_rag else "none"
+        # Don't hold this connection while the model generates
+        await db.close()
+        return await chat_model(model, session_id, request.message, stream=request.stream, rag_scope=rag_scope,
+                                temperature=request.temperature, cache_control=cache_control)
 
     except HTTPException:
         raise
@@ -245,15 +528,27 @@ def send_message_enhanced(
         logger.exception(f"Error processing enhanced message for session {session_id}")
         raise HTTPException(status_code=500, detail="Failed to process message")
 
+@router.get("/sessions/{session_id}/summary", status_code=200)
+async def get_session_summary(session_id: str, db: AsyncSession = Depends(get_db)):
+    """Running summary of the older part of a long session."""
+    summary = await db.get(ChatSummary, session_id)
+    return {
+        "session_id": session_id,
+        "summary": summary.summary if summary else None,
+        "summarized_turns": summary.summarized_turns if summary else 0,
+        "updated_at": summary.updated_at.isoformat() if summary and summary.updated_at else None,
+        "summarizer": summarizer.stats
+    }
+
 @router.patch("/chat/{session_id}/title", status_code=200)
-def update_chat_title(session_id: str, payload: dict = Body(...), db: Session = Depends(get_db)):
+async def update_chat_title(session_id: str, payload: dict = Body(...), db: AsyncSession = Depends(get_db)):
     """Keep your original title update endpoint."""
     try:
         new_title = payload.get("title")
         if not new_title:
             raise HTTPException(status_code=400, detail="Missing 'title' in request.")
 
-        edit_title(db, session_id, new_title)
+        await edit_title(db, session_id, new_title)
         return {
             "message": "Title updated successfully",
             "session_id": session_id,
@@ -265,42 +560,102 @@ def update_chat_title(session_id: str, payload: dict = Body(...), db: Session =
         logger.exception("Failed to update title")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+async def _list_sessions(db: AsyncSession, request: Request, response: Response,
+                         model: Optional[str], limit: Optional[int], cursor: Optional[str]):
+    """
+    One page of sessions, newest first, as a lightweight projection.
+
+    The ETag covers the number of matching sessions and their latest
+    modification, which every new turn, rename, edit or delete changes, so
+    an unchanged list is answered with 304 before any rows are read.
+    """
+    scope = select(func.count(), func.max(ChatSession.modified_at), func.max(ChatSession.created_at)).select_from(ChatSession)
+    if model is not None:
+        scope = scope.where(ChatSession.model == model)
+    fingerprint = (await db.execute(scope)).one()
+    etag = make_etag("sessions", model, limit, cursor, *fingerprint)
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+    statement = select(ChatSession.id, ChatSession.title, ChatSession.model, ChatSession.created_at)
+    if model is not None:
+        statement = statement.where(ChatSession.model == model)
+    statement = keyset(statement, ChatSession.created_at, ChatSession.id, cursor, descending=True)
+    if limit is not None:
+        statement = statement.limit(limit + 1)
+    rows, next_cursor = page((await db.execute(statement)).all(), limit)
+
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    return {
+        "sessions": [
+            {
+                "chat_id": row.id,  # Keeping your original field name
+                "title": row.title,
+                "model": row.model,
+                "created_at": row.created_at.isoformat()
+            }
+            for row in rows
+        ],
+        "next_cursor": next_cursor,
+        "has_more": next_cursor is not None,
+        "privacy_status": "All data stored locally - no external API calls"
+    }
+
 @router.get("/sessions", status_code=200)
-def get_all_sessions(db: Session = Depends(get_db)):
+async def get_all_sessions(
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=500, description="Page size; all sessions when omitted"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    db: AsyncSession = Depends(get_db)
+):
     """Keep your original sessions endpoint with enhancements."""
     try:
-        sessions = db.query(ChatSession).order_by(ChatSession.created_at.desc()).all()
-        return {
-            "sessions": [
-                {
-                    "chat_id": session.id,  # Keeping your original field name
-                    "title": session.title,
-                    "model": session.model,
-                    "created_at": session.created_at.isoformat()
-                }
-                for session in sessions
-            ],
-            "privacy_status": "All data stored locally - no external API calls"
-        }
+        return await _list_sessions(db, request, response, None, limit, cursor)
+    except HTTPException:
+        raise
+    except ValueError as e:
+        # Malformed cursor
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.exception("Failed to fetch chat sessions")
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @router.delete("/delete-session/{Session_id}")
-def deleteSession(Session_id: str, db: Session = Depends(get_db)):
+async def deleteSession(Session_id: str, db: AsyncSession = Depends(get_db)):
     """Keep your original delete session endpoint."""
     try:
-        result = delete_chat_session(db, Session_id)
+        result = await delete_chat_session(db, Session_id)
         return {"message": result}
     except Exception as e:
         logger.exception(f"Failed to delete session {Session_id}")
         raise HTTPException(status_code=500, detail="Failed to delete session")
 
 @router.get("/chat_history/{Session_id}")
-def ChatHistory(Session_id: str):
+async def ChatHistory(
+    Session_id: str,
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Page size; the whole chat when omitted"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    order: str = Query("asc", pattern="^(asc|desc)$", description="desc pages back from the latest turn"),
+    db: AsyncSession = Depends(get_db)
+):
     """Keep your original chat history endpoint."""
     try:
-        conversations = get_chat_history(Session_id)
+        # Every new turn and edit bumps the session's modified_at
+        session = await db.get(ChatSession, Session_id)
+        etag = make_etag("history", Session_id, session.modified_at if session else None, limit, cursor, order)
+        if etag_matches(request, etag):
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+        await db.close()
+
+        rows, next_cursor = page(
+            await get_chat_history(Session_id, limit=limit, cursor=cursor, descending=order == "desc"), limit
+        )
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = "no-cache"
         return {
             "conversations": [
                 {
@@ -310,24 +665,30 @@ def ChatHistory(Session_id: str):
                     "created_at": conv.created_at,
                     "modified_at": conv.modified_at
                 }
-                for conv in conversations
+                for conv in rows
             ],
+            "next_cursor": next_cursor,
+            "has_more": next_cursor is not None,
             "session_id": Session_id,
             "privacy_info": "Local data only"
         }
+    except HTTPException:
+        raise
+    except ValueError as e:
+        # Malformed cursor
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.exception(f"Failed to get chat history for {Session_id}")
         raise HTTPException(status_code=500, detail="Failed to retrieve chat history")
 
 @router.put("/messages/{message_id}")
-def edit_message(
+async def edit_message(
     message_id: str,
-    request: MessageEditRequest,
-    db: Session = Depends(get_db)
+    request: MessageEditRequest
 ):
     """Edit a message using your existing edit_conversation helper."""
     try:
-        result = edit_conversation(
+        result = await edit_conversation(
             message_id=message_id,
             new_user_msg=request.user_message,
             new_assistant_msg=request.assistant_response
@@ -345,34 +706,20 @@ def edit_message(
         raise HTTPException(status_code=500, detail="Failed to edit message")
 
 @router.get("/sessions/stats", status_code=200)
-def get_session_stats(db: Session = Depends(get_db)):
-    """Get overview stats using basic queries compatible with your setup."""
+async def get_session_stats(db: AsyncSession = Depends(get_db)):
+    """Get overview stats with a handful of aggregate queries, independent of the number of sessions."""
     try:
-        # Get basic statistics using simple queries
-        total_sessions = db.query(ChatSession).count()
-        total_messages = db.query(ChatConversations).count()
-        
-        # Get model usage with basic queries
-        sessions_with_models = db.query(ChatSession).filter(ChatSession.model.isnot(None)).all()
-        model_counts = {}
-        for session in sessions_with_models:
-            model = session.model or "unknown"
-            if model not in model_counts:
-                model_counts[model] = {"sessions": 0, "messages": 0}
-            model_counts[model]["sessions"] += 1
-            
-            # Count messages for this session
-            message_count = db.query(ChatConversations).filter(
-                ChatConversations.session_id == session.id
-            ).count()
-            model_counts[model]["messages"] += message_count
-        
+        total_sessions = await db.scalar(select(func.count()).select_from(ChatSession))
+        total_messages = await db.scalar(select(func.count()).select_from(ChatConversations))
+
+        model_counts = await get_model_usage(db)
+
         # Get recent activity (last 7 days)
         from datetime import timedelta
         week_ago = datetime.now(timezone.utc) - timedelta(days=7)
-        recent_sessions = db.query(ChatSession).filter(
-            ChatSession.created_at >= week_ago
-        ).count()
+        recent_sessions = await db.scalar(
+            select(func.count()).select_from(ChatSession).where(ChatSession.created_at >= week_ago)
+        )
         
         return {
             "overview": {
@@ -381,7 +728,8 @@ def get_session_stats(db: Session = Depends(get_db)):
                 "recent_sessions_week": recent_sessions,
                 "privacy_guaranteed": True,
                 "storage_location": "local_database_only",
-                "rag_status": "enabled" if rag.is_initialized else "disabled"
+                # Don't load the model just for the stats; it loads on first use
+                "rag_status": "disabled" if rag.state == "failed" else "enabled"
             },
             "model_usage": [
                 {
@@ -397,40 +745,96 @@ def get_session_stats(db: Session = Depends(get_db)):
     except Exception as e:
         logger.exception("Failed to fetch session stats")
         raise HTTPException(status_code=500, detail="Failed to retrieve session statistics")
-from fastapi.responses import JSONResponse
+@router.get("/search", status_code=200)
+async def search_chats(
+    q: str = Query(..., min_length=1, max_length=500, description='Words, "quoted phrases" and prefix* terms'),
+    mode: str = Query("all", pattern="^(all|any)$", description="Require every term or any of them"),
+    model: Optional[str] = Query(None, description="Only sessions that use this model"),
+    session_id: Optional[str] = Query(None, description="Only this session"),
+    date_from: Optional[datetime] = Query(None, description="Turns created at or after this time"),
+    date_to: Optional[datetime] = Query(None, description="Turns created before this time"),
+    order: str = Query("relevance", pattern="^(relevance|recent)$"),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=10_000),
+    db: AsyncSession = Depends(get_db)
+):
+    """Full-text search over all chat turns, ranked by BM25 with highlighted snippets."""
+    if not IS_SQLITE:
+        raise HTTPException(status_code=501, detail="Chat search requires the SQLite database")
+    try:
+        t0 = time.perf_counter()
+        result = await search_conversations(
+            db, q, mode=mode, model=model, session_id=session_id,
+            date_from=date_from, date_to=date_to, order=order, limit=limit, offset=offset
+        )
+        return {
+            "query": q,
+            **result,
+            "offset": offset,
+            "took_ms": round((time.perf_counter() - t0) * 1000, 2)
+        }
+    except Exception as e:
+        logger.exception("Chat search failed")
+        raise HTTPException(status_code=500, detail="Search failed")
+
+@router.get("/export", status_code=200)
+async def export_all_sessions():
+    """Stream every session and its turns as NDJSON, read through a server-side cursor."""
+    filename = f"privateprompt-chats-{datetime.now(timezone.utc):%Y%m%d-%H%M%S}.ndjson"
+    return StreamingResponse(
+        export_ndjson(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
 
 @router.get("/export/{session_id}", response_class=JSONResponse)
-def export_chat_session(session_id: str, db: Session = Depends(get_db)):
-    """Export a full chat session as a downloadable JSON."""
+async def export_chat_session(
+    session_id: str,
+    format: str = Query("json", pattern="^(json|ndjson)$", description="ndjson matches the full export and /import"),
+    db: AsyncSession = Depends(get_db)
+):
+    """Export a full chat session as a downloadable JSON, streamed turn by turn."""
     try:
-        session = db.query(ChatSession).filter(ChatSession.id == session_id).first()
+        session = await db.get(ChatSession, session_id)
         if not session:
             raise HTTPException(status_code=404, detail="Session not found")
 
-        conversations = db.query(ChatConversations).filter(
-            ChatConversations.session_id == session_id
-        ).order_by(ChatConversations.created_at).all()
-
-        export_data = {
-            "session_id": session.id,
-            "title": session.title,
-            "model": session.model,
-            "created_at": session.created_at.isoformat(),
-            "conversations": [
-                {
-                    "user_message": c.user_message,
-                    "assistant_response": c.assistant_response,
-                    "created_at": c.created_at.isoformat(),
-                    "modified_at": c.modified_at.isoformat() if c.modified_at else None
-                }
-                for c in conversations
-            ]
-        }
-
-        return JSONResponse(content=export_data)
+        if format == "ndjson":
+            return StreamingResponse(
+                export_ndjson(session_id),
+                media_type="application/x-ndjson",
+                headers={"Content-Disposition": f'attachment; filename="chat-{session_id}.ndjson"'}
+            )
+        return StreamingResponse(export_session_json(session_id), media_type="application/json")
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception("Failed to export session")
         raise HTTPException(status_code=500, detail="Failed to export session")
+
+@router.post("/import", status_code=200)
+async def import_sessions(
+    request: Request,
+    remap_ids: bool = Query(False, description="Import as copies under new ids instead of skipping sessions that already exist"),
+    reindex: bool = Query(True, description="Embed the imported turns into the RAG store")
+):
+    """
+    Bulk-import chats from an NDJSON export (streamed, any size) or a
+    single-session JSON export (sent as application/json).
+    """
+    try:
+        if request.headers.get("content-type", "").startswith("application/json"):
+            records = records_from_json(json.loads(await request.body()))
+        else:
+            records = iter_ndjson(request.stream())
+        result = await import_chats(records, remap_ids=remap_ids, reindex=reindex)
+    except json.JSONDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON: {e}")
+    except ChatImportError as e:
+        logger.warning(f"Import stopped: {e}")
+        raise HTTPException(status_code=400, detail={"error": str(e), "imported": e.stats})
+    logger.info(f"Imported {result['sessions_imported']} sessions / {result['turns_imported']} turns in {result['elapsed_s']}s")
+    return {"status": "ok", **result}
     
 @router.get("/health", status_code=200)
 def health_check():
@@ -439,28 +843,49 @@ def health_check():
         "status": "healthy",
         "service": "local_chat_interface",
         "privacy": "guaranteed_local_only",
-        "rag_initialized": rag.is_initialized,
+        "rag_initialized": rag.state == "ready",
+        "rag_ingestion": rag.ingestion_stats(),
         "database_connected": True,
         "timestamp": datetime.now(timezone.utc).isoformat()
     }
 
+@router.get("/rag/embedding_cache", status_code=200)
+def embedding_cache_stats():
+    """Hit/miss statistics of the embedding cache."""
+    if embedding_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **embedding_cache.stats()}
+
+@router.delete("/rag/embedding_cache", status_code=200)
+def invalidate_embedding_cache(model: Optional[str] = Query(None, description="Cache namespace to drop, e.g. 'hf:all-MiniLM-L6-v2'; all when omitted")):
+    """Drop cached embeddings, e.g. after swapping the embedding model."""
+    if embedding_cache is None:
+        return {"enabled": False}
+    embedding_cache.invalidate(model)
+    return {"enabled": True, "invalidated": model or "all", **embedding_cache.stats()}
+
+@router.get("/scheduler", status_code=200)
+def scheduler_stats():
+    """Queue depth, in-flight generations and wait times of the generation scheduler."""
+    return scheduler.stats()
+
 @router.get("/sessions/by_model", status_code=200)
-def get_sessions_by_model(model: str = Query(..., description="Model name to filter sessions"), db: Session = Depends(get_db)):
+async def get_sessions_by_model(
+    request: Request,
+    response: Response,
+    model: str = Query(..., description="Model name to filter sessions"),
+    limit: Optional[int] = Query(None, ge=1, le=500, description="Page size; all sessions when omitted"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    db: AsyncSession = Depends(get_db)
+):
     """Get all chat sessions that use a particular model."""
     try:
-        sessions = db.query(ChatSession).filter(ChatSession.model == model).order_by(ChatSession.created_at.desc()).all()
-        return {
-            "sessions": [
-                {
-                    "chat_id": session.id,
-                    "title": session.title,
-                    "model": session.model,
-                    "created_at": session.created_at.isoformat()
-                }
-                for session in sessions
-            ],
-            "privacy_status": "All data stored locally - no external API calls"
-        }
+        return await _list_sessions(db, request, response, model, limit, cursor)
+    except HTTPException:
+        raise
+    except ValueError as e:
+        # Malformed cursor
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.exception(f"Failed to fetch sessions for model {model}")
         raise HTTPException(status_code=500, detail="Internal server error")
\ No newline at end of file
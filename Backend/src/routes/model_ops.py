@@ -1,127 +1,252 @@
 from fastapi import APIRouter
-from ..utils.requests_helper import curl
-from ..utils.ollama_checker import ollama_checker, get_installed_models
-from ..utils.webscraper import scrape_ollama_search
+from ..utils.ollama_client import ollama
+from ..utils.generation_cache import generation_cache
+from ..utils.ollama_checker import ollama_checker
+from ..utils.model_registry import describe_installed, model_registry
+from ..utils.model_lifecycle import model_lifecycle
+from ..utils.model_catalog import model_catalog, SORT_KEYS
+from ..utils.pagination import etag_matches, make_etag
+from ..utils.scheduler import SchedulerOverloaded
 import traceback
-from ..utils.PromptGenerator import prompt_generator, code_generator
-import subprocess
-from fastapi.responses import StreamingResponse
+from ..utils.sql_pipeline import generate_sql, normalize_schema, run_sql_batch
+from .. import config
+import asyncio
+from fastapi.responses import JSONResponse, StreamingResponse
 import re
-from fastapi.exceptions import HTTPException
-from fastapi import Query
-import requests
 import json
+from contextlib import aclosing
+from fastapi.exceptions import HTTPException
+from fastapi import Header, Query, Request, Response
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional
 
 router = APIRouter()
 
+class SQLRequest(BaseModel):
+    request: str = Field(..., min_length=1, description="What the query should do, in plain language")
+    db_schema: str = Field(..., alias="schema", min_length=1, description="CREATE TABLE statements or a table/column listing")
+
+class SQLBatchItem(BaseModel):
+    request: str = Field(..., min_length=1)
+    db_schema: Optional[str] = Field(None, alias="schema", description="Inline schema")
+    schema_id: Optional[str] = Field(None, description="Key into the batch's schemas")
+
+class SQLBatchRequest(BaseModel):
+    schemas: Dict[str, str] = Field(default_factory=dict, description="Schemas shared by several items, by id")
+    items: List[SQLBatchItem] = Field(..., min_length=1)
+    prompt_concurrency: int = Field(config.SQL_PROMPT_CONCURRENCY, ge=1, le=16)
+    sql_concurrency: int = Field(config.SQL_CODE_CONCURRENCY, ge=1, le=16)
+
 @router.get("/ollama")
-def ollama_check():
-    return ollama_checker()
+async def ollama_check():
+    return await ollama_checker()
 
 @router.get("/list")
-def list_models():
-    raw_data = scrape_ollama_search("https://ollama.com/search")
-    # Convert dict to list for frontend
-    models_list = list(raw_data.values()) if isinstance(raw_data, dict) else []
-    return { "models": models_list }
+async def list_models(
+    request: Request,
+    q: Optional[str] = Query(None, description="Text to find in the model name or description"),
+    capability: List[str] = Query([], description="Required capabilities (tools, vision, embedding, thinking); repeatable"),
+    max_size: Optional[float] = Query(None, gt=0, description="Keep models with a variant of at most this many billion parameters"),
+    sort: Optional[str] = Query(None, description=f"One of {', '.join(SORT_KEYS)}; catalog order when omitted"),
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=500, description="Page size; the whole (filtered) catalog when omitted")
+):
+    """Models on ollama.com, served from the cached catalog (refreshed in the background)."""
+    if sort is not None and sort not in SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {', '.join(SORT_KEYS)}")
+    try:
+        await model_catalog.entries()
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    etag = make_etag("catalog", *model_catalog.version(), q, sorted(capability), max_size, sort, order, offset, limit)
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    result = await model_catalog.query(q, capability, max_size, sort, order == "desc", offset, limit)
+    return JSONResponse(result, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+@router.get("/catalog")
+def model_catalog_stats():
+    """Age, source and refresh counters of the model catalog cache."""
+    return model_catalog.stats()
+
+@router.post("/catalog/refresh")
+async def refresh_model_catalog():
+    """Fetch the catalog now instead of waiting for the TTL."""
+    await model_catalog.refresh()
+    stats = model_catalog.stats()
+    if stats["last_error"]:
+        raise HTTPException(status_code=502, detail=f"Catalog refresh failed: {stats['last_error']}")
+    return stats
 
 @router.get("/available")
-def local_models():
-    response = curl('tags', 'GET')
-
-    # Fallback in case 'models' key not present or response invalid
-    raw_models = response.get("models", []) if isinstance(response, dict) else []
-
-    # Reformat to match frontend expectations
-    models_list = []
-    for model in raw_models:
-        models_list.append({
-            "model_name": model.get("model") or model.get("name") or "",  # for compatibility
-            "name": model.get("name") or model.get("model") or "",
-            "details": model.get("details", {}),
-            "size": model.get("size", 0),
-            "modified_at": model.get("modified_at", ""),
-            "digest": model.get("digest", "")
-        })
-
-    return {"models": models_list}
+async def local_models():
+    """Installed models, served from the model registry."""
+    return {"models": [describe_installed(model) for model in await model_registry.installed()]}
 
 @router.get("/info")
-def model_information(model:str):
+async def model_information(model:str):
     model=model.strip('"')
-    return curl('show','POST',{"model":model})
+    return await model_registry.info(model)
 
 @router.delete("/remove")
-def remove_model(llm_model: str = Query(..., description="Name of the model to delete")):
+async def remove_model(llm_model: str = Query(..., description="Name of the model to delete")):
     if not llm_model.strip():
         raise HTTPException(status_code=400, detail="Model name must not be empty")
 
     try:
         print(f"Trying to delete model: {llm_model}")
 
-        response = requests.request(
-            method="DELETE",
-            url="http://localhost:11434/api/delete",
-            headers={"Content-Type": "application/json"},
-            data=json.dumps({"name": llm_model})  # 🔥 critical part
-        )
-
-        try:
-            result = response.json()
-        except ValueError:
-            return {"message": f"Model '{llm_model}' deleted successfully (no content from Ollama)."}
+        result = await ollama.request("delete", "DELETE", {"name": llm_model})
 
         if result.get("error"):
             raise HTTPException(status_code=500, detail=f"Ollama error: {result['error']}")
 
+        # Subscribers hear about the removal now rather than on the next timer tick
+        await model_registry.refresh()
+        if not result:
+            return {"message": f"Model '{llm_model}' deleted successfully (no content from Ollama)."}
+
         return result
 
-    except requests.RequestException as e:
-        raise HTTPException(status_code=500, detail=f"Request to Ollama failed: {str(e)}")
+    except HTTPException:
+        raise
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to delete model '{llm_model}': {str(e)}")
 
 @router.get("/running")
-def running_models():
-    return curl('ps', 'GET')
-
-# Regex to strip ANSI escape sequences
-ansi_escape = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
+async def running_models():
+    """Models loaded in Ollama's memory (``/api/ps``), served from the model registry."""
+    return {"models": await model_registry.running()}
+
+@router.get("/events")
+async def model_events():
+    """
+    Server-sent events for the local model state: a ``snapshot`` first,
+    then a ``changed`` event (added/removed/updated, started/stopped,
+    ollama up/down) whenever it changes. Replaces polling ``/available``,
+    ``/running`` and ``/ollama``.
+    """
+    queue = model_registry.subscribe()
+
+    async def stream():
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), config.MODEL_REGISTRY_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    # Keeps proxies from closing an idle connection
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            model_registry.unsubscribe(queue)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@router.get("/registry")
+def model_registry_stats():
+    """Refresh and change counters of the in-memory model registry."""
+    return model_registry.stats()
+
+@router.get("/lifecycle")
+def model_lifecycle_stats(decisions: int = Query(50, ge=0, le=config.MODEL_LIFECYCLE_DECISIONS, description="Most recent decisions returned")):
+    """Loaded models, hit rate (generations that found their model loaded) and recent preload/keep-alive/unload decisions."""
+    return model_lifecycle.stats(decisions)
+
+@router.post("/lifecycle/preload")
+async def preload_model(model: str = Query(..., min_length=1, description="Model to load, e.g. 'llama3:latest'")):
+    """Load a model ahead of use, e.g. when the user picks it; returns the decision."""
+    task = model_lifecycle.preload_soon(model, "requested")
+    if task is None:
+        return {"enabled": False}
+    return {"enabled": True, **await asyncio.shield(task)}
+
+@router.post("/sql")
+async def text_to_sql(payload: SQLRequest, cache_control: Optional[str] = Header(None)):
+    """Write a SQL query for a request against a schema: llama3 writes the prompt, codellama the query."""
+    try:
+        return await generate_sql(payload.request, payload.db_schema, cache_control)
+    except SchedulerOverloaded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=str(e))
+
+@router.post("/sql/batch")
+async def text_to_sql_batch(payload: SQLBatchRequest, cache_control: Optional[str] = Header(None)):
+    """
+    Run many text-to-SQL jobs through an overlapped two-stage pipeline.
+
+    Each schema is normalized once per batch, however many items use it.
+    Results stream back as NDJSON in completion order (``index`` refers to
+    the input position), followed by a summary line.
+    """
+    if len(payload.items) > config.SQL_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {config.SQL_BATCH_MAX_ITEMS} items per batch")
+    normalized: Dict[str, str] = {}
+    jobs = []
+    for index, item in enumerate(payload.items):
+        if item.schema_id is not None:
+            if item.schema_id not in payload.schemas:
+                raise HTTPException(status_code=422, detail=f"items[{index}]: unknown schema_id '{item.schema_id}'")
+            raw = payload.schemas[item.schema_id]
+        elif item.db_schema:
+            raw = item.db_schema
+        else:
+            raise HTTPException(status_code=422, detail=f"items[{index}]: needs schema or schema_id")
+        if raw not in normalized:
+            normalized[raw] = normalize_schema(raw)
+        jobs.append((item.request, normalized[raw]))
+
+    async def ndjson():
+        # Closing the batch cancels its workers when the client goes away
+        async with aclosing(run_sql_batch(jobs, cache_control, payload.prompt_concurrency, payload.sql_concurrency)) as events:
+            async for event in events:
+                yield json.dumps(event) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+def _pull_progress(chunk: dict) -> str:
+    status = chunk.get("status", "")
+    if chunk.get("total") and "completed" in chunk:
+        return f"{status}: {chunk['completed'] * 100 // chunk['total']}% ({chunk['completed']}/{chunk['total']} bytes)"
+    return status
 
 @router.get("/pull/{llm_model}")
 async def download_models(llm_model: str):
-    # Validate model name to prevent command injection
-    if not re.match(r'^[a-zA-Z0-9._:-]+$', llm_model):
+    # Validate model name before handing it to Ollama
+    if not re.match(r'^[a-zA-Z0-9._:/-]+$', llm_model):
         raise HTTPException(status_code=400, detail="Invalid model name")
 
-    def stream():
-        try:
-            process = subprocess.Popen(
-                ["ollama", "pull", llm_model],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-                encoding='utf-8',
-                bufsize=1,
-            )
-            for line in process.stdout:
-                # Strip ANSI codes
-                clean_line = ansi_escape.sub('', line).strip()
-                if clean_line:
-                    yield f"data: {clean_line}\n\n"
-            process.wait()
-
-            if process.returncode == 0:
-                yield "data: Download completed successfully\n\n"
-            else:
-                yield f"data: Error: Process exited with code {process.returncode}\n\n"
-
-        except FileNotFoundError:
-            yield "data: Error: Ollama CLI not found on server\n\n"
-        except Exception as e:
-            yield f"data: Error: Failed to start download: {str(e)}\n\n"
+    async def stream():
+        # Ollama's pull API instead of the CLI: no subprocess, and works with a remote OLLAMA_HOST
+        last = None
+        async for chunk in ollama.stream("pull", {"model": llm_model, "stream": True}):
+            if "error" in chunk:
+                yield f"data: Error: {chunk['error']}\n\n"
+                return
+            line = _pull_progress(chunk)
+            if line and line != last:
+                last = line
+                yield f"data: {line}\n\n"
+        await model_registry.refresh()
+        yield "data: Download completed successfully\n\n"
 
     return StreamingResponse(stream(), media_type="text/event-stream")
 
 
+@router.get("/generation_cache")
+def generation_cache_stats():
+    """Hit rate, size and tracked model digests of the deterministic generation cache."""
+    if generation_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **generation_cache.stats()}
+
+@router.delete("/generation_cache")
+def invalidate_generation_cache(model: str = Query(None, description="Model whose answers to drop, e.g. 'llama3:latest'; all when omitted")):
+    """Drop cached generations, e.g. after changing a model's Modelfile."""
+    if generation_cache is None:
+        return {"enabled": False}
+    generation_cache.invalidate(model)
+    return {"enabled": True, "invalidated": model or "all", **generation_cache.stats()}
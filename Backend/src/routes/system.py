@@ -1,7 +1,24 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Response
+from fastapi.responses import PlainTextResponse
+
+from ..utils.metrics import registry
+from ..utils.startup import startup
 
 router = APIRouter()
 
 @router.get("/")
 def read_root():
     return {"Hello": "This the page where you can interact with the models offline."}
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Request, stage and LLM metrics in the Prometheus text format."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@router.get("/ready")
+def readiness(response: Response):
+    """Which subsystems are warm; 503 until the database is migrated and background warm-ups are done."""
+    report = startup.report()
+    if not report["ready"]:
+        response.status_code = 503
+    return report
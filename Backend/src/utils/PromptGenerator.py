@@ -1,6 +1,4 @@
-import requests
-from fastapi import FastAPI,requests
-from .requests_helper import curl
+from .generation_cache import cached_request
 import json
 import re
 
@@ -24,7 +22,20 @@ def extract_json_from_text(text: str) -> dict:
         pass
     return {}
 
-def prompt_generator(prompt:str,schema:str)->str:
+def extract_sql_from_text(text: str) -> str:
+    """
+    Extracts the SQL query from a code model's answer.
+
+    Args:
+        text (str): The model output, possibly wrapped in a ```sql fence.
+
+    Returns:
+        str: The query without fences or surrounding whitespace.
+    """
+    match = re.search(r"```(?:sql)?\s*(.*?)```", text, re.DOTALL | re.IGNORECASE)
+    return (match.group(1) if match else text).strip()
+
+async def prompt_generator(prompt:str,schema:str,cache_control:str=None,send=None)->str:
     system_message='''You are a prompt generation assistant. You are given two inputs:
 
                         1)A user's request in natural language describing a data operation (e.g., SELECT, INSERT, UPDATE, DELETE).
@@ -50,25 +61,32 @@ def prompt_generator(prompt:str,schema:str)->str:
                         -Do not return this is the generated prompt etc... in the response.
                             '''
 
-    response=curl('chat','POST',
+    # Greedy decoding: the same request and schema always get the same prompt, so it is served from the generation cache
+    response,_=await cached_request('chat',
                   {
                       "model":"llama3",
                       "stream":False,
+                      "options":{"temperature":0},
                       "messages":[
                           {"role":"system","content":system_message},
                           {"role":"user","content":f"The user request is {prompt} and the schema or context is {schema}."}
                       ]
-                  }
+                  },
+                  cache_control,
+                  send
                   )
+    if "message" not in response:
+        raise RuntimeError(f"Prompt generation failed: {response.get('error', 'no message returned')}")
     content=response["message"].get("content")
     # extracted_json=extract_json_from_text(content)
     return content
 
-def code_generator(prompt: str):
-    response = curl("generate", "POST", {
+async def code_generator(prompt: str, cache_control: str = None, send=None):
+    response, _ = await cached_request("generate", {
         "model": "codellama",
         "stream": False,
+        "options": {"temperature": 0},
         "prompt": prompt  # make sure this is a plain string
-    })
+    }, cache_control, send)
     return response
 
@@ -1,108 +1,152 @@
-from sqlalchemy.orm import Session
+import logging
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from ..models.chat_models import ChatSession, ChatConversations
 from uuid import uuid4
 from datetime import datetime,timezone
-from src.database.db import SessionLocal
+from src.database.db import AsyncSessionLocal
+from .pagination import keyset
+
+logger = logging.getLogger(__name__)
 
-def generate_uuid(db: Session):
+async def generate_uuid(db: AsyncSession):
     new_id = str(uuid4())
     db.add(ChatSession(id=new_id))
-    db.commit()
+    await db.commit()
     return new_id
 
-def edit_title(db: Session, session_id: str, new_title: str):
-    chat = db.query(ChatSession).filter(ChatSession.id == session_id).first()
+async def edit_title(db: AsyncSession, session_id: str, new_title: str):
+    chat = await db.get(ChatSession, session_id)
     if chat:
         chat.title = new_title
         chat.modified_at = datetime.now(timezone.utc)
-        db.commit()
-
-def save_conversation(session_id: str, user_message: str, assistant_message: str):
-    db: Session = SessionLocal()
-    try:
-        current = datetime.now(timezone.utc)        # Create user message
-        conversation = ChatConversations(
-            id=str(uuid4()),
-            session_id=session_id,
-            user_message=user_message,
-            assistant_response=assistant_message
-        )
-        db.add(conversation)
-        db.commit()
-        print("Conversation saved successfully.")
-    except Exception as e:
-        db.rollback()
-        print(f"Error saving conversation: {e}")
-    finally:
-        db.close()
-
-def get_chat_history(session_id: str):
-    db: Session = SessionLocal()
-    try:
-        conversations = db.query(ChatConversations).filter(
-            ChatConversations.session_id == session_id
-        ).order_by(ChatConversations.created_at).all()
-        return conversations
-    except Exception as e:
-        print(f"Error retrieving conversations: {e}")
-        return []
-    finally:
-        db.close()
-
-def edit_conversation(
+        await db.commit()
+
+async def save_conversation(session_id: str, user_message: str, assistant_message: str):
+    """
+    Store one chat turn as a single unit of work: insert the exchange, name an
+    untitled session after its first question and bump ``modified_at``, all in
+    one transaction.
+    """
+    async with AsyncSessionLocal() as db:
+        try:
+            current = datetime.now(timezone.utc)
+            db.add(ChatConversations(
+                id=str(uuid4()),
+                session_id=session_id,
+                user_message=user_message,
+                assistant_response=assistant_message,
+                created_at=current,
+                modified_at=current
+            ))
+            session = await db.get(ChatSession, session_id)
+            if session:
+                # Set chat title to first user message if not already set
+                if session.title == "New Chat":
+                    session.title = user_message[:100]  # Limit title length if needed
+                session.modified_at = current
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            logger.exception(f"Error saving conversation for session {session_id}")
+            raise
+
+async def get_chat_history(session_id: str, limit: int = None, cursor: str = None, descending: bool = False):
+    """
+    Turns of a session in time order, as lightweight rows rather than ORM objects.
+
+    With ``limit`` one extra row is fetched so callers can tell whether
+    another page follows; ``cursor`` continues after a previous page (a
+    malformed one raises ``ValueError``).
+    """
+    async with AsyncSessionLocal() as db:
+        try:
+            statement = keyset(
+                select(
+                    ChatConversations.id,
+                    ChatConversations.user_message,
+                    ChatConversations.assistant_response,
+                    ChatConversations.created_at,
+                    ChatConversations.modified_at
+                ).where(ChatConversations.session_id == session_id),
+                ChatConversations.created_at, ChatConversations.id, cursor, descending
+            )
+            if limit is not None:
+                statement = statement.limit(limit + 1)
+            result = await db.execute(statement)
+            return result.all()
+        except ValueError:
+            raise
+        except Exception:
+            logger.exception(f"Error retrieving conversations for session {session_id}")
+            return []
+
+def model_usage_query():
+    """Sessions and messages per model, as two grouped aggregates instead of a COUNT per session."""
+    per_session = select(
+        ChatConversations.session_id.label("session_id"),
+        func.count().label("messages")
+    ).group_by(ChatConversations.session_id).subquery()
+    return select(
+        ChatSession.model,
+        func.count(ChatSession.id),
+        func.coalesce(func.sum(per_session.c.messages), 0)
+    ).outerjoin(
+        per_session, per_session.c.session_id == ChatSession.id
+    ).where(ChatSession.model.isnot(None)).group_by(ChatSession.model)
+
+async def get_model_usage(db: AsyncSession):
+    rows = (await db.execute(model_usage_query())).all()
+    return {model: {"sessions": sessions, "messages": int(messages)} for model, sessions, messages in rows}
+
+async def edit_conversation(
     message_id: str, new_user_msg: str = None, new_assistant_msg: str = None):
     # Input validation
     if not message_id or not message_id.strip():
         return {"success": False, "error": "Invalid message ID"}
-    
+
     if new_user_msg is None and new_assistant_msg is None:
         return {"success": False, "error": "At least one field must be provided for update"}
 
-    db: Session = SessionLocal()
-    try:
-        conversation = db.query(ChatConversations).filter(
-            ChatConversations.id == message_id.strip()
-        ).first()
-        
-        if not conversation:
-            return {"success": False, "error": "Conversation not found"}
-
-        # Track what was updated
-        updates = []
-        
-        if new_user_msg is not None:
-            old_msg = conversation.user_message
-            conversation.user_message = new_user_msg
-            updates.append(f"user_message: '{old_msg[:30]}...' -> '{new_user_msg[:30]}...'")
-            
-        if new_assistant_msg is not None:
-            old_msg = conversation.assistant_response or ""
-            conversation.assistant_response = new_assistant_msg
-            updates.append(f"assistant_response: '{old_msg[:30]}...' -> '{new_assistant_msg[:30]}...'")
-
-        # Update timestamps
-        conversation.modified_at = datetime.now(timezone.utc)
-        if conversation.session:
-            conversation.session.modified_at = datetime.now(timezone.utc)
-
-        db.commit()
-        
-        print(f"Updated conversation {message_id}: {'; '.join(updates)}")
-        
-        return {
-            "success": True,
-            "message": "Conversation updated successfully",
-            "conversation_id": message_id,
-            "updates": len(updates)
-        }
-
-    except Exception as e:
-        db.rollback()
-        print(f"Error updating conversation {message_id}: {e}")
-        return {"success": False, "error": f"Database error: {str(e)}"}
-    
-    finally:
-        db.close()
+    async with AsyncSessionLocal() as db:
+        try:
+            conversation = await db.get(ChatConversations, message_id.strip())
+
+            if not conversation:
+                return {"success": False, "error": "Conversation not found"}
+
+            # Track what was updated
+            updates = []
+
+            if new_user_msg is not None:
+                old_msg = conversation.user_message
+                conversation.user_message = new_user_msg
+                updates.append(f"user_message: '{old_msg[:30]}...' -> '{new_user_msg[:30]}...'")
+
+            if new_assistant_msg is not None:
+                old_msg = conversation.assistant_response or ""
+                conversation.assistant_response = new_assistant_msg
+                updates.append(f"assistant_response: '{old_msg[:30]}...' -> '{new_assistant_msg[:30]}...'")
+
+            # Update timestamps
+            conversation.modified_at = datetime.now(timezone.utc)
+            session = await db.get(ChatSession, conversation.session_id)
+            if session:
+                session.modified_at = datetime.now(timezone.utc)
+
+            await db.commit()
 
+            print(f"Updated conversation {message_id}: {'; '.join(updates)}")
 
+            return {
+                "success": True,
+                "message": "Conversation updated successfully",
+                "conversation_id": message_id,
+                "updates": len(updates)
+            }
 
+        except Exception as e:
+            await db.rollback()
+            print(f"Error updating conversation {message_id}: {e}")
+            return {"success": False, "error": f"Database error: {str(e)}"}
@@ -0,0 +1,168 @@
+import html
+import re
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from sqlalchemy import literal_column, select, text
+from sqlalchemy.sql import column, table
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import config
+from ..database.fts import FTS_TABLE
+from ..models.chat_models import ChatSession, ChatConversations
+
+# Highlight markers that cannot occur in chat text; swapped for <mark> after escaping
+_OPEN, _CLOSE = "\x02", "\x03"
+_TERMS = re.compile(r'"([^"]*)"|(\S+)')
+
+_fts = table(FTS_TABLE, column("rowid"), column("rank"))
+
+
+def _quote(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+def build_match_query(q: str, mode: str = "all") -> Optional[str]:
+    """
+    Turn free text into an FTS5 query without exposing its syntax.
+
+    Words are matched as terms (stemmed, case and accent insensitive),
+    ``"quoted text"`` as a phrase and ``word*`` as a prefix of the stemmed
+    words (``replic*`` finds replication and replicating). With
+    ``mode="all"`` every term must occur, with ``"any"`` one is enough.
+    """
+    parts = []
+    for phrase, word in _TERMS.findall(q):
+        if phrase.strip():
+            parts.append(_quote(phrase.strip()))
+        elif word:
+            prefix = word.endswith("*")
+            word = word.rstrip("*")
+            if word:
+                parts.append(_quote(word) + ("*" if prefix else ""))
+    if not parts:
+        return None
+    return (" OR " if mode == "any" else " AND ").join(parts)
+
+
+def _snippet(index: int, tokens: int):
+    return literal_column(
+        f"snippet({FTS_TABLE}, {index}, '{_OPEN}', '{_CLOSE}', '…', {tokens})"
+    )
+
+
+def _utc(moment: datetime) -> datetime:
+    # Turns are stored in UTC; naive bounds are taken as UTC too
+    return moment.astimezone(timezone.utc) if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+
+def _highlight(fragment: Optional[str]) -> Optional[str]:
+    if fragment is None:
+        return None
+    return html.escape(fragment).replace(_OPEN, "<mark>").replace(_CLOSE, "</mark>")
+
+
+def _filtered(columns, match: str, model, session_id, date_from, date_to):
+    statement = select(*columns).select_from(
+        _fts
+    ).join(
+        ChatConversations, literal_column("chat_convs.rowid") == _fts.c.rowid
+    ).join(
+        ChatSession, ChatSession.id == ChatConversations.session_id
+    ).where(
+        text(f"{FTS_TABLE} MATCH :match").bindparams(match=match)
+    )
+    if model is not None:
+        statement = statement.where(ChatSession.model == model)
+    if session_id is not None:
+        statement = statement.where(ChatConversations.session_id == session_id)
+    if date_from is not None:
+        statement = statement.where(ChatConversations.created_at >= _utc(date_from))
+    if date_to is not None:
+        statement = statement.where(ChatConversations.created_at < _utc(date_to))
+    return statement
+
+
+async def _rank_floor(db: AsyncSession, match: str, *filters) -> Optional[int]:
+    """
+    Lowest rowid among the newest ``SEARCH_RANK_WINDOW`` matches, or None
+    when every match can be ranked.
+
+    BM25 is computed for each matching turn, so a term found in most of a
+    large history would cost seconds; such queries rank the newest window
+    only. Walking the index in rowid order to find its edge is cheap.
+    """
+    window = config.SEARCH_RANK_WINDOW
+    if window <= 0:
+        return None
+    statement = _filtered([_fts.c.rowid], match, *filters).order_by(_fts.c.rowid.desc()).offset(window - 1).limit(1)
+    return (await db.execute(statement)).scalar()
+
+
+async def search_conversations(
+    db: AsyncSession,
+    q: str,
+    mode: str = "all",
+    model: Optional[str] = None,
+    session_id: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    order: str = "relevance",
+    limit: int = 20,
+    offset: int = 0,
+    snippet_tokens: int = 16
+) -> dict:
+    """
+    Ranked full-text search over every chat turn.
+
+    Matching and BM25 ranking run inside the FTS index, which is then joined
+    to the turns and sessions by rowid for the model, session and date
+    filters. ``order="recent"`` walks the index newest-stored first instead
+    of ranking. Snippets are HTML-escaped with matches wrapped in ``<mark>``.
+    """
+    match = build_match_query(q, mode)
+    if match is None:
+        return {"results": [], "has_more": False, "ranked_window": None}
+
+    filters = (model, session_id, date_from, date_to)
+    statement = _filtered([
+        ChatConversations.id,
+        ChatConversations.session_id,
+        ChatConversations.created_at,
+        ChatSession.title,
+        ChatSession.model,
+        _fts.c.rank,
+        _snippet(0, snippet_tokens).label("user_snippet"),
+        _snippet(1, snippet_tokens).label("assistant_snippet")
+    ], match, *filters)
+    floor = None
+    if order == "recent":
+        statement = statement.order_by(_fts.c.rowid.desc())
+    else:
+        # A single session is searched through its own index and always ranked in full
+        if session_id is None:
+            floor = await _rank_floor(db, match, *filters)
+        if floor is not None:
+            statement = statement.where(_fts.c.rowid >= floor)
+        # FTS5 rank is bm25(): lower is a better match
+        statement = statement.order_by(_fts.c.rank, _fts.c.rowid.desc())
+
+    rows = (await db.execute(statement.limit(limit + 1).offset(offset))).all()
+    results: List[dict] = [
+        {
+            "message_id": row.id,
+            "session_id": row.session_id,
+            "session_title": row.title,
+            "model": row.model,
+            "created_at": row.created_at.isoformat(),
+            "score": round(-row.rank, 4),
+            "user_snippet": _highlight(row.user_snippet),
+            "assistant_snippet": _highlight(row.assistant_snippet)
+        }
+        for row in rows[:limit]
+    ]
+    return {
+        "results": results,
+        "has_more": len(rows) > limit,
+        "ranked_window": config.SEARCH_RANK_WINDOW if floor is not None else None
+    }
@@ -0,0 +1,364 @@
+import asyncio
+import json
+import logging
+import time
+from contextlib import aclosing
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+from uuid import uuid4
+
+from sqlalchemy import insert, select
+from starlette.concurrency import run_in_threadpool
+
+from .. import config
+from ..database.db import AsyncSessionLocal
+from ..models.chat_models import ChatSession, ChatConversations
+from .rag_instance import rag
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMAT = "privateprompt-chats"
+EXPORT_VERSION = 1
+
+
+def _iso(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+def _parse_time(value: Optional[str], default: datetime) -> datetime:
+    if not value:
+        return default
+    parsed = datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _line(record: Dict[str, Any]) -> str:
+    return json.dumps(record, ensure_ascii=False) + "\n"
+
+
+# ----- export ----------------------------------------------------------------------
+
+def _export_statement(session_id: Optional[str]):
+    statement = select(
+        ChatSession.id.label("session_id"),
+        ChatSession.title,
+        ChatSession.model,
+        ChatSession.created_at.label("session_created_at"),
+        ChatSession.modified_at.label("session_modified_at"),
+        ChatConversations.id.label("turn_id"),
+        ChatConversations.user_message,
+        ChatConversations.assistant_response,
+        ChatConversations.created_at.label("turn_created_at"),
+        ChatConversations.modified_at.label("turn_modified_at"),
+    ).outerjoin(ChatConversations, ChatConversations.session_id == ChatSession.id)
+    if session_id is not None:
+        statement = statement.where(ChatSession.id == session_id)
+    # Sessions in primary-key order and each session's turns through the
+    # (session_id, created_at) index, so the database streams without a sort step
+    return statement.order_by(ChatSession.id, ChatConversations.created_at).execution_options(
+        yield_per=config.EXPORT_FETCH_ROWS
+    )
+
+
+async def _export_rows(session_id: Optional[str] = None):
+    """
+    Batches of session/turn rows from a server-side cursor; memory stays flat
+    whatever the database size. Fetching per batch rather than per row keeps
+    the async driver's per-call overhead off the hot loop.
+    """
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(_export_statement(session_id))
+        try:
+            async for rows in result.partitions(config.EXPORT_FETCH_ROWS):
+                yield rows
+        finally:
+            # Also when the client disconnects mid-export; an open cursor would leak its connection
+            await result.close()
+
+
+def _session_record(row) -> Dict[str, Any]:
+    return {
+        "type": "session",
+        "session_id": row.session_id,
+        "title": row.title,
+        "model": row.model,
+        "created_at": _iso(row.session_created_at),
+        "modified_at": _iso(row.session_modified_at),
+    }
+
+
+def _turn_record(row) -> Dict[str, Any]:
+    return {
+        "type": "turn",
+        "session_id": row.session_id,
+        "id": row.turn_id,
+        "user_message": row.user_message,
+        "assistant_response": row.assistant_response,
+        "created_at": _iso(row.turn_created_at),
+        "modified_at": _iso(row.turn_modified_at),
+    }
+
+
+async def export_ndjson(session_id: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    One session, or every session, as NDJSON.
+
+    A header line is followed by a ``session`` line per session, each
+    followed by that session's ``turn`` lines in time order. This is the
+    format ``import_chats`` reads.
+    """
+    yield _line({
+        "type": "export",
+        "format": EXPORT_FORMAT,
+        "version": EXPORT_VERSION,
+        "exported_at": datetime.now(timezone.utc).isoformat(),
+    })
+    current = None
+    async with aclosing(_export_rows(session_id)) as batches:
+        async for rows in batches:
+            lines = []
+            for row in rows:
+                if row.session_id != current:
+                    current = row.session_id
+                    lines.append(_line(_session_record(row)))
+                if row.turn_id is not None:
+                    lines.append(_line(_turn_record(row)))
+            yield "".join(lines)
+
+
+async def export_session_json(session_id: str) -> AsyncIterator[str]:
+    """A single session in the original JSON export layout, written incrementally."""
+    started = False
+    separator = ""
+    async with aclosing(_export_rows(session_id)) as batches:
+        async for rows in batches:
+            parts = []
+            for row in rows:
+                if not started:
+                    started = True
+                    header = json.dumps({
+                        "session_id": row.session_id,
+                        "title": row.title,
+                        "model": row.model,
+                        "created_at": _iso(row.session_created_at),
+                    }, ensure_ascii=False)
+                    parts.append(header[:-1] + ', "conversations": [')
+                if row.turn_id is not None:
+                    parts.append(separator + json.dumps({
+                        "user_message": row.user_message,
+                        "assistant_response": row.assistant_response,
+                        "created_at": _iso(row.turn_created_at),
+                        "modified_at": _iso(row.turn_modified_at),
+                    }, ensure_ascii=False))
+                    separator = ","
+            yield "".join(parts)
+    if started:
+        yield "]}"
+
+
+# ----- import ----------------------------------------------------------------------
+
+class ChatImportError(Exception):
+    """An import stopped early; ``stats`` shows what was committed before the failure."""
+
+    def __init__(self, message: str, stats: Dict[str, Any]):
+        super().__init__(message)
+        self.stats = stats
+
+
+async def iter_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[Dict[str, Any]]:
+    """Parse an NDJSON byte stream line by line without holding the whole body."""
+    buffer = b""
+    number = 0
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            number += 1
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"Line {number} is not valid JSON: {e}")
+    if buffer.strip():
+        try:
+            yield json.loads(buffer)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Line {number + 1} is not valid JSON: {e}")
+
+
+def records_from_json(document: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Records for a single session saved with the JSON export (``/export/{session_id}``)."""
+    if "session_id" not in document or "conversations" not in document:
+        raise ValueError("JSON import expects a single-session export with 'session_id' and 'conversations'")
+    yield {"type": "session", **{k: v for k, v in document.items() if k != "conversations"}}
+    for conversation in document["conversations"]:
+        yield {"type": "turn", "session_id": document["session_id"], **conversation}
+
+
+class ChatImporter:
+    """
+    Bulk-load exported sessions and turns.
+
+    Records are inserted in batches of ``IMPORT_BATCH_SIZE`` turns, one
+    executemany and one commit per batch. Sessions whose id already exists
+    are skipped together with their turns, unless ``remap_ids`` imports
+    everything as copies under fresh ids. With ``reindex`` each committed
+    batch is embedded into the RAG store in the background while the next
+    batch is being inserted.
+    """
+
+    def __init__(self, remap_ids: bool = False, reindex: bool = True, batch_size: int = config.IMPORT_BATCH_SIZE):
+        self.remap_ids = remap_ids
+        # Callers load RAG first (``rag.ensure_loaded``); add_many skips the batches otherwise
+        self.reindex = reindex
+        self.batch_size = max(1, batch_size)
+        # Exported session id -> id in this database, None when skipped
+        self._session_ids: Dict[str, Optional[str]] = {}
+        self._sessions: List[Dict[str, Any]] = []
+        self._turns: List[Dict[str, Any]] = []
+        self._rag_task: Optional[asyncio.Future] = None
+        self._started = time.perf_counter()
+        self.stats = {
+            "sessions_imported": 0,
+            "sessions_skipped": 0,
+            "turns_imported": 0,
+            "turns_skipped": 0,
+            "rag_documents": 0,
+            "batches": 0,
+        }
+
+    async def add(self, record: Dict[str, Any]) -> None:
+        kind = record.get("type")
+        if kind == "session":
+            if not record.get("session_id"):
+                raise ValueError("Session record without session_id")
+            self._sessions.append(record)
+        elif kind == "turn":
+            if not record.get("session_id") or record.get("user_message") is None:
+                raise ValueError("Turn record needs session_id and user_message")
+            self._turns.append(record)
+        elif kind == "export":
+            if record.get("format") != EXPORT_FORMAT or record.get("version", 0) > EXPORT_VERSION:
+                raise ValueError(f"Unsupported export: {record.get('format')} v{record.get('version')}")
+        else:
+            raise ValueError(f"Unknown record type: {kind!r}")
+        if len(self._turns) >= self.batch_size or len(self._sessions) >= self.batch_size:
+            await self.flush()
+
+    async def _resolve_sessions(self, db, now: datetime) -> List[Dict[str, Any]]:
+        """Decide which pending sessions get inserted and under which id."""
+        existing = set()
+        if not self.remap_ids:
+            ids = [record["session_id"] for record in self._sessions]
+            existing = set((await db.execute(select(ChatSession.id).where(ChatSession.id.in_(ids)))).scalars())
+        rows = []
+        for record in self._sessions:
+            source_id = record["session_id"]
+            if source_id in self._session_ids or source_id in existing:
+                self._session_ids.setdefault(source_id, None)
+                self.stats["sessions_skipped"] += 1
+                continue
+            target_id = str(uuid4()) if self.remap_ids else source_id
+            self._session_ids[source_id] = target_id
+            created = _parse_time(record.get("created_at"), now)
+            rows.append({
+                "id": target_id,
+                "title": record.get("title") or "New Chat",
+                "model": record.get("model"),
+                "created_at": created,
+                "modified_at": _parse_time(record.get("modified_at"), created),
+            })
+        return rows
+
+    def _turn_rows(self, now: datetime) -> List[Dict[str, Any]]:
+        rows = []
+        for record in self._turns:
+            # Turns of skipped sessions, or of sessions missing from the file, are dropped
+            target_id = self._session_ids.get(record["session_id"])
+            if target_id is None:
+                self.stats["turns_skipped"] += 1
+                continue
+            created = _parse_time(record.get("created_at"), now)
+            rows.append({
+                "id": str(uuid4()) if self.remap_ids or not record.get("id") else record["id"],
+                "session_id": target_id,
+                "user_message": record["user_message"],
+                "assistant_response": record.get("assistant_response"),
+                "created_at": created,
+                "modified_at": _parse_time(record.get("modified_at"), created),
+            })
+        return rows
+
+    async def flush(self) -> None:
+        if not self._sessions and not self._turns:
+            return
+        now = datetime.now(timezone.utc)
+        async with AsyncSessionLocal() as db:
+            try:
+                session_rows = await self._resolve_sessions(db, now) if self._sessions else []
+                turn_rows = self._turn_rows(now)
+                # Core executemany on the tables; the ORM bulk path adds per-row bookkeeping
+                if session_rows:
+                    await db.execute(insert(ChatSession.__table__), session_rows)
+                if turn_rows:
+                    await db.execute(insert(ChatConversations.__table__), turn_rows)
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+        self._sessions, self._turns = [], []
+        self.stats["sessions_imported"] += len(session_rows)
+        self.stats["turns_imported"] += len(turn_rows)
+        self.stats["batches"] += 1
+        if self.reindex and turn_rows:
+            await self._queue_reindex(turn_rows)
+
+    async def _queue_reindex(self, turn_rows: List[Dict[str, Any]]) -> None:
+        texts, metadatas = [], []
+        for row in turn_rows:
+            texts.append(row["user_message"])
+            metadatas.append({"type": "user_message", "session_id": row["session_id"]})
+            if row["assistant_response"]:
+                texts.append(row["assistant_response"])
+                metadatas.append({"type": "assistant_response", "session_id": row["session_id"]})
+        # At most one batch embeds while the next one is inserted
+        await self._wait_reindex()
+        self._rag_task = asyncio.ensure_future(run_in_threadpool(rag.add_many, texts, metadatas))
+
+    async def _wait_reindex(self) -> None:
+        if self._rag_task is not None:
+            self.stats["rag_documents"] += await self._rag_task
+            self._rag_task = None
+
+    async def abort(self) -> None:
+        """Drop records not yet inserted; committed batches stay."""
+        self._sessions, self._turns = [], []
+        try:
+            await self._wait_reindex()
+        except Exception as e:
+            logger.warning(f"RAG reindex of imported turns failed: {e}")
+
+    async def finish(self) -> Dict[str, Any]:
+        try:
+            await self.flush()
+        finally:
+            await self._wait_reindex()
+        return {**self.stats, "elapsed_s": round(time.perf_counter() - self._started, 2)}
+
+
+async def import_chats(records, remap_ids: bool = False, reindex: bool = True) -> Dict[str, Any]:
+    """Import records from an async or plain iterator; see ``ChatImporter``."""
+    # Loading the embedding model blocks, so it happens off the event loop
+    importer = ChatImporter(remap_ids=remap_ids, reindex=reindex and await rag.ensure_loaded())
+    try:
+        if hasattr(records, "__aiter__"):
+            async for record in records:
+                await importer.add(record)
+        else:
+            for record in records:
+                await importer.add(record)
+        return await importer.finish()
+    except Exception as e:
+        await importer.abort()
+        raise ChatImportError(str(e), dict(importer.stats)) from e
@@ -0,0 +1,184 @@
+import math
+import re
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .. import config
+from .ollama_client import ollama
+
+# Chat templates add a few tokens around every message
+MESSAGE_OVERHEAD = 4
+_PIECES = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+
+class TokenCounter:
+    """
+    Fast per-model token estimate.
+
+    Words cost roughly one token per four characters and punctuation one
+    token each. The estimate is calibrated per model from the
+    ``prompt_eval_count`` Ollama returns, so it converges on the real
+    tokenizer without shipping one.
+    """
+
+    def __init__(self):
+        self._scale: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _raw(text: str) -> int:
+        count = 0
+        for piece in _PIECES.findall(text):
+            count += math.ceil(len(piece) / 4) if piece[0].isalnum() or piece[0] == "_" else 1
+        return count
+
+    def count(self, model: str, text: str) -> int:
+        return math.ceil(self._raw(text) * self._scale.get(model, 1.0))
+
+    def count_messages(self, model: str, messages: Sequence[Dict[str, str]]) -> int:
+        return sum(self.count(model, m["content"]) + MESSAGE_OVERHEAD for m in messages)
+
+    def calibrate(self, model: str, messages: Sequence[Dict[str, str]], prompt_eval_count: Optional[int]):
+        """Blend in the ratio between Ollama's real prompt token count and our raw estimate."""
+        if not prompt_eval_count:
+            return
+        raw = sum(self._raw(m["content"]) + MESSAGE_OVERHEAD for m in messages)
+        if not raw:
+            return
+        ratio = prompt_eval_count / raw
+        current = self._scale.get(model, 1.0)
+        # A much smaller count means Ollama reused its KV cache; not a tokenizer signal
+        if ratio < 0.8 * current or not 0.5 <= ratio <= 2.0:
+            return
+        with self._lock:
+            self._scale[model] = 0.8 * current + 0.2 * ratio
+
+    def scale(self, model: str) -> float:
+        return self._scale.get(model, 1.0)
+
+
+token_counter = TokenCounter()
+_context_lengths: Dict[str, Optional[int]] = {}
+
+
+async def model_context_length(model: str) -> Optional[int]:
+    """Trained context length from ``/api/show``, cached per model."""
+    if model not in _context_lengths:
+        info = await ollama.request("show", "POST", {"model": model})
+        if "error" in info:
+            return None  # don't cache failures
+        length = None
+        for key, value in (info.get("model_info") or {}).items():
+            if key.endswith(".context_length"):
+                length = int(value)
+                break
+        _context_lengths[model] = length
+    return _context_lengths[model]
+
+
+def forget_context_length(model: str) -> None:
+    """Look the context length up again next time, e.g. after the model was re-pulled."""
+    base = model.split(":")[0]
+    for name in [n for n in _context_lengths if n == model or n.split(":")[0] == base]:
+        del _context_lengths[name]
+
+
+def token_budget(model_context: Optional[int]) -> int:
+    budget = config.OLLAMA_NUM_CTX or config.CONTEXT_TOKEN_BUDGET
+    return min(budget, model_context) if model_context else budget
+
+
+def assemble_context(
+    model: str,
+    question: str,
+    history: Sequence[Tuple[str, Optional[str]]],
+    first_turn_index: int,
+    rag_chunks: Sequence[str],
+    budget: int,
+    summary: Optional[str] = None,
+    counter: TokenCounter = token_counter,
+) -> Tuple[List[Dict[str, str]], dict]:
+    """
+    Fit history, RAG chunks and the question into ``budget`` tokens.
+
+    ``history`` holds (user, assistant) turns in chronological order and
+    ``first_turn_index`` is the absolute position of its first turn within
+    the session. Old turns are dropped in blocks aligned to those absolute
+    positions, so the history prefix (and Ollama's KV cache for it) stays
+    identical from one request to the next until a whole block is evicted.
+    A running ``summary`` of turns before the history, if any, goes first.
+    Everything that changes per request (RAG context, question) comes last.
+
+    Returns the messages and a per-part token breakdown.
+    """
+    available = budget - config.CONTEXT_RESPONSE_RESERVE
+    question_tokens = counter.count(model, question) + MESSAGE_OVERHEAD
+
+    summary_message = None
+    summary_tokens = 0
+    if summary:
+        summary_message = {"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"}
+        summary_tokens = counter.count_messages(model, [summary_message])
+
+    remaining = max(0, available - question_tokens - summary_tokens)
+
+    # RAG chunks in ranked order, up to their share of what is left
+    rag_limit = int(remaining * config.CONTEXT_RAG_SHARE)
+    header = "Use the following context to inform your response when relevant:\n"
+    rag_tokens = counter.count(model, header) + MESSAGE_OVERHEAD if rag_chunks else 0
+    used_chunks: List[str] = []
+    for chunk in rag_chunks:
+        cost = counter.count(model, chunk) + 1
+        if rag_tokens + cost > rag_limit:
+            break
+        used_chunks.append(chunk)
+        rag_tokens += cost
+    if not used_chunks:
+        rag_tokens = 0
+    history_limit = remaining - rag_tokens
+
+    # Per-turn costs, then the first block-aligned start that fits
+    turn_messages = []
+    turn_costs = []
+    for user_message, assistant_response in history:
+        messages = [{"role": "user", "content": user_message}]
+        if assistant_response:
+            messages.append({"role": "assistant", "content": assistant_response})
+        turn_messages.append(messages)
+        turn_costs.append(counter.count_messages(model, messages))
+
+    block = max(1, config.CONTEXT_HISTORY_BLOCK)
+    start = 0
+    suffix = sum(turn_costs)
+    while start < len(history) and suffix > history_limit:
+        # Advance to the next absolute block boundary
+        next_start = min(len(history), ((first_turn_index + start) // block + 1) * block - first_turn_index)
+        suffix -= sum(turn_costs[start:next_start])
+        start = next_start
+
+    messages: List[Dict[str, str]] = []
+    if summary_message:
+        messages.append(summary_message)
+    for turn in turn_messages[start:]:
+        messages.extend(turn)
+    prefix_tokens = summary_tokens + suffix
+    if used_chunks:
+        messages.append({"role": "system", "content": header + "\n\n".join(used_chunks)})
+    messages.append({"role": "user", "content": question})
+
+    breakdown = {
+        "budget": budget,
+        "reserved_for_response": config.CONTEXT_RESPONSE_RESERVE,
+        "summary": summary_tokens,
+        "history": suffix,
+        "history_turns": len(history) - start,
+        "dropped_turns": start,
+        "rag": rag_tokens,
+        "rag_chunks": len(used_chunks),
+        "rag_chunks_dropped": len(rag_chunks) - len(used_chunks),
+        "question": question_tokens,
+        "total": prefix_tokens + rag_tokens + question_tokens,
+        "stable_prefix": prefix_tokens,
+        "estimate_scale": round(counter.scale(model), 3),
+    }
+    return messages, breakdown
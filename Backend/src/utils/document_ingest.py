@@ -0,0 +1,401 @@
+import asyncio
+import codecs
+import logging
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+import numpy as np
+from fastapi import UploadFile
+from starlette.concurrency import run_in_threadpool
+
+from .. import config
+from . import ingest_worker
+from .context_builder import token_counter
+from .metrics import stage
+from .rag_instance import rag
+
+logger = logging.getLogger(__name__)
+
+# Upload suffix -> parser
+DOCUMENT_KINDS = {".pdf": "pdf", ".txt": "text", ".text": "text", ".md": "text", ".markdown": "text"}
+_CONTENT_TYPES = {"application/pdf": "pdf", "text/plain": "text", "text/markdown": "text", "text/x-markdown": "text"}
+_SENTENCE_END = re.compile(r"(?<=[.!?;:])\s+|\n\s*\n")
+# Words hyphenated across a line break in extracted PDF text
+_HYPHEN_BREAK = re.compile(r"(\w)-\n(\w)")
+_WHITESPACE = re.compile(r"\s+")
+# Plain text is read in blocks of this many characters, cut at a paragraph break
+_TEXT_BLOCK_CHARS = 64 * 1024
+
+
+class DocumentError(Exception):
+    """The upload is not a document we can ingest."""
+
+
+def document_kind(filename: Optional[str], content_type: Optional[str]) -> str:
+    suffix = os.path.splitext(filename or "")[1].lower()
+    kind = DOCUMENT_KINDS.get(suffix) or _CONTENT_TYPES.get((content_type or "").split(";")[0].strip().lower())
+    if kind is None:
+        raise DocumentError(f"Unsupported document type {suffix or content_type!r}; upload a PDF, text or markdown file")
+    return kind
+
+
+class TokenChunker:
+    """
+    Cut a stream of text into chunks of at most ``max_tokens`` estimated
+    tokens, on sentence boundaries where possible, each starting with the
+    last ``overlap_tokens`` of the previous one. Chunks may span pages;
+    each remembers the page it starts on.
+    """
+
+    def __init__(self, max_tokens: int = config.DOC_CHUNK_TOKENS, overlap_tokens: int = config.DOC_CHUNK_OVERLAP_TOKENS,
+                 model: str = "embedding"):
+        self.max_tokens = max_tokens
+        self.overlap_tokens = min(overlap_tokens, max_tokens // 2)
+        self.model = model
+        self._units: Deque[Tuple[str, int, int]] = deque()
+        self._tokens = 0
+        self._fresh = False
+
+    def _pieces(self, text: str) -> List[Tuple[str, int]]:
+        pieces = []
+        for sentence in _SENTENCE_END.split(text):
+            sentence = _WHITESPACE.sub(" ", sentence).strip()
+            if not sentence:
+                continue
+            tokens = token_counter.count(self.model, sentence)
+            if tokens <= self.max_tokens:
+                pieces.append((sentence, tokens))
+                continue
+            # A run-on "sentence" (tables, code) is cut by words
+            words, size = [], 0
+            for word in sentence.split(" "):
+                cost = token_counter.count(self.model, word)
+                if words and size + cost > self.max_tokens:
+                    pieces.append((" ".join(words), size))
+                    words, size = [], 0
+                words.append(word)
+                size += cost
+            if words:
+                pieces.append((" ".join(words), size))
+        return pieces
+
+    def feed(self, text: str, page: int) -> List[Tuple[str, int]]:
+        """Add text from ``page``; returns the ``(chunk, first_page)`` pairs completed by it."""
+        done = []
+        for piece, tokens in self._pieces(text):
+            if self._fresh and self._tokens + tokens > self.max_tokens:
+                done.append(self._emit())
+            self._units.append((piece, tokens, page))
+            self._tokens += tokens
+            self._fresh = True
+        return done
+
+    def finish(self) -> List[Tuple[str, int]]:
+        return [self._emit()] if self._fresh else []
+
+    def _emit(self) -> Tuple[str, int]:
+        chunk = (" ".join(unit[0] for unit in self._units), self._units[0][2])
+        # Carry the tail over so a passage cut here is still whole in one chunk
+        kept: Deque[Tuple[str, int, int]] = deque()
+        tokens = 0
+        while self._units and tokens + self._units[-1][1] <= self.overlap_tokens:
+            unit = self._units.pop()
+            kept.appendleft(unit)
+            tokens += unit[1]
+        self._units, self._tokens, self._fresh = kept, tokens, False
+        return chunk
+
+
+# ----- worker pool -----------------------------------------------------------------
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _process_pool() -> Optional[ProcessPoolExecutor]:
+    """Process pool for PDF parsing and embedding; None runs both on threads in this process."""
+    global _pool
+    if config.DOC_INGEST_PROCESSES <= 0:
+        return None
+    if _pool is None:
+        threads = max(1, (os.cpu_count() or 1) // (config.DOC_INGEST_PROCESSES + 1))
+        # spawn: forking a process that runs torch and an event loop is not safe
+        _pool = ProcessPoolExecutor(
+            config.DOC_INGEST_PROCESSES,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=ingest_worker.init_worker,
+            initargs=(threads,)
+        )
+    return _pool
+
+
+async def _run(fn, *args):
+    pool = _process_pool()
+    if pool is None:
+        return await run_in_threadpool(fn, *args)
+    try:
+        return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+    except BrokenProcessPool:
+        # A worker died (e.g. out of memory); start a fresh pool for the next job
+        shutdown_pool()
+        raise
+
+
+def shutdown_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _embed_in_process(texts: List[str]) -> np.ndarray:
+    raw = getattr(rag.embedding, "embeddings", rag.embedding)
+    return np.asarray(raw.embed_documents(texts), dtype=np.float32)
+
+
+async def _embed(texts: List[str]) -> List[np.ndarray]:
+    """Embed through the embedding cache; only misses go to the pool, in one call."""
+    cache = getattr(rag.embedding, "cache", None)
+    name = getattr(rag.embedding, "model_name", None)
+    vectors = await run_in_threadpool(cache.get_many, name, texts) if cache is not None else [None] * len(texts)
+    missing = [i for i, v in enumerate(vectors) if v is None]
+    if missing:
+        batch = [texts[i] for i in missing]
+        with stage("embedding"):
+            if _process_pool() is None:
+                computed = await run_in_threadpool(_embed_in_process, batch)
+            else:
+                computed = await _run(ingest_worker.embed_texts, rag.embedding_model, batch)
+        if cache is not None:
+            # Retrieval re-reads chunk vectors through this cache
+            await run_in_threadpool(cache.put_many, name, batch, computed)
+        for i, vector in zip(missing, computed):
+            vectors[i] = vector
+    return vectors
+
+
+# ----- jobs ------------------------------------------------------------------------
+
+class IngestJob:
+    def __init__(self, path: str, filename: str, kind: str, size: int, session_id: str, model: str):
+        self.id = uuid4().hex[:12]
+        self.path = path
+        self.filename = filename
+        self.kind = kind
+        self.size = size
+        self.session_id = session_id
+        self.model = model
+        self.status = "queued"
+        self.error: Optional[str] = None
+        self.pages_total: Optional[int] = None
+        self.pages_done = 0
+        self.chunks_queued = 0
+        self.chunks_stored = 0
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self.done = asyncio.Event()
+
+    def to_dict(self) -> Dict[str, Any]:
+        end = self.finished_at or time.time()
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "filename": self.filename,
+            "kind": self.kind,
+            "bytes": self.size,
+            "session_id": self.session_id,
+            "model": self.model,
+            "pages_total": self.pages_total,
+            "pages_done": self.pages_done,
+            "chunks_queued": self.chunks_queued,
+            "chunks_stored": self.chunks_stored,
+            "progress": round(self.pages_done / self.pages_total, 3) if self.pages_total else None,
+            "elapsed_s": round(end - self.started_at, 2) if self.started_at else 0.0,
+            "error": self.error
+        }
+
+
+_jobs: "OrderedDict[str, IngestJob]" = OrderedDict()
+_job_slots = asyncio.Semaphore(config.DOC_INGEST_MAX_JOBS)
+
+
+async def _pdf_pages(job: IngestJob) -> AsyncIterator[Tuple[int, str]]:
+    """Pages in order, extracted a range at a time with several ranges in flight."""
+    job.pages_total = await _run(ingest_worker.pdf_page_count, job.path)
+    step = config.DOC_PDF_PAGES_PER_TASK
+    ranges = iter(range(0, job.pages_total, step))
+    inflight: Deque[Tuple[int, asyncio.Task]] = deque()
+    try:
+        while True:
+            while len(inflight) < max(2, config.DOC_INGEST_PROCESSES * 2):
+                start = next(ranges, None)
+                if start is None:
+                    break
+                inflight.append((start, asyncio.ensure_future(_run(ingest_worker.extract_pages, job.path, start, start + step))))
+            if not inflight:
+                return
+            start, task = inflight.popleft()
+            for offset, text in enumerate(await task):
+                yield start + offset + 1, text
+    finally:
+        for _, task in inflight:
+            task.cancel()
+
+
+def _read_block(reader, carry: str) -> Tuple[str, str, bool]:
+    """Next block of text ending at a paragraph break, the remainder and whether the file ended."""
+    data = carry + reader.read(_TEXT_BLOCK_CHARS)
+    if len(data) == len(carry):
+        return data, "", True
+    cut = data.rfind("\n\n")
+    if cut < len(data) // 2:
+        cut = data.rfind("\n")
+    if cut < 0:
+        return data, "", False
+    return data[:cut], data[cut:], False
+
+
+async def _text_pages(job: IngestJob) -> AsyncIterator[Tuple[int, str]]:
+    """The file in blocks; a text file has no pages, so "page" counts blocks."""
+    job.pages_total = max(1, -(-job.size // _TEXT_BLOCK_CHARS))
+    with open(job.path, "rb") as raw:
+        reader = codecs.getreader("utf-8")(raw, errors="replace")
+        carry, block, ended = "", 0, False
+        while not ended:
+            text, carry, ended = await run_in_threadpool(_read_block, reader, carry)
+            block += 1
+            yield block, text
+    job.pages_total = block
+
+
+async def _store(job: IngestJob, chunks: List[Tuple[str, int]]) -> None:
+    texts = [text for text, _ in chunks]
+    vectors = await _embed(texts)
+    metadatas = [
+        {"type": "document", "session_id": job.session_id, "source": job.filename, "job_id": job.id,
+         # Text files have no pages, only read blocks
+         **({"page": page} if job.kind == "pdf" else {})}
+        for _, page in chunks
+    ]
+    await run_in_threadpool(rag.add_embedded, texts, vectors, metadatas)
+    job.chunks_stored += len(chunks)
+
+
+async def _ingest(job: IngestJob) -> None:
+    chunker = TokenChunker()
+    batch: List[Tuple[str, int]] = []
+    pending: set = set()
+
+    async def submit(chunks):
+        nonlocal pending
+        job.chunks_queued += len(chunks)
+        pending.add(asyncio.ensure_future(_store(job, chunks)))
+        # Bounded: parsing never runs far ahead of embedding
+        while len(pending) >= max(2, config.DOC_INGEST_PROCESSES * 2):
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+
+    pages = _pdf_pages(job) if job.kind == "pdf" else _text_pages(job)
+    try:
+        async for page, text in pages:
+            if job.kind == "pdf":
+                text = _HYPHEN_BREAK.sub(r"\1\2", text)
+            for chunk in chunker.feed(text, page):
+                batch.append(chunk)
+                if len(batch) >= config.DOC_EMBED_BATCH:
+                    await submit(batch)
+                    batch = []
+            job.pages_done = page
+        batch.extend(chunker.finish())
+        if batch:
+            await submit(batch)
+        if pending:
+            for task in await asyncio.gather(*pending, return_exceptions=True):
+                if isinstance(task, BaseException):
+                    raise task
+    finally:
+        await pages.aclose()
+        for task in pending:
+            task.cancel()
+
+
+async def _run_job(job: IngestJob) -> None:
+    try:
+        async with _job_slots:
+            job.status = "running"
+            job.started_at = time.time()
+            await _ingest(job)
+        job.status = "done"
+        logger.info(f"Ingested {job.filename}: {job.chunks_stored} chunks from {job.pages_done} pages "
+                    f"in {time.time() - job.started_at:.1f}s")
+    except asyncio.CancelledError:
+        job.status = "cancelled"
+    except Exception as e:
+        job.status = "failed"
+        job.error = str(e) or type(e).__name__
+        logger.exception(f"Ingesting {job.filename} failed")
+    finally:
+        job.finished_at = time.time()
+        job.done.set()
+        await run_in_threadpool(shutil.rmtree, os.path.dirname(job.path), True)
+
+
+async def start_ingest(file: UploadFile, session_id: str, model: str) -> IngestJob:
+    """
+    Copy the upload to a temporary file and ingest it in the background.
+
+    The copy is streamed in blocks and capped at ``DOC_MAX_BYTES``. Raises
+    ``DocumentError`` for unsupported or oversized files.
+    """
+    if not await rag.ensure_loaded():
+        raise RuntimeError("The RAG engine is not available")
+    kind = document_kind(file.filename, file.content_type)
+    directory = tempfile.mkdtemp(prefix="privateprompt-doc-")
+    path = os.path.join(directory, "upload.pdf" if kind == "pdf" else "upload.txt")
+    size = 0
+    try:
+        with open(path, "wb") as out:
+            while block := await file.read(1024 * 1024):
+                size += len(block)
+                if size > config.DOC_MAX_BYTES:
+                    raise DocumentError(f"Document is larger than {config.DOC_MAX_BYTES // (1024 * 1024)} MB")
+                await run_in_threadpool(out.write, block)
+        if not size:
+            raise DocumentError("The uploaded file is empty")
+        if kind == "pdf":
+            with open(path, "rb") as f:
+                if not f.read(1024).lstrip().startswith(b"%PDF"):
+                    raise DocumentError("The uploaded file is not a PDF")
+    except BaseException:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+
+    job = IngestJob(path, file.filename or "document", kind, size, session_id, model)
+    _jobs[job.id] = job
+    # Forget the oldest finished jobs
+    while len(_jobs) > config.DOC_INGEST_KEEP_JOBS:
+        oldest = next((j for j in _jobs.values() if j.done.is_set()), None)
+        if oldest is None:
+            break
+        del _jobs[oldest.id]
+    job.task = asyncio.create_task(_run_job(job))
+    return job
+
+
+def get_job(job_id: str) -> Optional[IngestJob]:
+    return _jobs.get(job_id)
+
+
+def list_jobs(session_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    return [job.to_dict() for job in reversed(_jobs.values()) if session_id is None or job.session_id == session_id]
@@ -1,8 +1,44 @@
-import requests
+from starlette.concurrency import run_in_threadpool
 
-def embed_text(text: str):
-    response = requests.post(
-        "http://localhost:11434/api/embeddings",
-        json={"model": "nomic-embed-text", "prompt": text}
+from .ollama_client import ollama
+from .embedding_cache import embedding_cache
+
+EMBED_MODEL = "nomic-embed-text"
+_version_checked = False
+
+def record_model_digest(models):
+    """Drop cached vectors if the embedding model's digest in an ``/api/tags`` answer changed."""
+    global _version_checked
+    if embedding_cache is None:
+        return
+    for model in models:
+        if model.get("name", "").split(":")[0] == EMBED_MODEL and model.get("digest"):
+            embedding_cache.set_model_version(f"ollama:{EMBED_MODEL}", model["digest"])
+            _version_checked = True
+            break
+
+async def _check_model_version():
+    """Look the digest up once per process; the model registry keeps it current afterwards."""
+    if _version_checked or embedding_cache is None:
+        return
+    response = await ollama.request("tags", "GET")
+    record_model_digest(response.get("models", []))
+
+async def embed_text(text: str):
+    if embedding_cache is not None:
+        await _check_model_version()
+        # SQLite lookups and commits stay off the event loop
+        cached = (await run_in_threadpool(embedding_cache.get_many, f"ollama:{EMBED_MODEL}", [text]))[0]
+        if cached is not None:
+            return cached.tolist()
+
+    response = await ollama.request(
+        "embeddings", "POST",
+        {"model": EMBED_MODEL, "prompt": text}
     )
-    return response.json()["embedding"]
+    if "embedding" not in response:
+        raise RuntimeError(f"Embedding failed: {response.get('error', 'no embedding returned')}")
+
+    if embedding_cache is not None:
+        await run_in_threadpool(embedding_cache.put_many, f"ollama:{EMBED_MODEL}", [text], [response["embedding"]])
+    return response["embedding"]
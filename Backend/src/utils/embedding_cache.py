@@ -0,0 +1,234 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from .. import config
+
+# Rough per-entry bookkeeping cost on top of the vector bytes
+_ENTRY_OVERHEAD = 160
+_WHITESPACE = re.compile(r"\s+")
+# Disk pruning runs once per this many written vectors
+_PRUNE_EVERY = 1024
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text so trivially different strings share one cache entry."""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Two-tier cache of embedding vectors keyed by (model, normalized-text hash).
+
+    Tier one is an in-memory LRU bounded by a byte budget; tier two is an
+    SQLite file holding float32 vectors as blobs, so entries survive restarts.
+    The disk tier keeps at most ``max_entries`` vectors, dropping the oldest
+    written first. Each model has a recorded version (e.g. an Ollama digest); setting a
+    different version drops that model's entries.
+    """
+
+    def __init__(self, path: str = config.EMBEDDING_CACHE_PATH,
+                 memory_budget_bytes: int = config.EMBEDDING_CACHE_MEMORY_BYTES,
+                 max_entries: int = config.EMBEDDING_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.memory_budget_bytes = memory_budget_bytes
+        self.max_entries = max_entries
+        self._writes_since_prune = 0
+        self._lru: "OrderedDict[tuple, np.ndarray]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.RLock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0,
+                       "disk_evictions": 0, "invalidations": 0}
+
+        self._connection: Optional[sqlite3.Connection] = None
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        return self._connection if self._connection is not None else self._ensure_open()
+
+    def _ensure_open(self) -> sqlite3.Connection:
+        """Open (and create) the SQLite file on first use instead of at import."""
+        with self._lock:
+            if self._connection is None:
+                self._connection = self._open()
+            return self._connection
+
+    def _open(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL, key TEXT NOT NULL, dim INTEGER NOT NULL, vector BLOB NOT NULL,"
+            " PRIMARY KEY (model, key))"
+        )
+        conn.execute("CREATE TABLE IF NOT EXISTS model_versions (model TEXT PRIMARY KEY, version TEXT NOT NULL)")
+        conn.commit()
+        return conn
+
+    # ----- lookups -----------------------------------------------------------------
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """Return cached vectors for ``texts`` (None where missing), promoting disk hits to memory."""
+        keys = [text_key(t) for t in texts]
+        found: List[Optional[np.ndarray]] = [None] * len(texts)
+        missing = {}
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._lru.get((model, key))
+                if vector is not None:
+                    self._lru.move_to_end((model, key))
+                    self._stats["memory_hits"] += 1
+                    found[i] = vector
+                else:
+                    missing.setdefault(key, []).append(i)
+
+            if missing:
+                rows = []
+                unique = list(missing)
+                # Stay below SQLite's bound-parameter limit
+                for start in range(0, len(unique), 500):
+                    chunk = unique[start:start + 500]
+                    placeholders = ",".join("?" * len(chunk))
+                    rows.extend(self._conn.execute(
+                        f"SELECT key, vector FROM embeddings WHERE model = ? AND key IN ({placeholders})",
+                        [model, *chunk],
+                    ).fetchall())
+                for key, blob in rows:
+                    vector = np.frombuffer(blob, dtype=np.float32)
+                    self._remember(model, key, vector)
+                    for i in missing.pop(key):
+                        found[i] = vector
+                        self._stats["disk_hits"] += 1
+                self._stats["misses"] += sum(len(v) for v in missing.values())
+        return found
+
+    def put_many(self, model: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        rows = []
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                key = text_key(text)
+                array = np.asarray(vector, dtype=np.float32)
+                self._remember(model, key, array)
+                rows.append((model, key, array.shape[0], array.tobytes()))
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+            self._writes_since_prune += len(rows)
+            if self._writes_since_prune >= _PRUNE_EVERY:
+                self._prune()
+            self._conn.commit()
+            self._stats["writes"] += len(rows)
+
+    def _prune(self) -> None:
+        """Drop the oldest written rows beyond ``max_entries``."""
+        self._writes_since_prune = 0
+        excess = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] - self.max_entries
+        if excess > 0:
+            # INSERT OR REPLACE gives a rewritten row a new rowid, so rowid order is write order
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY rowid LIMIT ?)",
+                (excess,)
+            )
+            self._stats["disk_evictions"] += excess
+
+    def _remember(self, model: str, key: str, vector: np.ndarray) -> None:
+        entry = (model, key)
+        if entry in self._lru:
+            self._lru.move_to_end(entry)
+            return
+        self._lru[entry] = vector
+        self._memory_bytes += vector.nbytes + _ENTRY_OVERHEAD
+        while self._memory_bytes > self.memory_budget_bytes and self._lru:
+            _, evicted = self._lru.popitem(last=False)
+            self._memory_bytes -= evicted.nbytes + _ENTRY_OVERHEAD
+            self._stats["evictions"] += 1
+
+    # ----- invalidation ------------------------------------------------------------
+
+    def set_model_version(self, model: str, version: str) -> bool:
+        """Record the version of ``model``; drops its entries if it changed. Returns True if invalidated."""
+        with self._lock:
+            row = self._conn.execute("SELECT version FROM model_versions WHERE model = ?", (model,)).fetchone()
+            if row and row[0] == version:
+                return False
+            if row:
+                self.invalidate(model)
+            self._conn.execute("INSERT OR REPLACE INTO model_versions VALUES (?, ?)", (model, version))
+            self._conn.commit()
+            return row is not None
+
+    def invalidate(self, model: Optional[str] = None) -> None:
+        """Drop cached vectors for ``model``, or for every model when None."""
+        with self._lock:
+            if model is None:
+                self._lru.clear()
+                self._memory_bytes = 0
+                self._conn.execute("DELETE FROM embeddings")
+            else:
+                for entry in [e for e in self._lru if e[0] == model]:
+                    self._memory_bytes -= self._lru.pop(entry).nbytes + _ENTRY_OVERHEAD
+                self._conn.execute("DELETE FROM embeddings WHERE model = ?", (model,))
+            self._conn.commit()
+            self._stats["invalidations"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self._stats["memory_hits"] + self._stats["disk_hits"]
+            lookups = hits + self._stats["misses"]
+            disk_entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            return {
+                **self._stats,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self._lru),
+                "memory_bytes": self._memory_bytes,
+                "memory_budget_bytes": self.memory_budget_bytes,
+                "disk_entries": disk_entries,
+                "max_entries": self.max_entries,
+                "path": self.path,
+            }
+
+
+class CachedEmbeddings:
+    """
+    Wraps a LangChain embeddings object (``embed_documents``/``embed_query``)
+    with an ``EmbeddingCache``. Only cache misses reach the wrapped model,
+    still as a single batched ``embed_documents`` call.
+    """
+
+    def __init__(self, embeddings, model_name: str, cache: "EmbeddingCache"):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        cached = self.cache.get_many(self.model_name, texts)
+        missing = [i for i, v in enumerate(cached) if v is None]
+        if missing:
+            computed = self.embeddings.embed_documents([texts[i] for i in missing])
+            self.cache.put_many(self.model_name, [texts[i] for i in missing], computed)
+            for i, vector in zip(missing, computed):
+                cached[i] = np.asarray(vector, dtype=np.float32)
+        return [v.tolist() for v in cached]
+
+    def embed_query(self, text: str) -> List[float]:
+        cached = self.cache.get_many(self.model_name, [text])[0]
+        if cached is not None:
+            return cached.tolist()
+        vector = self.embeddings.embed_query(text)
+        self.cache.put_many(self.model_name, [text], [vector])
+        return list(vector)
+
+
+# Shared cache used by RAGEngine and embed_text
+embedding_cache = EmbeddingCache() if config.EMBEDDING_CACHE_ENABLED else None
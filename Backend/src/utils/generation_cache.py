@@ -0,0 +1,337 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from .. import config
+from .metrics import llm_requests
+from .ollama_client import ollama
+
+logger = logging.getLogger(__name__)
+
+# Rough per-entry bookkeeping cost on top of the stored JSON
+_ENTRY_OVERHEAD = 200
+# Request fields that do not change what the model generates
+_TRANSPORT_FIELDS = ("stream", "keep_alive")
+# Disk pruning runs once per this many writes
+_PRUNE_EVERY = 64
+_UNKNOWN_MODEL_RECHECK_SECONDS = 5.0
+
+
+def normalize_model(model: str) -> str:
+    # Ollama reports "llama3:latest" for a request made with "llama3"
+    return model if ":" in model else f"{model}:latest"
+
+
+def is_deterministic(payload: Dict[str, Any]) -> bool:
+    """Only greedy (temperature 0) or seeded generations repeat, so only those are cached."""
+    options = payload.get("options") or {}
+    return options.get("temperature") == 0 or options.get("seed") is not None
+
+
+def request_key(path: str, payload: Dict[str, Any], digest: str) -> str:
+    body = {k: v for k, v in payload.items() if k not in _TRANSPORT_FIELDS}
+    body["model"] = normalize_model(body.get("model", ""))
+    raw = json.dumps([path.strip("/"), digest, body], sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def cache_directives(cache_control: Optional[str]) -> set:
+    return {d.strip().lower() for d in (cache_control or "").split(",") if d.strip()}
+
+
+class GenerationCache:
+    """
+    Two-tier cache of Ollama responses keyed by (model digest, request).
+
+    Tier one is an in-memory LRU bounded by a byte budget; tier two is an
+    SQLite file, so answers survive restarts. Entries expire after
+    ``ttl_seconds`` (0 keeps them until evicted) and the disk tier keeps at
+    most ``max_entries``, dropping the oldest first. Each model's digest is
+    recorded; a different digest drops that model's entries.
+    """
+
+    def __init__(self, path: str = config.GENERATION_CACHE_PATH,
+                 memory_budget_bytes: int = config.GENERATION_CACHE_MEMORY_BYTES,
+                 ttl_seconds: float = config.GENERATION_CACHE_TTL_SECONDS,
+                 max_entries: int = config.GENERATION_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.memory_budget_bytes = memory_budget_bytes
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # key -> (model, expires_at, response JSON)
+        self._lru: "OrderedDict[str, Tuple[str, float, str]]" = OrderedDict()
+        self._memory_bytes = 0
+        self._digests: Dict[str, str] = {}
+        self._writes_since_prune = 0
+        self._lock = threading.RLock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0,
+                       "evictions": 0, "expired": 0, "invalidations": 0, "bypassed": 0}
+
+        self._connection: Optional[sqlite3.Connection] = None
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        return self._connection if self._connection is not None else self._ensure_open()
+
+    def _ensure_open(self) -> sqlite3.Connection:
+        """Open (and create) the SQLite file on first use instead of at import."""
+        with self._lock:
+            if self._connection is None:
+                self._connection = self._open()
+            return self._connection
+
+    def _open(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS generations ("
+            " key TEXT PRIMARY KEY, model TEXT NOT NULL, created_at REAL NOT NULL,"
+            " expires_at REAL NOT NULL, response TEXT NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_generations_model ON generations (model)")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_generations_created_at ON generations (created_at)")
+        conn.execute("CREATE TABLE IF NOT EXISTS model_digests (model TEXT PRIMARY KEY, digest TEXT NOT NULL)")
+        conn.commit()
+        self._digests = dict(conn.execute("SELECT model, digest FROM model_digests").fetchall())
+        return conn
+
+    def _expiry(self, now: float) -> float:
+        return now + self.ttl_seconds if self.ttl_seconds > 0 else float("inf")
+
+    # ----- lookups -----------------------------------------------------------------
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """The cached response for ``key`` (a fresh copy), or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._lru.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return json.loads(entry[2])
+                self._forget(key)
+                self._stats["expired"] += 1
+            row = self._conn.execute(
+                "SELECT model, expires_at, response FROM generations WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and row[1] > now:
+                self._remember(key, *row)
+                self._stats["disk_hits"] += 1
+                return json.loads(row[2])
+            if row is not None:
+                self._conn.execute("DELETE FROM generations WHERE key = ?", (key,))
+                self._conn.commit()
+                self._stats["expired"] += 1
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, key: str, model: str, response: Dict[str, Any]) -> None:
+        now = time.time()
+        expires_at = self._expiry(now)
+        raw = json.dumps(response, separators=(",", ":"), ensure_ascii=False)
+        with self._lock:
+            self._remember(key, normalize_model(model), expires_at, raw)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO generations VALUES (?, ?, ?, ?, ?)",
+                (key, normalize_model(model), now, min(expires_at, 1e18), raw)
+            )
+            self._writes_since_prune += 1
+            if self._writes_since_prune >= _PRUNE_EVERY:
+                self._prune(now)
+            self._conn.commit()
+            self._stats["writes"] += 1
+
+    def _remember(self, key: str, model: str, expires_at: float, raw: str) -> None:
+        if key in self._lru:
+            self._forget(key)
+        self._lru[key] = (model, expires_at, raw)
+        self._memory_bytes += len(raw) + _ENTRY_OVERHEAD
+        while self._memory_bytes > self.memory_budget_bytes and self._lru:
+            _, (_, _, evicted) = self._lru.popitem(last=False)
+            self._memory_bytes -= len(evicted) + _ENTRY_OVERHEAD
+            self._stats["evictions"] += 1
+
+    def _forget(self, key: str) -> None:
+        self._memory_bytes -= len(self._lru.pop(key)[2]) + _ENTRY_OVERHEAD
+
+    def _prune(self, now: float) -> None:
+        """Drop expired rows, then the oldest ones beyond ``max_entries``."""
+        self._writes_since_prune = 0
+        expired = self._conn.execute("DELETE FROM generations WHERE expires_at <= ?", (now,)).rowcount
+        excess = self._conn.execute("SELECT COUNT(*) FROM generations").fetchone()[0] - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM generations WHERE key IN (SELECT key FROM generations ORDER BY created_at LIMIT ?)",
+                (excess,)
+            )
+            self._stats["evictions"] += excess
+        self._stats["expired"] += max(0, expired)
+
+    def record_bypass(self) -> None:
+        with self._lock:
+            self._stats["bypassed"] += 1
+
+    # ----- invalidation ------------------------------------------------------------
+
+    def digest(self, model: str) -> Optional[str]:
+        if self._connection is None:
+            # Digests recorded by earlier runs are read when the file is opened
+            self._ensure_open()
+        return self._digests.get(normalize_model(model))
+
+    def set_model_digest(self, model: str, digest: str) -> bool:
+        """Record the digest of ``model``; drops its entries if it changed. Returns True if invalidated."""
+        model = normalize_model(model)
+        with self._lock:
+            previous = self.digest(model)
+            if previous == digest:
+                return False
+            if previous is not None:
+                self.invalidate(model)
+            self._digests[model] = digest
+            self._conn.execute("INSERT OR REPLACE INTO model_digests VALUES (?, ?)", (model, digest))
+            self._conn.commit()
+            return previous is not None
+
+    def update_digests(self, models: Iterable[Dict[str, Any]]) -> List[str]:
+        """Apply an Ollama ``/api/tags`` model list; returns the models whose entries were dropped."""
+        invalidated = []
+        for model in models:
+            name = model.get("name") or model.get("model")
+            if name and model.get("digest") and self.set_model_digest(name, model["digest"]):
+                invalidated.append(normalize_model(name))
+        if invalidated:
+            logger.info(f"Generation cache invalidated for updated models: {', '.join(invalidated)}")
+        return invalidated
+
+    def invalidate(self, model: Optional[str] = None) -> None:
+        """Drop cached responses for ``model``, or for every model when None."""
+        with self._lock:
+            if model is None:
+                self._lru.clear()
+                self._memory_bytes = 0
+                self._conn.execute("DELETE FROM generations")
+            else:
+                model = normalize_model(model)
+                for key in [k for k, entry in self._lru.items() if entry[0] == model]:
+                    self._forget(key)
+                self._conn.execute("DELETE FROM generations WHERE model = ?", (model,))
+            self._conn.commit()
+            self._stats["invalidations"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self._stats["memory_hits"] + self._stats["disk_hits"]
+            lookups = hits + self._stats["misses"]
+            disk_entries = self._conn.execute("SELECT COUNT(*) FROM generations").fetchone()[0]
+            return {
+                **self._stats,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self._lru),
+                "memory_bytes": self._memory_bytes,
+                "memory_budget_bytes": self.memory_budget_bytes,
+                "disk_entries": disk_entries,
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "models": dict(self._digests),
+                "path": self.path,
+            }
+
+
+# Shared cache for deterministic generations
+generation_cache = GenerationCache() if config.GENERATION_CACHE_ENABLED else None
+
+_digests_checked_at = 0.0
+_digest_refresh: Optional[asyncio.Task] = None
+
+
+def note_installed_models(models: Iterable[Dict[str, Any]]) -> None:
+    """Take model digests from an ``/api/tags`` answer fetched elsewhere (the model registry)."""
+    global _digests_checked_at
+    if generation_cache is not None:
+        generation_cache.update_digests(models)
+        _digests_checked_at = time.monotonic()
+
+
+async def refresh_digests() -> None:
+    response = await ollama.request("tags", "GET")
+    if isinstance(response, dict) and "models" in response:
+        note_installed_models(response["models"])
+
+
+async def _model_digest(model: str) -> Optional[str]:
+    """
+    Digest of ``model`` as last seen in ``/api/tags``.
+
+    An unknown model is looked up right away (at most every few seconds);
+    a known one is re-checked in the background every
+    ``GENERATION_CACHE_DIGEST_REFRESH_SECONDS`` so a model pulled outside
+    the app stops serving old answers.
+    """
+    global _digest_refresh
+    digest = generation_cache.digest(model)
+    age = time.monotonic() - _digests_checked_at
+    if digest is None:
+        # Requests for a model that is not installed must not hit /api/tags every time
+        if age > _UNKNOWN_MODEL_RECHECK_SECONDS:
+            await refresh_digests()
+        return generation_cache.digest(model)
+    stale = age > config.GENERATION_CACHE_DIGEST_REFRESH_SECONDS
+    if stale and (_digest_refresh is None or _digest_refresh.done()):
+        _digest_refresh = asyncio.create_task(refresh_digests())
+    return digest
+
+
+async def _send(path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    return await ollama.request(path, "POST", payload)
+
+
+async def cached_request(path: str, payload: Dict[str, Any], cache_control: Optional[str] = None,
+                         send: Optional[Callable[[str, Dict[str, Any]], Awaitable[Dict[str, Any]]]] = None
+                         ) -> Tuple[Dict[str, Any], str]:
+    """
+    ``ollama.request`` for a non-streaming generation, answered from the
+    cache when the same deterministic request was made against the same
+    model digest before.
+
+    ``Cache-Control: no-cache`` skips the lookup but stores the new answer,
+    ``no-store`` bypasses the cache entirely. ``send`` performs the actual
+    call on a miss (e.g. inside a scheduler slot). Returns the response and
+    ``"hit"``, ``"miss"``, ``"refresh"`` or ``"bypass"``.
+    """
+    send = send or _send
+    directives = cache_directives(cache_control)
+    if generation_cache is None or "no-store" in directives or not is_deterministic(payload):
+        if generation_cache is not None:
+            generation_cache.record_bypass()
+        return await send(path, payload), "bypass"
+
+    digest = await _model_digest(payload.get("model", ""))
+    if digest is None:
+        # Not an installed model; Ollama will answer with the error
+        return await send(path, payload), "bypass"
+    key = request_key(path, payload, digest)
+    if "no-cache" not in directives:
+        # The disk tier reads, deletes expired rows and commits; keep that off the event loop
+        cached = await run_in_threadpool(generation_cache.get, key)
+        if cached is not None:
+            # Counted with the Ollama calls so hit rates show per model
+            llm_requests.inc(model=payload.get("model", ""), endpoint=path, outcome="cache_hit")
+            return cached, "hit"
+
+    response = await send(path, payload)
+    if isinstance(response, dict) and response and not response.get("error") and response.get("done", True):
+        await run_in_threadpool(generation_cache.put, key, payload["model"], response)
+    return response, "refresh" if "no-cache" in directives else "miss"
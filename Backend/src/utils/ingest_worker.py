@@ -0,0 +1,62 @@
+"""
+Functions run in the document ingestion process pool.
+
+This module imports nothing from the app, so spawned workers start
+quickly. Heavy libraries are imported on first use, and each worker keeps
+its own copy of the embedding model.
+"""
+from typing import List
+
+import numpy as np
+
+_embeddings = None
+_embeddings_name = None
+
+
+def init_worker(threads: int) -> None:
+    # The workers share the CPU with the API process and with each other
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+
+def embed_texts(model_name: str, texts: List[str]) -> np.ndarray:
+    global _embeddings, _embeddings_name
+    if _embeddings is None or _embeddings_name != model_name:
+        from langchain_huggingface import HuggingFaceEmbeddings
+        _embeddings = HuggingFaceEmbeddings(model_name=model_name)
+        _embeddings_name = model_name
+    return np.asarray(_embeddings.embed_documents(texts), dtype=np.float32)
+
+
+def _open_pdf(f):
+    from PyPDF2 import PdfReader
+    reader = PdfReader(f)
+    if reader.is_encrypted:
+        # Many PDFs are "encrypted" with an empty user password only
+        reader.decrypt("")
+    return reader
+
+
+def pdf_page_count(path: str) -> int:
+    with open(path, "rb") as f:
+        return len(_open_pdf(f).pages)
+
+
+def extract_pages(path: str, start: int, end: int) -> List[str]:
+    """
+    Text of pages ``start`` to ``end - 1``. Only the cross-reference table
+    and these pages are parsed. A page that fails to parse comes back empty,
+    so one damaged page does not sink the document.
+    """
+    texts = []
+    with open(path, "rb") as f:
+        reader = _open_pdf(f)
+        for number in range(start, min(end, len(reader.pages))):
+            try:
+                texts.append(reader.pages[number].extract_text() or "")
+            except Exception:
+                texts.append("")
+    return texts
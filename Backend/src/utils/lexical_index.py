@@ -0,0 +1,85 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .vector_store import SearchHit
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def fts_query(text: str, max_terms: int = 32) -> str:
+    """Turn free text into a safe FTS5 query: quoted terms joined with OR."""
+    terms = []
+    for token in _TOKEN.findall(text.lower()):
+        if token not in terms:
+            terms.append(token)
+    return " OR ".join(f'"{t}"' for t in terms[:max_terms])
+
+
+class LexicalIndex:
+    """
+    BM25 inverted index over RAG documents, stored in an SQLite FTS5 table.
+
+    Documents are added incrementally next to their vectors and can be
+    restricted to one ``session_id``. Scores are FTS5's BM25 with the sign
+    flipped, so higher is better.
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS rag_docs USING fts5("
+            " text, doc_id UNINDEXED, session_id UNINDEXED, metadata UNINDEXED,"
+            " tokenize = 'porter unicode61')"
+        )
+        self._conn.commit()
+
+    def add(self, ids: Sequence[str], texts: Sequence[str], metadatas: Sequence[Dict[str, Any]]) -> None:
+        rows = [
+            (text, id_, (metadata or {}).get("session_id"), json.dumps(metadata or {}))
+            for id_, text, metadata in zip(ids, texts, metadatas)
+        ]
+        with self._lock:
+            self._conn.executemany("INSERT INTO rag_docs (text, doc_id, session_id, metadata) VALUES (?, ?, ?, ?)", rows)
+            self._conn.commit()
+
+    def backfill(self, documents: Iterable[Tuple[str, str, Dict[str, Any]]], batch_size: int = 1000) -> int:
+        """Index ``(id, text, metadata)`` tuples, e.g. a vector store's existing contents."""
+        batch, total = [], 0
+        for doc in documents:
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                self.add(*zip(*batch))
+                total += len(batch)
+                batch = []
+        if batch:
+            self.add(*zip(*batch))
+            total += len(batch)
+        return total
+
+    def search(self, query: str, k: int, session_id: Optional[str] = None) -> List[SearchHit]:
+        match = fts_query(query)
+        if not match or k <= 0:
+            return []
+        sql = "SELECT doc_id, text, metadata, -bm25(rag_docs) FROM rag_docs WHERE rag_docs MATCH ?"
+        params: List[Any] = [match]
+        if session_id is not None:
+            sql += " AND session_id = ?"
+            params.append(session_id)
+        sql += " ORDER BY bm25(rag_docs) LIMIT ?"
+        params.append(k)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [SearchHit(doc_id, text, json.loads(metadata), float(score)) for doc_id, text, metadata, score in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM rag_docs").fetchone()[0]
@@ -0,0 +1,229 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .. import config
+
+# Seconds; from a cached embedding lookup up to a long generation
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+RATE_BUCKETS = (1, 2, 5, 10, 15, 20, 30, 40, 60, 80, 100, 150, 200, 400)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[Any], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_labels(self.label_names, key)} {_number(value)}" for key, value in values]
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram; observations are in seconds unless the name says otherwise."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._series: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = [(key, list(counts), total, count) for key, (counts, total, count) in self._series.items()]
+        lines = []
+        for key, counts, total, count in series:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self, prefix: str = config.METRICS_PREFIX):
+        self.prefix = prefix
+        self._metrics: List[_Metric] = []
+
+    def _add(self, metric: _Metric) -> Any:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(f"{self.prefix}_{name}", help, labels))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(f"{self.prefix}_{name}", help, labels, buckets))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for metric in self._metrics:
+            samples = metric.render()
+            if samples:
+                lines.extend(metric.header())
+                lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.counter("http_requests_total", "HTTP requests by route template, method and status.", ("route", "method", "status"))
+http_latency = registry.histogram("http_request_duration_seconds", "Time until the last response byte, by route template.", ("route", "method"))
+stage_latency = registry.histogram(
+    "stage_duration_seconds",
+    "Time spent per request stage: history_load, retrieval, embedding, prompt_build, queue_wait, db_write, rag_enqueue, stt.",
+    ("stage",)
+)
+llm_requests = registry.counter("llm_requests_total", "Ollama generation calls by model, endpoint and outcome.", ("model", "endpoint", "outcome"))
+llm_latency = registry.histogram("llm_duration_seconds", "Wall time of an Ollama generation call.", ("model", "endpoint"))
+llm_first_token = registry.histogram(
+    "llm_time_to_first_token_seconds",
+    "Time to the first token: measured for streams, load plus prompt evaluation as reported by Ollama otherwise.",
+    ("model", "endpoint")
+)
+llm_tokens_per_second = registry.histogram(
+    "llm_tokens_per_second", "Generation speed, eval_count / eval_duration as reported by Ollama.", ("model",), RATE_BUCKETS
+)
+llm_tokens = registry.counter("llm_tokens_total", "Prompt and completion tokens processed by Ollama.", ("model", "kind"))
+model_lifecycle_actions = registry.counter(
+    "model_lifecycle_actions_total", "Model preloads, keep-alive refreshes and unloads by outcome.", ("action", "outcome")
+)
+
+
+def stage(name: str):
+    """``with stage("retrieval"):`` records the block's duration."""
+    return stage_latency.time(stage=name)
+
+
+def record_generation(model: str, endpoint: str, response: Dict[str, Any], elapsed: float,
+                      first_token: Optional[float] = None) -> None:
+    """
+    Record one Ollama chat/generate call. ``response`` is the final
+    (``done``) object, which carries Ollama's own token counts and
+    nanosecond durations.
+    """
+    if "error" in response:
+        llm_requests.inc(model=model, endpoint=endpoint, outcome="error")
+        return
+    llm_requests.inc(model=model, endpoint=endpoint, outcome="ok")
+    llm_latency.observe(elapsed, model=model, endpoint=endpoint)
+    if first_token is None and response.get("prompt_eval_duration") is not None:
+        first_token = (response.get("load_duration", 0) + response["prompt_eval_duration"]) / 1e9
+    if first_token is not None:
+        llm_first_token.observe(first_token, model=model, endpoint=endpoint)
+    if response.get("eval_count") and response.get("eval_duration"):
+        llm_tokens_per_second.observe(response["eval_count"] / (response["eval_duration"] / 1e9), model=model)
+    if response.get("prompt_eval_count"):
+        llm_tokens.inc(response["prompt_eval_count"], model=model, kind="prompt")
+    if response.get("eval_count"):
+        llm_tokens.inc(response["eval_count"], model=model, kind="completion")
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware counting requests and timing them until the last body
+    byte is sent, so streamed answers are measured in full. Requests are
+    labelled with the matched route template (``/chat/{llm_model}/{session_id}``)
+    to keep the number of series bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = {"code": 500, "recorded": False}
+
+        def record():
+            if status["recorded"]:
+                return
+            status["recorded"] = True
+            route = scope.get("route")
+            template = getattr(route, "path", None) or "unmatched"
+            method = scope.get("method", "")
+            http_requests.inc(route=template, method=method, status=status["code"])
+            http_latency.observe(time.perf_counter() - started, route=template, method=method)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                record()
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Disconnects and errors before the last byte still count
+            record()
@@ -0,0 +1,263 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from starlette.concurrency import run_in_threadpool
+
+from .. import config
+from .webscraper import fetch_search_page, parse_search_page
+
+logger = logging.getLogger(__name__)
+
+# Bumped whenever the shape of cached entries changes; older cache files are ignored
+CATALOG_FORMAT_VERSION = 1
+SORT_KEYS = ("pulls", "size", "name")
+_SIZE = re.compile(r"^(?:(\d+)x)?e?(\d+(?:\.\d+)?)([mbt])$", re.IGNORECASE)
+_COUNT = re.compile(r"^(\d+(?:\.\d+)?)\s*([kmb]?)$", re.IGNORECASE)
+_SCALE = {"": 1, "k": 1e3, "m": 1e6, "b": 1e9, "t": 1e12}
+
+
+def parse_param_size(size: str) -> Optional[float]:
+    """Parameter count in billions from a size tag: ``7b`` -> 7, ``8x7b`` -> 56, ``335m`` -> 0.335."""
+    match = _SIZE.match(size.strip())
+    if not match:
+        return None
+    experts, value, unit = match.groups()
+    billions = float(value) * _SCALE[unit.lower()] / 1e9
+    return billions * int(experts) if experts else billions
+
+
+def parse_count(count: str) -> int:
+    """``49.1M`` -> 49100000; unparseable counts are 0."""
+    match = _COUNT.match(count.replace(",", "").strip())
+    if not match:
+        return 0
+    return int(float(match.group(1)) * _SCALE[match.group(2).lower()])
+
+
+class _Entry:
+    """A catalog model plus the values filters and sorting use, computed once per refresh."""
+
+    __slots__ = ("model", "name", "text", "capabilities", "pulls", "min_size", "max_size")
+
+    def __init__(self, model: Dict[str, Any]):
+        sizes = [s for s in (parse_param_size(size) for size in model.get("sizes", [])) if s is not None]
+        self.model = model
+        self.name = model["model_name"].lower()
+        self.text = f"{self.name} {model.get('description', '')}".lower()
+        self.capabilities = {c.lower() for c in model.get("capability", [])}
+        self.pulls = parse_count(model.get("pulls", ""))
+        self.min_size = min(sizes) if sizes else None
+        self.max_size = max(sizes) if sizes else None
+
+
+class ModelCatalog:
+    """
+    The ollama.com model catalog, served from memory.
+
+    A snapshot is kept in a versioned JSON file and refreshed once it is
+    older than ``MODEL_CATALOG_TTL_SECONDS``. Refreshes are
+    stale-while-revalidate: requests get the current snapshot at once
+    while a single background task fetches the page. When no snapshot has
+    been saved yet, the bundled fixture is served in the meantime, and
+    with ``MODEL_CATALOG_OFFLINE`` the fixture is the only source.
+    """
+
+    def __init__(self, path: str = config.MODEL_CATALOG_PATH, fixture: str = config.MODEL_CATALOG_FIXTURE,
+                 ttl: float = config.MODEL_CATALOG_TTL_SECONDS, offline: bool = config.MODEL_CATALOG_OFFLINE):
+        self.path = path
+        self.fixture = fixture
+        self.ttl = ttl
+        self.offline = offline
+        self._entries: Optional[List[_Entry]] = None
+        self._fetched_at = 0.0
+        self._source = None
+        self._refresh: Optional[asyncio.Task] = None
+        self._retry_at = 0.0
+        self._last_error: Optional[str] = None
+        self._stats = {"refreshes": 0, "refresh_failures": 0, "stale_served": 0}
+
+    # ----- snapshots ---------------------------------------------------------------
+
+    def _install(self, models: Sequence[Dict[str, Any]], fetched_at: float, source: str) -> None:
+        self._entries = [_Entry(model) for model in models if model.get("model_name")]
+        self._fetched_at = fetched_at
+        self._source = source
+
+    def _load_file(self) -> bool:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable model catalog cache {self.path}: {e}")
+            return False
+        if snapshot.get("version") != CATALOG_FORMAT_VERSION:
+            logger.info(f"Ignoring model catalog cache in format {snapshot.get('version')}")
+            return False
+        self._install(snapshot["models"], snapshot["fetched_at"], snapshot.get("source", "online"))
+        return True
+
+    def _save_file(self, models: List[Dict[str, Any]], fetched_at: float, source: str) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": CATALOG_FORMAT_VERSION, "fetched_at": fetched_at, "source": source, "models": models}, f)
+        # Readers never see a half-written file
+        os.replace(tmp, self.path)
+
+    def _read_fixture(self) -> List[Dict[str, Any]]:
+        """The offline fixture: a saved search page (.html) or a JSON list/dict of models."""
+        with open(self.fixture, "r", encoding="utf-8") as f:
+            if self.fixture.endswith((".html", ".htm")):
+                return parse_search_page(f.read())
+            data = json.load(f)
+        return list(data.values()) if isinstance(data, dict) else data
+
+    def _load_fixture(self) -> bool:
+        try:
+            models = self._read_fixture()
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable model catalog fixture {self.fixture}: {e}")
+            return False
+        # Stale right away, so an online refresh still runs
+        self._install(models, 0.0, "fixture")
+        return True
+
+    # ----- refreshing --------------------------------------------------------------
+
+    async def refresh(self) -> None:
+        """Fetch and parse the catalog now, then swap it in and save it."""
+        try:
+            if self.offline:
+                models = await run_in_threadpool(self._read_fixture)
+                source = "fixture"
+            else:
+                html = await fetch_search_page()
+                models = await run_in_threadpool(parse_search_page, html)
+                source = "online"
+            if not models:
+                raise ValueError("no models found in the catalog page")
+            fetched_at = time.time()
+            await run_in_threadpool(self._save_file, models, fetched_at, source)
+        except Exception as e:
+            self._stats["refresh_failures"] += 1
+            self._last_error = str(e) or type(e).__name__
+            # Don't retry on every request while ollama.com is unreachable
+            self._retry_at = time.monotonic() + config.MODEL_CATALOG_RETRY_SECONDS
+            logger.warning(f"Model catalog refresh failed: {self._last_error}")
+            return
+        self._install(models, fetched_at, source)
+        self._stats["refreshes"] += 1
+        self._last_error = None
+        logger.info(f"Model catalog refreshed from {source}: {len(self._entries)} models")
+
+    def _refresh_in_background(self) -> None:
+        if self._refresh is None or self._refresh.done():
+            self._refresh = asyncio.create_task(self.refresh())
+
+    def is_stale(self) -> bool:
+        return time.time() - self._fetched_at > self.ttl
+
+    async def entries(self) -> List[_Entry]:
+        """
+        Current snapshot. Only the very first call can wait on a fetch, and
+        only when neither a saved snapshot nor the fixture exist.
+        """
+        if self._entries is None:
+            await run_in_threadpool(lambda: self._load_file() or self._load_fixture())
+            if self._entries is None:
+                self._refresh_in_background()
+                await asyncio.shield(self._refresh)
+                if self._entries is None:
+                    raise RuntimeError(f"Model catalog unavailable: {self._last_error}")
+        if self.is_stale():
+            self._stats["stale_served"] += 1
+            if time.monotonic() >= self._retry_at:
+                self._refresh_in_background()
+        return self._entries
+
+    async def _warm(self) -> None:
+        try:
+            await self.entries()
+        except RuntimeError as e:
+            logger.warning(str(e))
+
+    def warm_up(self) -> None:
+        """Load the snapshot (refreshing it if stale) without blocking startup."""
+        asyncio.create_task(self._warm())
+
+    # ----- queries -----------------------------------------------------------------
+
+    async def query(
+        self,
+        q: Optional[str] = None,
+        capabilities: Sequence[str] = (),
+        max_size: Optional[float] = None,
+        sort: Optional[str] = None,
+        descending: bool = True,
+        offset: int = 0,
+        limit: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Filter, sort and page the catalog.
+
+        ``q`` matches name or description, every capability must be
+        present and ``max_size`` (billions of parameters) keeps models with
+        at least one variant that small. ``size`` sorts by the smallest
+        variant; without ``sort`` the catalog's own order is kept.
+        """
+        entries = await self.entries()
+        needle = q.strip().lower() if q else ""
+        wanted = {c.strip().lower() for c in capabilities if c.strip()}
+        matches = [
+            e for e in entries
+            if (not needle or needle in e.text)
+            and wanted <= e.capabilities
+            and (max_size is None or (e.min_size is not None and e.min_size <= max_size))
+        ]
+        if sort == "pulls":
+            matches.sort(key=lambda e: e.pulls, reverse=descending)
+        elif sort == "size":
+            # Models without a size tag go last either way
+            sized = sorted((e for e in matches if e.min_size is not None), key=lambda e: e.min_size, reverse=descending)
+            matches = sized + [e for e in matches if e.min_size is None]
+        elif sort == "name":
+            matches.sort(key=lambda e: e.name, reverse=descending)
+        window = matches[offset:offset + limit] if limit is not None else matches[offset:]
+        return {
+            "models": [e.model for e in window],
+            "total": len(matches),
+            "offset": offset,
+            "limit": limit,
+            "source": self._source,
+            "fetched_at": self._fetched_at or None,
+            "stale": self.is_stale()
+        }
+
+    def version(self) -> tuple:
+        """Changes whenever a new snapshot is installed; used for ETags."""
+        return (self._source, self._fetched_at, len(self._entries or ()))
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "models": len(self._entries or ()),
+            "source": self._source,
+            "fetched_at": self._fetched_at or None,
+            "age_s": round(time.time() - self._fetched_at, 1) if self._fetched_at else None,
+            "stale": self.is_stale(),
+            "refreshing": self._refresh is not None and not self._refresh.done(),
+            "offline": self.offline,
+            "last_error": self._last_error
+        }
+
+
+model_catalog = ModelCatalog()
@@ -0,0 +1,296 @@
+import asyncio
+import logging
+import math
+import re
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, Optional
+
+from .. import config
+from .generation_cache import normalize_model
+from .metrics import model_lifecycle_actions
+from .model_registry import model_registry
+from .ollama_client import ollama
+from .scheduler import scheduler
+
+logger = logging.getLogger(__name__)
+
+_MB = 1024 * 1024
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+# Ollama writes nanoseconds, datetime.fromisoformat() takes microseconds at most
+_EXPIRES_AT = re.compile(r"^(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d)(\.\d{1,6})?\d*(Z|[+-]\d\d:\d\d)?$")
+
+
+def keep_alive_seconds(value: str) -> Optional[float]:
+    """Seconds in an Ollama ``keep_alive`` ("30m", "1h30m", "300"); None when negative (kept loaded forever)."""
+    value = value.strip()
+    try:
+        seconds = float(value)
+    except ValueError:
+        unsigned = value.lstrip("-")
+        parts = _DURATION_PART.findall(unsigned)
+        if not parts or "".join(number + unit for number, unit in parts) != unsigned:
+            raise ValueError(f"Invalid keep_alive duration: {value!r}")
+        seconds = sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+        if value.startswith("-"):
+            seconds = -seconds
+    return None if seconds < 0 else seconds
+
+
+def _seconds_left(expires_at: Optional[str]) -> Optional[float]:
+    """Seconds until Ollama unloads a model, from ``/api/ps`` ``expires_at``; inf when it never does."""
+    match = _EXPIRES_AT.match(expires_at or "")
+    if not match:
+        return None
+    zone = match.group(3) or "+00:00"
+    stamp = datetime.fromisoformat(match.group(1) + (match.group(2) or "") + ("+00:00" if zone == "Z" else zone))
+    left = stamp.timestamp() - time.time()
+    # Models loaded with a negative keep_alive report a date centuries away
+    return math.inf if left > 10 * 365 * 24 * 3600 else left
+
+
+def _name(model: Dict[str, Any]) -> str:
+    return normalize_model(model.get("name") or model.get("model") or "")
+
+
+class ModelLifecycle:
+    """
+    Decides which Ollama models stay loaded.
+
+    * A new chat session's model is preloaded with an empty ``generate``
+      request carrying ``keep_alive``, so the first message does not wait
+      for the weights to load.
+    * Models used (or preloaded) in the last ``hot_seconds`` get their
+      ``keep_alive`` renewed before Ollama would unload them.
+    * While the loaded models (``size`` in ``/api/ps``) take more than the
+      memory budget, idle models without running or queued generations are
+      unloaded, least recently used first. A preload makes room the same way.
+
+    Every generation admitted by the scheduler counts as a hit when its
+    model was already loaded. Recent decisions are kept for
+    ``GET /model/lifecycle``.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = config.MODEL_LIFECYCLE_ENABLED,
+        keep_alive: str = config.MODEL_KEEP_ALIVE,
+        hot_seconds: float = config.MODEL_HOT_SECONDS,
+        memory_budget_mb: int = config.MODEL_MEMORY_BUDGET_MB,
+        interval: float = config.MODEL_LIFECYCLE_INTERVAL_SECONDS,
+        decisions: int = config.MODEL_LIFECYCLE_DECISIONS,
+    ):
+        self.enabled = enabled
+        self.keep_alive = keep_alive
+        self.keep_alive_seconds = keep_alive_seconds(keep_alive)
+        # Ollama reads a number as seconds but a string as a Go duration, where "300" is invalid
+        self._keep_alive_param = float(keep_alive) if re.fullmatch(r"-?\d+(\.\d+)?", keep_alive.strip()) else keep_alive.strip()
+        self.hot_seconds = hot_seconds
+        self.budget_bytes = memory_budget_mb * _MB
+        self.interval = interval
+
+        # Normalized model name -> monotonic time of the last admitted generation / our last preload
+        self._last_used: Dict[str, float] = {}
+        self._preloaded: Dict[str, float] = {}
+        self._pending: Dict[str, asyncio.Task] = {}
+        self._decisions: Deque[Dict[str, Any]] = deque(maxlen=decisions)
+        # Budget decisions (timer and preloads) see one consistent /api/ps view at a time
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {"uses": 0, "hits": 0, "preload_hits": 0, "preloads": 0, "keep_alives": 0, "unloads": 0, "failures": 0}
+
+    # ----- usage -------------------------------------------------------------------
+
+    def note_use(self, model: str, hot: bool) -> None:
+        """Scheduler listener: a generation for ``model`` was admitted; ``hot`` if it was loaded."""
+        name = normalize_model(model)
+        self._last_used[name] = time.monotonic()
+        self._stats["uses"] += 1
+        if hot:
+            self._stats["hits"] += 1
+        if self._preloaded.pop(name, None) is not None and hot:
+            self._stats["preload_hits"] += 1
+
+    def _touched(self, name: str) -> float:
+        return max(self._last_used.get(name, 0.0), self._preloaded.get(name, 0.0))
+
+    def _is_hot(self, name: str, now: float) -> bool:
+        touched = self._touched(name)
+        return touched > 0 and now - touched < self.hot_seconds
+
+    # ----- actions -----------------------------------------------------------------
+
+    def _decide(self, action: str, model: str, outcome: str, reason: str, **details) -> Dict[str, Any]:
+        decision = {
+            "at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "action": action,
+            "model": model,
+            "outcome": outcome,
+            "reason": reason,
+            **details
+        }
+        self._decisions.append(decision)
+        model_lifecycle_actions.inc(action=action, outcome=outcome)
+        if outcome == "failed":
+            self._stats["failures"] += 1
+            logger.warning(f"Model {action} of {model} failed: {reason}")
+        else:
+            logger.info(f"Model {action} of {model}: {outcome} ({reason})")
+        return decision
+
+    async def _send(self, name: str, keep_alive: Any):
+        """An empty generation: loads ``name`` (or unloads it with keep_alive 0) without generating."""
+        started = time.perf_counter()
+        response = await ollama.request("generate", "POST", {"model": name, "keep_alive": keep_alive}, retries=0)
+        return response.get("error"), round((time.perf_counter() - started) * 1000, 1)
+
+    async def _running(self) -> Dict[str, Dict[str, Any]]:
+        return {_name(m): m for m in await model_registry.running() if _name(m)}
+
+    async def _unload(self, name: str, size: int, reason: str) -> bool:
+        error, ms = await self._send(name, 0)
+        self._preloaded.pop(name, None)
+        if error is None:
+            self._stats["unloads"] += 1
+        self._decide("unload", name, "failed" if error else "ok", error or reason, size_mb=round(size / _MB), ms=ms)
+        return error is None
+
+    async def _make_room(self, running: Dict[str, Dict[str, Any]], needed: int, reason: str) -> bool:
+        """Unload idle models until ``needed`` more bytes fit in the budget; whether anything was unloaded."""
+        if not self.budget_bytes:
+            return False
+        total = sum(m.get("size", 0) for m in running.values())
+        now = time.monotonic()
+        idle = sorted((n for n in running if not self._is_hot(n, now) and not scheduler.busy(n)), key=self._touched)
+        unloaded = False
+        for name in idle:
+            if total + needed <= self.budget_bytes:
+                break
+            size = running[name].get("size", 0)
+            if await self._unload(name, size, reason):
+                total -= size
+                unloaded = True
+        return unloaded
+
+    async def _preload(self, name: str, reason: str) -> Dict[str, Any]:
+        async with self._lock:
+            installed = {_name(m): m for m in await model_registry.installed()}
+            if installed and name not in installed:
+                return self._decide("preload", name, "skipped", "not installed")
+            running = await self._running()
+            loaded = name in running
+            if not loaded:
+                size = (installed.get(name) or {}).get("size", 0)
+                await self._make_room(running, size, f"make room for {name}")
+        # Loading can take a while; the lock only covers the budget decision
+        error, ms = await self._send(name, self._keep_alive_param)
+        if error is None:
+            self._preloaded[name] = time.monotonic()
+            self._stats["preloads"] += 1
+        decision = self._decide("preload", name, "failed" if error else "ok", error or reason,
+                                was_loaded=loaded, ms=ms)
+        await model_registry.refresh()
+        return decision
+
+    def preload_soon(self, model: str, reason: str) -> Optional[asyncio.Task]:
+        """Start preloading ``model`` in the background; a preload already under way is reused."""
+        if not self.enabled or not model:
+            return None
+        name = normalize_model(model)
+        task = self._pending.get(name)
+        if task is None:
+            task = asyncio.create_task(self._preload(name, reason))
+            self._pending[name] = task
+            task.add_done_callback(lambda _: self._pending.pop(name, None))
+        return task
+
+    # ----- timer -------------------------------------------------------------------
+
+    async def tick(self) -> None:
+        """Renew ``keep_alive`` of hot models about to expire, then unload idle models over the budget."""
+        changed = False
+        async with self._lock:
+            running = await self._running()
+            now = time.monotonic()
+            for name, model in running.items():
+                if not self._is_hot(name, now):
+                    continue
+                left = _seconds_left(model.get("expires_at"))
+                if left is None or left > 2 * self.interval:
+                    continue
+                if self.keep_alive_seconds is not None and self.keep_alive_seconds <= left:
+                    continue
+                error, ms = await self._send(name, self._keep_alive_param)
+                if error is None:
+                    self._stats["keep_alives"] += 1
+                changed = True
+                self._decide("keep_alive", name, "failed" if error else "ok",
+                             error or f"used {round(now - self._touched(name))}s ago", expires_in_s=round(left), ms=ms)
+            changed = await self._make_room(running, 0, "over memory budget") or changed
+        if changed:
+            await model_registry.refresh()
+
+    async def _run(self):
+        while True:
+            try:
+                await self.tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Model lifecycle check failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if not self.enabled:
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        for model in config.MODEL_PRELOAD:
+            self.preload_soon(model, "startup")
+
+    async def stop(self) -> None:
+        tasks = list(self._pending.values())
+        if self._task is not None:
+            tasks.append(self._task)
+            self._task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    # ----- reporting ---------------------------------------------------------------
+
+    def stats(self, decisions: int = 50) -> dict:
+        now = time.monotonic()
+        models = []
+        for model in model_registry.snapshot()["running"]:
+            name = _name(model)
+            touched = self._touched(name)
+            left = _seconds_left(model.get("expires_at"))
+            models.append({
+                "model": name,
+                "size_mb": round(model.get("size", 0) / _MB),
+                "hot": self._is_hot(name, now),
+                "busy": scheduler.busy(name),
+                "idle_s": round(now - touched, 1) if touched else None,
+                "expires_in_s": None if left is None or math.isinf(left) else round(left)
+            })
+        uses = self._stats["uses"]
+        return {
+            "enabled": self.enabled,
+            "keep_alive": self.keep_alive,
+            "hot_seconds": self.hot_seconds,
+            "memory_budget_mb": self.budget_bytes // _MB or None,
+            "loaded_mb": sum(m["size_mb"] for m in models),
+            "models": models,
+            **self._stats,
+            "hit_rate": round(self._stats["hits"] / uses, 3) if uses else None,
+            "pending_preloads": sorted(self._pending),
+            "decisions": list(self._decisions)[::-1][:decisions]
+        }
+
+
+# Shared instance; every generation admitted by the scheduler counts as a use
+model_lifecycle = ModelLifecycle()
+scheduler.add_listener(model_lifecycle.note_use)
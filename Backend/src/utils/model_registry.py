@@ -0,0 +1,216 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from .. import config
+from .context_builder import forget_context_length
+from .embedder import record_model_digest
+from .generation_cache import note_installed_models
+from .ollama_client import ollama
+from .scheduler import scheduler
+
+logger = logging.getLogger(__name__)
+
+
+def _name(model: Dict[str, Any]) -> str:
+    return model.get("name") or model.get("model") or ""
+
+
+def describe_installed(model: Dict[str, Any]) -> Dict[str, Any]:
+    """An ``/api/tags`` entry in the shape the frontend expects."""
+    return {
+        "model_name": model.get("model") or model.get("name") or "",  # for compatibility
+        "name": _name(model),
+        "details": model.get("details", {}),
+        "size": model.get("size", 0),
+        "modified_at": model.get("modified_at", ""),
+        "digest": model.get("digest", "")
+    }
+
+
+class ModelRegistry:
+    """
+    In-memory view of the local Ollama server: installed models, models
+    loaded in memory and the server version.
+
+    A background task re-reads ``/api/tags``, ``/api/ps`` and
+    ``/api/version`` every ``MODEL_REGISTRY_REFRESH_SECONDS``; pulls and
+    deletes refresh it right away. Requests are answered from memory.
+    ``/api/show`` answers are cached per digest, so an updated model is
+    looked up again. Every change is pushed to subscribers, which lets
+    clients follow it instead of polling.
+    """
+
+    def __init__(self, interval: float = config.MODEL_REGISTRY_REFRESH_SECONDS):
+        self.interval = interval
+        self._installed: Dict[str, Dict[str, Any]] = {}
+        self._running: Dict[str, Dict[str, Any]] = {}
+        self._ollama: Dict[str, Any] = {"up": False, "version": None, "error": None}
+        self._info: Dict[str, tuple] = {}
+        self._version = 0
+        self._refreshed_at = 0.0
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._stats = {"refreshes": 0, "changes": 0, "info_hits": 0, "info_misses": 0}
+
+    # ----- refreshing --------------------------------------------------------------
+
+    async def refresh(self) -> Optional[Dict[str, Any]]:
+        """Re-read Ollama's state; returns the change event, or None when nothing changed."""
+        async with self._lock:
+            tags, ps, version = await asyncio.gather(
+                ollama.request("tags", "GET", retries=0),
+                ollama.request("ps", "GET", retries=0),
+                ollama.request("version", "GET", retries=0)
+            )
+            self._refreshed_at = time.monotonic()
+            self._stats["refreshes"] += 1
+            up = "error" not in version
+            ollama_state = {"up": up, "version": version.get("version") if up else None, "error": version.get("error")}
+            changes: Dict[str, Any] = {}
+            if ollama_state["up"] != self._ollama["up"] or ollama_state["version"] != self._ollama["version"]:
+                changes["ollama"] = ollama_state
+            self._ollama = ollama_state
+
+            if "models" in tags:
+                installed = {_name(m): m for m in tags["models"] if _name(m)}
+                added = sorted(installed.keys() - self._installed.keys())
+                removed = sorted(self._installed.keys() - installed.keys())
+                updated = sorted(n for n in installed.keys() & self._installed.keys()
+                                 if installed[n].get("digest") != self._installed[n].get("digest"))
+                for name in removed + updated:
+                    self._info.pop(name, None)
+                    forget_context_length(name)
+                self._installed = installed
+                # Cached generations and embeddings of an updated model are dropped by digest
+                note_installed_models(tags["models"])
+                record_model_digest(tags["models"])
+                if added or removed or updated:
+                    changes.update(added=added, removed=removed, updated=updated)
+
+            if "models" in ps:
+                running = {_name(m): m for m in ps["models"] if _name(m)}
+                started = sorted(running.keys() - self._running.keys())
+                stopped = sorted(self._running.keys() - running.keys())
+                self._running = running
+                scheduler.update_loaded_models(ps)
+                if started or stopped:
+                    changes.update(started=started, stopped=stopped)
+
+            if not changes:
+                return None
+            self._version += 1
+            self._stats["changes"] += 1
+            event = {"type": "changed", "version": self._version, **changes}
+            self._publish(event)
+            return event
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Model registry refresh failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _ensure_fresh(self) -> None:
+        # Only before the first refresh, or when the timer is not running
+        if time.monotonic() - self._refreshed_at > self.interval * 2:
+            if self._lock.locked():
+                # Another request is refreshing already: use its answer
+                async with self._lock:
+                    return
+            await self.refresh()
+
+    # ----- reads -------------------------------------------------------------------
+
+    async def installed(self) -> List[Dict[str, Any]]:
+        """``/api/tags`` models, as last seen."""
+        await self._ensure_fresh()
+        return list(self._installed.values())
+
+    async def running(self) -> List[Dict[str, Any]]:
+        """``/api/ps`` models, as last seen."""
+        await self._ensure_fresh()
+        return list(self._running.values())
+
+    async def status(self) -> Dict[str, Any]:
+        await self._ensure_fresh()
+        return dict(self._ollama)
+
+    async def info(self, model: str) -> Dict[str, Any]:
+        """``/api/show`` for ``model``, fetched once per model digest."""
+        await self._ensure_fresh()
+        if model not in self._installed and ":" not in model:
+            model = f"{model}:latest"
+        digest = (self._installed.get(model) or {}).get("digest")
+        cached = self._info.get(model)
+        if cached is not None and digest is not None and cached[0] == digest:
+            self._stats["info_hits"] += 1
+            return cached[1]
+        self._stats["info_misses"] += 1
+        response = await ollama.request("show", "POST", {"model": model})
+        if digest is not None and "error" not in response:
+            self._info[model] = (digest, response)
+        return response
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "type": "snapshot",
+            "version": self._version,
+            "ollama": dict(self._ollama),
+            "installed": [describe_installed(m) for m in self._installed.values()],
+            "running": list(self._running.values())
+        }
+
+    # ----- change feed -------------------------------------------------------------
+
+    def subscribe(self) -> asyncio.Queue:
+        """Queue receiving the current snapshot, then every change event."""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=config.MODEL_REGISTRY_SUBSCRIBER_QUEUE)
+        queue.put_nowait(self.snapshot())
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self._subscribers.discard(queue)
+
+    def _publish(self, event: Dict[str, Any]) -> None:
+        for queue in self._subscribers:
+            if queue.full():
+                # A slow client gets a fresh snapshot instead of the backlog
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(self.snapshot())
+            else:
+                queue.put_nowait(event)
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "version": self._version,
+            "installed": len(self._installed),
+            "running": len(self._running),
+            "ollama_up": self._ollama["up"],
+            "info_cached": len(self._info),
+            "subscribers": len(self._subscribers),
+            "age_s": round(time.monotonic() - self._refreshed_at, 1) if self._refreshed_at else None,
+            "timer": self._task is not None and not self._task.done()
+        }
+
+
+model_registry = ModelRegistry()
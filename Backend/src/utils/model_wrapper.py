@@ -1,11 +1,12 @@
-import requests
+from .ollama_client import OllamaClient, ollama
 
 class LocalLLMWrapper:
-    def __init__(self, base_url: str = "http://localhost:11434", model_name: str = "llama3"):
-        self.base_url = base_url.rstrip("/")
+    def __init__(self, base_url: str = None, model_name: str = "llama3"):
+        # Reuse the shared pooled client unless a different server is requested
+        self.client = OllamaClient(base_url.rstrip("/") + "/api/") if base_url else ollama
         self.model_name = model_name
 
-    def call(self, messages: list[dict], stream: bool = False) -> str:
+    async def call(self, messages: list[dict], stream: bool = False) -> str:
         """
         Call the local model with a list of messages (chat format).
 
@@ -20,19 +21,18 @@ class LocalLLMWrapper:
                 "messages": messages,
                 "stream": stream
             }
-            response = requests.post(f"{self.base_url}/api/chat", json=payload)
-            response.raise_for_status()
+            if not stream:
+                response = await self.client.request("chat", "POST", payload)
+                if "error" in response:
+                    raise RuntimeError(response["error"])
+                return response.get("message", {}).get("content", "").strip()
 
-            # Handle multi-line JSON (Ollama streams this way)
-            lines = response.text.strip().splitlines()
+            # Ollama streams multi-line JSON, join the chunks
             full_text = ""
-            for line in lines:
-                try:
-                    json_line = response.json() if not stream else eval(line)
-                    full_text += json_line.get("message", {}).get("content", "")
-                except Exception:
-                    continue
-
+            async for chunk in self.client.stream("chat", payload):
+                if "error" in chunk:
+                    raise RuntimeError(chunk["error"])
+                full_text += chunk.get("message", {}).get("content", "")
             return full_text.strip()
 
         except Exception as e:
@@ -0,0 +1,203 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpx
+
+from .. import config
+from .metrics import llm_requests, record_generation
+
+logger = logging.getLogger(__name__)
+
+# Read timeouts per Ollama route. Generations can legitimately take minutes,
+# metadata calls should fail fast.
+ROUTE_TIMEOUTS = {
+    "chat": httpx.Timeout(300.0, connect=5.0),
+    "generate": httpx.Timeout(300.0, connect=5.0),
+    "embeddings": httpx.Timeout(60.0, connect=5.0),
+    "embed": httpx.Timeout(60.0, connect=5.0),
+    "show": httpx.Timeout(15.0, connect=5.0),
+    "tags": httpx.Timeout(10.0, connect=5.0),
+    "ps": httpx.Timeout(10.0, connect=5.0),
+    "delete": httpx.Timeout(60.0, connect=5.0),
+    # Verifying a large download can go quiet for minutes
+    "pull": httpx.Timeout(600.0, connect=5.0),
+}
+DEFAULT_TIMEOUT = httpx.Timeout(30.0, connect=5.0)
+
+RETRY_STATUS = {502, 503, 504}
+# Failures before the request reached Ollama; safe to retry on any route
+CONNECT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout)
+# Calls recorded in the LLM metrics
+GENERATION_ROUTES = {"chat", "generate"}
+
+
+def ollama_api() -> str:
+    return config.OLLAMA_HOST + "/api/"
+
+
+class OllamaClient:
+    """
+    Shared async client for the Ollama HTTP API.
+
+    One pooled ``httpx.AsyncClient`` is reused by every route so connections
+    are kept alive between calls. Failed connections and 502/503/504 answers
+    are retried with exponential backoff; a connection dropped mid-answer is
+    only retried for metadata calls, never for generations. Cancelling the
+    awaiting task aborts the in-flight request.
+    """
+
+    def __init__(self, base_url: Optional[str] = None):
+        self.base_url = base_url or ollama_api()
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"Content-Type": "application/json"},
+                limits=httpx.Limits(
+                    max_connections=config.OLLAMA_MAX_CONNECTIONS,
+                    max_keepalive_connections=config.OLLAMA_MAX_KEEPALIVE,
+                ),
+                timeout=DEFAULT_TIMEOUT,
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @staticmethod
+    def _timeout(path: str) -> httpx.Timeout:
+        return ROUTE_TIMEOUTS.get(path.strip("/").split("/")[0], DEFAULT_TIMEOUT)
+
+    @staticmethod
+    async def _backoff(attempt: int):
+        delay = config.OLLAMA_RETRY_BACKOFF * (2 ** attempt)
+        await asyncio.sleep(delay + random.uniform(0, delay / 2))
+
+    async def request(self, path: str, method: str = "POST", data: Optional[Dict[str, Any]] = None,
+                      retries: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Call an Ollama endpoint and return the decoded JSON body.
+
+        Like the old ``curl`` helper this never raises for transport errors:
+        failures come back as ``{"error": ...}``. Cancellation is propagated.
+        """
+        if path not in GENERATION_ROUTES or not data or not (data.get("prompt") or data.get("messages")):
+            # Model load/unload requests (no prompt) are not generations
+            return await self._request(path, method, data, retries)
+        started = time.perf_counter()
+        response = await self._request(path, method, data, retries)
+        record_generation(data.get("model", ""), path, response, time.perf_counter() - started)
+        return response
+
+    async def _request(self, path: str, method: str, data: Optional[Dict[str, Any]],
+                       retries: Optional[int]) -> Dict[str, Any]:
+        retries = config.OLLAMA_MAX_RETRIES if retries is None else retries
+        # A connection dropped mid-generation would run the whole generation again,
+        # so only idempotent metadata calls also retry it
+        retryable = CONNECT_ERRORS if path.strip("/").split("/")[0] in GENERATION_ROUTES \
+            else CONNECT_ERRORS + (httpx.RemoteProtocolError,)
+        attempt = 0
+        while True:
+            try:
+                response = await self.client.request(
+                    method, path,
+                    json=data if data else None,  # Don't send `{}` as default
+                    timeout=self._timeout(path),
+                )
+                if response.status_code in RETRY_STATUS and attempt < retries:
+                    logger.warning(f"Ollama {path} answered {response.status_code}, retrying")
+                    await self._backoff(attempt)
+                    attempt += 1
+                    continue
+                if not response.content:
+                    return {}
+                try:
+                    return response.json()
+                except ValueError:
+                    return {"error": "Invalid JSON response", "response_text": response.text}
+            except retryable as e:
+                if attempt < retries:
+                    logger.warning(f"Ollama {path} connection failed ({e}), retrying")
+                    await self._backoff(attempt)
+                    attempt += 1
+                    continue
+                return {"error": str(e)}
+            except httpx.HTTPError as e:
+                return {"error": str(e)}
+
+    async def stream(self, path: str, data: Dict[str, Any], method: str = "POST",
+                     retries: Optional[int] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream an endpoint that answers with newline-delimited JSON.
+
+        Yields each decoded chunk as Ollama produces it. Only the connection
+        phase is retried; once chunks have been yielded an error ends the
+        stream with a single ``{"error": ...}`` chunk.
+        """
+        if path not in GENERATION_ROUTES:
+            async with aclosing(self._stream(path, data, method, retries)) as chunks:
+                async for chunk in chunks:
+                    yield chunk
+            return
+        model = data.get("model", "")
+        started = time.perf_counter()
+        first_token = None
+        finished = False
+        try:
+            async with aclosing(self._stream(path, data, method, retries)) as chunks:
+                async for chunk in chunks:
+                    if first_token is None and (chunk.get("response") or (chunk.get("message") or {}).get("content")):
+                        first_token = time.perf_counter() - started
+                    if chunk.get("done") or "error" in chunk:
+                        finished = True
+                        record_generation(model, path, chunk, time.perf_counter() - started, first_token)
+                    yield chunk
+        finally:
+            if not finished:
+                # The client went away before Ollama was done
+                llm_requests.inc(model=model, endpoint=path, outcome="cancelled")
+
+    async def _stream(self, path: str, data: Dict[str, Any], method: str,
+                      retries: Optional[int]) -> AsyncIterator[Dict[str, Any]]:
+        retries = config.OLLAMA_MAX_RETRIES if retries is None else retries
+        attempt = 0
+        while True:
+            try:
+                async with self.client.stream(method, path, json=data, timeout=self._timeout(path)) as response:
+                    if response.status_code in RETRY_STATUS and attempt < retries:
+                        await self._backoff(attempt)
+                        attempt += 1
+                        continue
+                    async for line in response.aiter_lines():
+                        if not line:
+                            continue
+                        try:
+                            yield json.loads(line)
+                        except ValueError:
+                            yield {"error": "Invalid JSON chunk", "response_text": line}
+                            return
+                return
+            except CONNECT_ERRORS as e:
+                if attempt < retries:
+                    await self._backoff(attempt)
+                    attempt += 1
+                    continue
+                yield {"error": str(e)}
+                return
+            except httpx.HTTPError as e:
+                yield {"error": str(e)}
+                return
+
+
+# Shared instance used across the API
+ollama = OllamaClient()
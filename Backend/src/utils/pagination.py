@@ -0,0 +1,67 @@
+import base64
+import hashlib
+import json
+from datetime import datetime
+from typing import Any, Optional, Tuple
+
+from fastapi import Request
+from sqlalchemy import and_, or_
+
+
+def encode_cursor(created_at: datetime, id_: str) -> str:
+    """Opaque cursor pointing just past the row with this ``(created_at, id)``."""
+    raw = json.dumps([created_at.isoformat(), id_], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, id_ = json.loads(raw)
+        return datetime.fromisoformat(created_at), str(id_)
+    except Exception:
+        raise ValueError("Invalid cursor") from None
+
+
+def keyset(statement, created_col, id_col, cursor: Optional[str], descending: bool = False):
+    """
+    Order ``statement`` by ``(created_col, id_col)`` and continue after ``cursor``.
+
+    Seeks straight to the next page through the created_at indexes instead
+    of counting past skipped rows like OFFSET does.
+    """
+    if descending:
+        statement = statement.order_by(created_col.desc(), id_col.desc())
+    else:
+        statement = statement.order_by(created_col, id_col)
+    if cursor:
+        created_at, id_ = decode_cursor(cursor)
+        if descending:
+            statement = statement.where(or_(created_col < created_at, and_(created_col == created_at, id_col < id_)))
+        else:
+            statement = statement.where(or_(created_col > created_at, and_(created_col == created_at, id_col > id_)))
+    return statement
+
+
+def page(rows, limit: Optional[int]):
+    """Split a ``limit + 1`` fetch into the page and the cursor for the next one."""
+    if limit is None or len(rows) <= limit:
+        return list(rows), None
+    rows = list(rows[:limit])
+    last = rows[-1]
+    return rows, encode_cursor(last.created_at, last.id)
+
+
+def make_etag(*parts: Any) -> str:
+    digest = hashlib.sha1(json.dumps(parts, default=str).encode()).hexdigest()[:24]
+    return f'W/"{digest}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(",")]
+    # Weak comparison: W/"x" and "x" are the same version
+    bare = etag[2:] if etag.startswith("W/") else etag
+    return "*" in tags or any((tag[2:] if tag.startswith("W/") else tag) == bare for tag in tags)
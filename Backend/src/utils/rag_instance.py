@@ -1,47 +1,353 @@
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_chroma import Chroma
-from langchain_core.documents import Document
-from typing import List, Optional
+from typing import TYPE_CHECKING, List, Optional
+from uuid import uuid4
+from .. import config
+from .embedding_cache import CachedEmbeddings, embedding_cache
+from .vector_store import SearchHit, VectorStore, make_vector_store
+from .lexical_index import LexicalIndex
+from .metrics import stage
+import asyncio
+import itertools
+import numpy as np
 import os
+import queue
+import threading
+import time
+from starlette.concurrency import run_in_threadpool
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
 
 class RAGEngine:
-    def __init__(self, db_path: str = "vector_db", embedding_model: str = "all-MiniLM-L6-v2"):
-        try:
-            self.embedding = HuggingFaceEmbeddings(model_name=embedding_model)
-            self.vectorstore = Chroma(
-                persist_directory=db_path,
-                embedding_function=self.embedding
-            )
-            self.retriever = self.vectorstore.as_retriever(
-                search_kwargs={"k": 5}
-            )
-            self.is_initialized = True
-        except Exception as e:
-            print(f"[RAG Init Error] {e}")
-            self.is_initialized = False
+    """
+    Retrieval over chat turns and documents: a vector store plus a BM25
+    index, fed by a background ingestion queue.
+
+    Nothing heavy happens in the constructor. The embedding model
+    (sentence-transformers/torch) and the stores are loaded on first use,
+    or warmed up in the background at startup, so importing the app stays
+    fast for processes that never touch RAG.
+    """
+
+    def __init__(
+        self,
+        db_path: str = config.VECTOR_STORE_PATH,
+        embedding_model: str = "all-MiniLM-L6-v2",
+        backend: str = config.VECTOR_STORE_BACKEND,
+        batch_size: int = config.RAG_INGEST_BATCH_SIZE,
+        flush_interval: float = config.RAG_INGEST_FLUSH_INTERVAL,
+        max_pending: int = config.RAG_INGEST_MAX_PENDING,
+    ):
+        # Ingestion queue, drained in batches by a background worker thread
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_pending)
+        self._pending = 0
+        self._pending_cond = threading.Condition()
+        self._worker: Optional[threading.Thread] = None
+        self._worker_lock = threading.Lock()
+        self._stats = {"enqueued": 0, "written": 0, "dropped": 0, "failed": 0, "batches": 0, "last_batch_ms": 0.0}
+        self.embedding_model = embedding_model
+        self.db_path = db_path
+        self.backend = backend
+        self.embedding = None
+        self.store: Optional[VectorStore] = None
+        self.lexical: Optional[LexicalIndex] = None
+        self._loaded = False
+        self._loading = False
+        self._load_lock = threading.Lock()
+        self._load_seconds: Optional[float] = None
+        self._load_error: Optional[str] = None
+        self._warmup = None
+
+    # ----- loading -----------------------------------------------------------------
+
+    @property
+    def state(self) -> str:
+        if self._loaded:
+            return "ready"
+        if self._loading or (self._warmup is not None and not self._warmup.done()):
+            return "loading"
+        return "failed" if self._load_error else "not_loaded"
+
+    def load(self) -> bool:
+        """
+        Load the embedding model and open the stores once (blocking). A
+        failed load is not retried; RAG then stays disabled. Returns whether
+        RAG is usable.
+        """
+        if self._loaded or self._load_error:
+            return self._loaded
+        with self._load_lock:
+            if self._loaded or self._load_error:
+                return self._loaded
+            self._loading = True
+            started = time.perf_counter()
+            try:
+                from langchain_huggingface import HuggingFaceEmbeddings
+                embedding = HuggingFaceEmbeddings(model_name=self.embedding_model)
+                if embedding_cache is not None:
+                    # Repeated questions and retrieval queries skip the MiniLM forward pass
+                    embedding = CachedEmbeddings(embedding, f"hf:{self.embedding_model}", embedding_cache)
+                self.embedding = embedding
+                self.store = make_vector_store(self.backend, self.db_path)
+                self.lexical = LexicalIndex(os.path.join(self.db_path, "lexical.db"))
+                self._loaded = True
+                self._load_seconds = round(time.perf_counter() - started, 3)
+                print(f"[RAG] Loaded {self.embedding_model} and the {self.backend} store in {self._load_seconds}s")
+                self._start_lexical_backfill()
+            except Exception as e:
+                self._load_error = f"{type(e).__name__}: {e}"
+                print(f"[RAG Init Error] {e}")
+            finally:
+                self._loading = False
+        return self._loaded
+
+    @property
+    def is_initialized(self) -> bool:
+        """Whether RAG is loaded and usable. Never loads it; entry points call ``load``/``ensure_loaded``."""
+        return self._loaded
 
-    def retrieve(self, query: str, k: int) -> List[Document]:
-        if not self.is_initialized:
+    async def ensure_loaded(self) -> bool:
+        if not self._loaded:
+            await run_in_threadpool(self.load)
+        return self._loaded
+
+    def warm_up(self) -> None:
+        """Start loading in the background so the first chat turn does not wait for the model."""
+        if not self._loaded and self._warmup is None:
+            self._warmup = asyncio.create_task(run_in_threadpool(self.load))
+
+    def load_stats(self) -> dict:
+        return {"state": self.state, "load_seconds": self._load_seconds, "load_error": self._load_error}
+
+    def retrieve(
+        self,
+        query: str,
+        k: int,
+        session_id: Optional[str] = None,
+        hybrid: bool = config.RAG_HYBRID,
+        min_score: float = config.RAG_MIN_SCORE,
+        mmr_lambda: float = config.RAG_MMR_LAMBDA,
+    ) -> List["Document"]:
+        """
+        Return up to ``k`` relevant chunks, restricted to ``session_id`` unless it is None.
+
+        Dense and BM25 candidates are merged, scored as a weighted blend of
+        cosine similarity and normalized BM25, dropped below ``min_score`` and
+        de-duplicated with maximal marginal relevance.
+        """
+        if k <= 0 or not self.load():
             return []
+        from langchain_core.documents import Document
         try:
-            self.retriever.search_kwargs["k"] = k
-            results=self.retriever.invoke(query)
-            filtered = [doc for doc in results if doc.metadata.get("score", 1.0) >= 0.7]
-            return results
+            where = {"session_id": session_id} if session_id else None
+            fetch = k * config.RAG_CANDIDATE_FACTOR
+            with stage("embedding"):
+                query_vector = _unit(np.asarray(self.embedding.embed_query(query), dtype=np.float32))
+
+            candidates: dict = {}
+            for hit in self.store.search(query_vector, fetch, where):
+                candidates[hit.id] = hit
+            lexical_scores = {}
+            if hybrid:
+                for hit in self.lexical.search(query, fetch, session_id=session_id):
+                    lexical_scores[hit.id] = hit.score
+                    candidates.setdefault(hit.id, hit)
+            if not candidates:
+                return []
+
+            # Dense hits carry their stored vector; BM25-only hits are looked up by id, never re-embedded
+            stored = self.store.get_vectors([h.id for h in candidates.values() if h.vector is None])
+            hits: List[SearchHit] = [
+                h if h.vector is not None else h._replace(vector=stored[h.id])
+                for h in candidates.values() if h.vector is not None or h.id in stored
+            ]
+            if not hits:
+                return []
+            vectors = _unit(np.stack([h.vector for h in hits]).astype(np.float32))
+            dense = vectors @ query_vector
+            if lexical_scores:
+                top = max(lexical_scores.values())
+                lexical = np.array([lexical_scores.get(h.id, 0.0) / top if top > 0 else 0.0 for h in hits])
+                weight = config.RAG_LEXICAL_WEIGHT
+                scores = (1 - weight) * dense + weight * lexical
+            else:
+                lexical = np.zeros(len(hits))
+                scores = dense
+
+            keep = np.flatnonzero(scores >= min_score)
+            selected = _mmr(vectors[keep], scores[keep], k, mmr_lambda)
+            return [
+                Document(
+                    page_content=hits[i].text,
+                    metadata={
+                        **hits[i].metadata,
+                        "score": round(float(scores[i]), 4),
+                        "dense_score": round(float(dense[i]), 4),
+                        "lexical_score": round(float(lexical[i]), 4),
+                    },
+                )
+                for i in keep[selected]
+            ]
         except Exception as e:
             print(f"[RAG Retrieval Error] {e}")
             return []
 
-    def add_to_store(self, content: str, metadata: Optional[dict] = None):
-        if not self.is_initialized or not content.strip():
+    def _start_lexical_backfill(self):
+        """Index documents stored before the lexical index existed, in the background."""
+        if self.lexical.count() or not self.store.count():
             return
+        # Only the documents present now; later additions are indexed by add_many
+        existing = self.store.count()
+
+        def backfill():
+            try:
+                total = self.lexical.backfill(itertools.islice(self.store.iter_documents(), existing))
+                print(f"[RAG Lexical] Indexed {total} existing document(s)")
+            except Exception as e:
+                print(f"[RAG Lexical Backfill Error] {e}")
+        threading.Thread(target=backfill, name="rag-lexical-backfill", daemon=True).start()
+
+    def add_to_store(self, content: str, metadata: Optional[dict] = None):
+        """Embed and store a single document synchronously."""
+        self.add_many([content], [metadata or {}])
+
+    def add_many(self, contents: List[str], metadatas: Optional[List[dict]] = None) -> int:
+        """
+        Embed and store a batch of documents synchronously.
+
+        All texts go through one ``embed_documents`` call and one bulk write.
+        Returns the number of documents stored.
+        """
+        if not self.load():
+            return 0
+        metadatas = metadatas or [{} for _ in contents]
+        texts, metas = [], []
+        for content, metadata in zip(contents, metadatas):
+            if content and content.strip():
+                texts.append(content.strip())
+                metas.append(metadata or {})
+        if not texts:
+            return 0
         try:
-            doc = Document(page_content=content.strip(), metadata=metadata or {})
-            self.vectorstore.add_documents([doc])
-            print(f"[RAG Add] Stored document: {content[:50]}...")
-            # self.vectorstore.persist()
+            # One vectorized embedding call and one bulk write for the whole batch
+            with stage("embedding"):
+                embeddings = self.embedding.embed_documents(texts)
+            self.add_embedded(texts, embeddings, metas)
+            print(f"[RAG Add] Stored {len(texts)} document(s): {texts[0][:50]}...")
+            return len(texts)
         except Exception as e:
             print(f"[RAG Add Error] {e}")
+            return 0
+
+    def add_embedded(self, texts: List[str], embeddings, metadatas: List[dict]) -> List[str]:
+        """Store documents whose embeddings were computed elsewhere (e.g. a worker process); returns their ids."""
+        ids = [str(uuid4()) for _ in texts]
+        self.store.add(ids, texts, embeddings, metadatas)
+        self.lexical.add(ids, texts, metadatas)
+        return ids
+
+    # ----- background ingestion ----------------------------------------------------
+
+    def enqueue(self, content: str, metadata: Optional[dict] = None,
+                timeout: float = config.RAG_INGEST_ENQUEUE_TIMEOUT) -> bool:
+        """
+        Queue a document for background embedding and storage.
+
+        Blocks for up to ``timeout`` seconds when the queue is full
+        (backpressure) and drops the document after that. Returns whether the
+        document was queued.
+        """
+        if not content or not content.strip() or not self.load():
+            return False
+        self._ensure_worker()
+        with self._pending_cond:
+            self._pending += 1
+        try:
+            self._queue.put((content, metadata or {}), timeout=timeout)
+        except queue.Full:
+            self._done(1)
+            self._stats["dropped"] += 1
+            print(f"[RAG Queue Full] Dropped document: {content[:50]}...")
+            return False
+        self._stats["enqueued"] += 1
+        return True
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every queued document has been written. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._pending_cond:
+            while self._pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._pending_cond.wait(remaining)
+        return True
+
+    def ingestion_stats(self) -> dict:
+        return {
+            **self._stats,
+            "pending": self._pending,
+            "queue_capacity": self._queue.maxsize,
+            "batch_size": self.batch_size,
+            "flush_interval_s": self.flush_interval,
+        }
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run_worker, name="rag-ingest", daemon=True)
+                self._worker.start()
+
+    def _done(self, count: int):
+        with self._pending_cond:
+            self._pending -= count
+            if not self._pending:
+                self._pending_cond.notify_all()
+
+    def _run_worker(self):
+        while True:
+            batch = [self._queue.get()]
+            # Fill the batch until it is full or the oldest document waited long enough
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            started = time.perf_counter()
+            try:
+                written = self.add_many([c for c, _ in batch], [m for _, m in batch])
+                self._stats["written"] += written
+                self._stats["failed"] += len(batch) - written
+                self._stats["batches"] += 1
+                self._stats["last_batch_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            finally:
+                self._done(len(batch))
+
+def _unit(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+def _mmr(vectors: np.ndarray, scores: np.ndarray, k: int, mmr_lambda: float) -> List[int]:
+    """Maximal marginal relevance: trade relevance against similarity to already picked chunks."""
+    selected: List[int] = []
+    remaining = list(np.argsort(-scores))
+    while remaining and len(selected) < k:
+        if not selected:
+            best = remaining[0]
+        else:
+            redundancy = (vectors[remaining] @ vectors[selected].T).max(axis=1)
+            marginal = mmr_lambda * scores[remaining] - (1 - mmr_lambda) * redundancy
+            best = remaining[int(np.argmax(marginal))]
+        selected.append(int(best))
+        remaining.remove(best)
+    return selected
 
 # Create a global instance to import in API
 rag = RAGEngine()
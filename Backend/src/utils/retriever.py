@@ -1,35 +1,26 @@
-import chromadb
-from chromadb.config import Settings
 from uuid import uuid4
+from .. import config
 from .embedder import embed_text
+from .vector_store import make_vector_store
 
-chroma_client = chromadb.Client(Settings(
-    persist_directory="./chroma_store",
-    chroma_db_impl="duckdb+parquet"
-))
+# Same pluggable store as RAGEngine; the old duckdb+parquet Chroma settings no longer exist
+collection = make_vector_store(config.VECTOR_STORE_BACKEND, "./chroma_store", collection="chat_chunks")
 
-collection = chroma_client.get_or_create_collection(name="chat_chunks")
-
-def add_message_to_vectorstore(chat_id, role, content):
-    embedding = embed_text(content)
+async def add_message_to_vectorstore(chat_id, role, content):
+    embedding = await embed_text(content)
     message_id = str(uuid4())
     metadata = {
         "chat_id": chat_id,
         "role": role,
     }
     collection.add(
-        documents=[content],
+        ids=[message_id],
+        texts=[content],
         embeddings=[embedding],
         metadatas=[metadata],
-        ids=[message_id],
     )
 
-def retrieve_relevant_messages(query, chat_id, top_k=6):
-    query_embedding = embed_text(query)
-    results = collection.query(
-        query_embeddings=[query_embedding],
-        n_results=top_k,
-        where={"chat_id": chat_id}
-    )
-    return [{"role": doc['metadata']['role'], "content": doc['document']} 
-            for doc in zip(results['metadatas'][0], results['documents'][0])]
+async def retrieve_relevant_messages(query, chat_id, top_k=6):
+    query_embedding = await embed_text(query)
+    hits = collection.search(query_embedding, top_k, where={"chat_id": chat_id})
+    return [{"role": hit.metadata.get("role"), "content": hit.text} for hit in hits]
@@ -0,0 +1,333 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Set
+
+from .. import config
+from .metrics import stage_latency
+from .ollama_client import ollama
+
+logger = logging.getLogger(__name__)
+
+
+class SchedulerOverloaded(Exception):
+    """Raised when a generation cannot be queued; carries a Retry-After hint in seconds."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("model", "session_id", "future", "enqueued_at")
+
+    def __init__(self, model: str, session_id: str):
+        self.model = model
+        self.session_id = session_id
+        self.future = asyncio.get_running_loop().create_future()
+        self.enqueued_at = time.monotonic()
+
+
+class Ticket:
+    """Handle for an admitted generation, returned by ``acquire``."""
+
+    __slots__ = ("model", "session_id", "wait_ms", "started_at", "released")
+
+    def __init__(self, model: str, session_id: str, wait_ms: float):
+        self.model = model
+        self.session_id = session_id
+        self.wait_ms = wait_ms
+        self.started_at = time.monotonic()
+        self.released = False
+
+
+class GenerationScheduler:
+    """
+    Admission control for LLM generations.
+
+    Limits in-flight generations overall and per model, queues the rest
+    round-robin across sessions so one chatty session cannot starve the
+    others, and sheds load once the queue is too deep. When a slot frees up
+    requests for models that are already running (or loaded in Ollama, as
+    reported by ``/api/ps``) are preferred, so Ollama is not forced to swap
+    weights in and out. A cold-model request that has waited longer than
+    ``starvation_seconds`` blocks further hot-model admissions until it runs.
+    """
+
+    def __init__(
+        self,
+        max_inflight: int = config.SCHEDULER_MAX_INFLIGHT,
+        max_inflight_per_model: int = config.SCHEDULER_MAX_INFLIGHT_PER_MODEL,
+        max_active_models: int = config.SCHEDULER_MAX_ACTIVE_MODELS,
+        max_queue_depth: int = config.SCHEDULER_MAX_QUEUE_DEPTH,
+        max_queue_per_session: int = config.SCHEDULER_MAX_QUEUE_PER_SESSION,
+        starvation_seconds: float = config.SCHEDULER_STARVATION_SECONDS,
+        ps_refresh_seconds: float = config.SCHEDULER_PS_REFRESH_SECONDS,
+    ):
+        self.max_inflight = max_inflight
+        self.max_inflight_per_model = max_inflight_per_model
+        self.max_active_models = max_active_models
+        self.max_queue_depth = max_queue_depth
+        self.max_queue_per_session = max_queue_per_session
+        self.starvation_seconds = starvation_seconds
+        self.ps_refresh_seconds = ps_refresh_seconds
+
+        # session_id -> FIFO of waiters; dict order is the round-robin order
+        self._queues: "OrderedDict[str, Deque[_Waiter]]" = OrderedDict()
+        self._queue_depth = 0
+        self._inflight: Dict[str, int] = {}
+        self._loaded_models: Set[str] = set()
+        self._loaded_refreshed_at = 0.0
+        self._refresh_task: Optional[asyncio.Task] = None
+
+        self._waits_ms: Deque[float] = deque(maxlen=500)
+        self._service_s: Deque[float] = deque(maxlen=200)
+        self._admitted = 0
+        self._rejected = 0
+        self._cold_starts = 0
+        # Called with (model, hot) on every admission
+        self._listeners: List[Callable[[str, bool], None]] = []
+
+    # ----- loaded-model tracking -------------------------------------------------
+
+    def update_loaded_models(self, ps_response) -> None:
+        """Feed the scheduler with Ollama's ``/api/ps`` answer (or a list of model names)."""
+        if isinstance(ps_response, dict):
+            models = ps_response.get("models")
+            if models is None:
+                return
+            names: Iterable[str] = (m.get("model") or m.get("name") or "" for m in models)
+        else:
+            names = ps_response
+        self._loaded_models = {_normalize(n) for n in names if n}
+        self._loaded_refreshed_at = time.monotonic()
+
+    def _maybe_refresh_loaded(self) -> None:
+        stale = time.monotonic() - self._loaded_refreshed_at > self.ps_refresh_seconds
+        if stale and (self._refresh_task is None or self._refresh_task.done()):
+            self._refresh_task = asyncio.create_task(self._refresh_loaded())
+
+    async def _refresh_loaded(self) -> None:
+        response = await ollama.request("ps", "GET", retries=0)
+        if "error" in response:
+            # Don't hammer a dead server, try again after the refresh interval
+            self._loaded_refreshed_at = time.monotonic()
+            return
+        self.update_loaded_models(response)
+        self._dispatch()
+
+    def _is_hot(self, model: str) -> bool:
+        return self._inflight.get(model, 0) > 0 or model in self._loaded_models
+
+    def add_listener(self, listener: Callable[[str, bool], None]) -> None:
+        """Call ``listener(model, hot)`` whenever a generation is admitted."""
+        self._listeners.append(listener)
+
+    def busy(self, model: str) -> bool:
+        """Whether ``model`` has a generation running or queued."""
+        model = _normalize(model)
+        return self._inflight.get(model, 0) > 0 or any(w.model == model for queue in self._queues.values() for w in queue)
+
+    # ----- admission ---------------------------------------------------------------
+
+    def _total_inflight(self) -> int:
+        return sum(self._inflight.values())
+
+    def _can_run(self, model: str) -> bool:
+        if self._total_inflight() >= self.max_inflight:
+            return False
+        running = self._inflight.get(model, 0)
+        if running >= self.max_inflight_per_model:
+            return False
+        if running == 0:
+            active = sum(1 for n in self._inflight.values() if n > 0)
+            if active >= self.max_active_models:
+                return False
+        return True
+
+    def _retry_after(self) -> int:
+        avg_service = (sum(self._service_s) / len(self._service_s)) if self._service_s else 5.0
+        waves = (self._queue_depth + 1) / max(1, self.max_inflight)
+        return max(1, int(round(avg_service * waves)))
+
+    def _start(self, model: str, session_id: str, enqueued_at: float) -> Ticket:
+        hot = self._is_hot(model)
+        if not hot:
+            self._cold_starts += 1
+        for listener in self._listeners:
+            listener(model, hot)
+        self._inflight[model] = self._inflight.get(model, 0) + 1
+        wait_ms = (time.monotonic() - enqueued_at) * 1000
+        self._waits_ms.append(wait_ms)
+        stage_latency.observe(wait_ms / 1000, stage="queue_wait")
+        self._admitted += 1
+        return Ticket(model, session_id, wait_ms)
+
+    async def acquire(self, model: str, session_id: str) -> Ticket:
+        """
+        Wait for a generation slot for ``model``.
+
+        Raises ``SchedulerOverloaded`` when the queue (global or per session)
+        is full. Cancelling the caller removes it from the queue.
+        """
+        self._maybe_refresh_loaded()
+        # "llama3" and "llama3:latest" are the same model and share its limits
+        model = _normalize(model)
+
+        if not self._queue_depth and self._can_run(model):
+            return self._start(model, session_id, time.monotonic())
+
+        if self._queue_depth >= self.max_queue_depth:
+            self._rejected += 1
+            raise SchedulerOverloaded("Generation queue is full", self._retry_after())
+        session_queue = self._queues.get(session_id)
+        if session_queue is not None and len(session_queue) >= self.max_queue_per_session:
+            self._rejected += 1
+            raise SchedulerOverloaded("Too many queued requests for this session", self._retry_after())
+
+        waiter = _Waiter(model, session_id)
+        self._queues.setdefault(session_id, deque()).append(waiter)
+        self._queue_depth += 1
+        # Other waiters may be blocked on a limit that does not apply to this model
+        self._dispatch()
+        try:
+            return await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Admitted just before the cancellation landed; hand the slot back
+                self.release(waiter.future.result())
+            else:
+                self._remove(waiter)
+                # A cancelled head waiter may have been holding up the ones behind it
+                self._dispatch()
+            raise
+
+    def release(self, ticket: Ticket) -> None:
+        if ticket.released:
+            return
+        ticket.released = True
+        remaining = self._inflight.get(ticket.model, 1) - 1
+        if remaining > 0:
+            self._inflight[ticket.model] = remaining
+        else:
+            self._inflight.pop(ticket.model, None)
+        self._service_s.append(time.monotonic() - ticket.started_at)
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, model: str, session_id: str):
+        ticket = await self.acquire(model, session_id)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    # ----- dispatching -------------------------------------------------------------
+
+    def _remove(self, waiter: _Waiter) -> None:
+        queue = self._queues.get(waiter.session_id)
+        if queue is None:
+            return
+        try:
+            queue.remove(waiter)
+        except ValueError:
+            return
+        self._queue_depth -= 1
+        if not queue:
+            del self._queues[waiter.session_id]
+
+    def _pop_head(self, session_id: str) -> _Waiter:
+        queue = self._queues[session_id]
+        waiter = queue.popleft()
+        self._queue_depth -= 1
+        if queue:
+            # Rotate the session to the back for round-robin fairness
+            self._queues.move_to_end(session_id)
+        else:
+            del self._queues[session_id]
+        return waiter
+
+    def _pick(self) -> Optional[str]:
+        """Choose the session whose head waiter should run next, or None."""
+        now = time.monotonic()
+        heads = [(sid, q[0]) for sid, q in self._queues.items()]
+
+        # A starving cold-model request gets exclusive priority
+        starving = [
+            (sid, w) for sid, w in heads
+            if not self._is_hot(w.model) and now - w.enqueued_at > self.starvation_seconds
+        ]
+        if starving:
+            sid, waiter = min(starving, key=lambda item: item[1].enqueued_at)
+            return sid if self._can_run(waiter.model) else None
+
+        # Prefer heads whose model is already running or resident
+        for sid, waiter in heads:
+            if self._is_hot(waiter.model) and self._can_run(waiter.model):
+                return sid
+        for sid, waiter in heads:
+            if self._can_run(waiter.model):
+                return sid
+        return None
+
+    def _dispatch(self) -> None:
+        while self._queue_depth:
+            session_id = self._pick()
+            if session_id is None:
+                return
+            waiter = self._pop_head(session_id)
+            if waiter.future.done():
+                continue
+            waiter.future.set_result(self._start(waiter.model, waiter.session_id, waiter.enqueued_at))
+
+    # ----- reporting ---------------------------------------------------------------
+
+    def stats(self) -> dict:
+        waits = sorted(self._waits_ms)
+        queued_per_model: Dict[str, int] = {}
+        for queue in self._queues.values():
+            for waiter in queue:
+                queued_per_model[waiter.model] = queued_per_model.get(waiter.model, 0) + 1
+        return {
+            "queue_depth": self._queue_depth,
+            "queued_sessions": len(self._queues),
+            "queued_per_model": queued_per_model,
+            "inflight": self._total_inflight(),
+            "inflight_per_model": dict(self._inflight),
+            "loaded_models": sorted(self._loaded_models),
+            "limits": {
+                "max_inflight": self.max_inflight,
+                "max_inflight_per_model": self.max_inflight_per_model,
+                "max_active_models": self.max_active_models,
+                "max_queue_depth": self.max_queue_depth,
+                "max_queue_per_session": self.max_queue_per_session,
+            },
+            "admitted": self._admitted,
+            "rejected": self._rejected,
+            "cold_starts": self._cold_starts,
+            "wait_ms": {
+                "avg": round(sum(waits) / len(waits), 1) if waits else 0.0,
+                "p50": _percentile(waits, 0.50),
+                "p95": _percentile(waits, 0.95),
+                "max": round(waits[-1], 1) if waits else 0.0,
+            },
+            "retry_after_estimate_s": self._retry_after(),
+        }
+
+
+def _normalize(model: str) -> str:
+    # Ollama reports "llama3:latest" for a request made with "llama3"
+    return model if ":" in model else f"{model}:latest"
+
+
+def _percentile(sorted_values, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return round(sorted_values[index], 1)
+
+
+# Shared scheduler for every generation route
+scheduler = GenerationScheduler()
@@ -0,0 +1,398 @@
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing, asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from .. import config
+from .metrics import stage
+
+SAMPLE_RATE = 16000
+# 16-bit mono PCM
+_BYTES_PER_SECOND = SAMPLE_RATE * 2
+_BLOCK_BYTES = max(2, _BYTES_PER_SECOND * config.STT_BLOCK_MS // 1000 // 2 * 2)
+_UPLOAD_READ_BYTES = 64 * 1024
+
+# Containers that keep their index at the end of the file cannot be decoded
+# from a pipe; these are spooled to a private temp directory first.
+_SEEKABLE_FORMATS = {"mp4", "m4a", "mov", "3gp"}
+
+# Recognition is CPU-bound; it runs here instead of on the event loop
+_pool = ThreadPoolExecutor(max_workers=config.STT_WORKERS, thread_name_prefix="stt")
+
+
+class SpeechError(Exception):
+    """The audio could not be transcribed (bad input, too long)."""
+
+
+class SpeechUnavailable(SpeechError):
+    """Speech-to-text is disabled, or its model or decoder (ffmpeg) cannot be used."""
+
+
+class SpeechEngine:
+    """
+    The Vosk model, loaded on first use (or warmed up in the background at
+    startup) and shared, plus a bounded pool of recognizers built on it.
+
+    A recognizer is reset and reused after each transcription instead of
+    being rebuilt; at most ``max_recognizers`` transcriptions run at once
+    and the rest wait up to ``acquire_timeout`` seconds for one.
+    """
+
+    def __init__(self, model_path: str = config.STT_MODEL_PATH,
+                 max_recognizers: int = config.STT_MAX_RECOGNIZERS,
+                 acquire_timeout: float = config.STT_ACQUIRE_TIMEOUT):
+        self.model_path = model_path
+        self.max_recognizers = max_recognizers
+        self.acquire_timeout = acquire_timeout
+        self._model = None
+        self._recognizer_class = None
+        self._load_lock = threading.Lock()
+        self._load_seconds: Optional[float] = None
+        self._load_error: Optional[str] = None
+        self._loading = False
+        self._warmup: Optional[asyncio.Task] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._idle: List = []
+        self._created = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._stats = {"acquired": 0, "timeouts": 0, "discarded": 0, "wait_seconds_total": 0.0, "max_wait_seconds": 0.0}
+
+    # ----- model -------------------------------------------------------------------
+
+    @property
+    def state(self) -> str:
+        if not config.STT_ENABLED:
+            return "disabled"
+        if self._model is not None:
+            return "ready"
+        if self._loading or (self._warmup is not None and not self._warmup.done()):
+            return "loading"
+        return "failed" if self._load_error else "not_loaded"
+
+    def load(self) -> None:
+        """Load the model once (blocking); later calls return immediately."""
+        if self._model is not None:
+            return
+        with self._load_lock:
+            if self._model is not None:
+                return
+            self._loading = True
+            started = time.perf_counter()
+            try:
+                from vosk import KaldiRecognizer, Model
+                if not os.path.isdir(self.model_path):
+                    raise FileNotFoundError(f"Vosk model not found at {self.model_path}")
+                self._model = Model(self.model_path)
+                self._recognizer_class = KaldiRecognizer
+                self._load_error = None
+                self._load_seconds = round(time.perf_counter() - started, 3)
+                print(f"[Speech] Loaded Vosk model from {self.model_path} in {self._load_seconds}s")
+            except Exception as e:
+                self._load_error = f"{type(e).__name__}: {e}"
+                print(f"[Speech] Could not load Vosk model: {self._load_error}")
+            finally:
+                self._loading = False
+
+    async def ensure_loaded(self) -> None:
+        if not config.STT_ENABLED:
+            raise SpeechUnavailable("Speech-to-text is disabled (STT_ENABLED=0)")
+        if self._model is None:
+            await run_in_threadpool(self.load)
+        if self._model is None:
+            raise SpeechUnavailable(f"Speech model unavailable: {self._load_error}")
+
+    def warm_up(self) -> None:
+        """Start loading the model in the background so the first transcription does not wait for it."""
+        if config.STT_ENABLED and self._model is None and self._warmup is None:
+            self._warmup = asyncio.create_task(run_in_threadpool(self.load))
+
+    # ----- recognizers -------------------------------------------------------------
+
+    def _new_recognizer(self):
+        return self._recognizer_class(self._model, SAMPLE_RATE)
+
+    async def acquire(self):
+        await self.ensure_loaded()
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_recognizers)
+        self._waiting += 1
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self._stats["timeouts"] += 1
+            raise SpeechUnavailable(f"All {self.max_recognizers} speech recognizers are busy, try again shortly")
+        finally:
+            self._waiting -= 1
+        waited = time.perf_counter() - started
+        self._stats["acquired"] += 1
+        self._stats["wait_seconds_total"] += waited
+        self._stats["max_wait_seconds"] = max(self._stats["max_wait_seconds"], waited)
+        self._in_use += 1
+        try:
+            if self._idle:
+                return self._idle.pop()
+            recognizer = await asyncio.get_running_loop().run_in_executor(_pool, self._new_recognizer)
+            self._created += 1
+            return recognizer
+        except BaseException:
+            self._in_use -= 1
+            self._slots.release()
+            raise
+
+    def release(self, recognizer, reusable: bool = True) -> None:
+        """Return a recognizer; one left in an unknown state (``reusable=False``) is dropped."""
+        self._in_use -= 1
+        if reusable:
+            try:
+                recognizer.Reset()
+                self._idle.append(recognizer)
+            except Exception:
+                reusable = False
+        if not reusable:
+            self._created -= 1
+            self._stats["discarded"] += 1
+        self._slots.release()
+
+    @asynccontextmanager
+    async def recognizer(self):
+        recognizer = await self.acquire()
+        reusable = True
+        try:
+            yield recognizer
+        except asyncio.CancelledError:
+            # A pool thread may still be feeding it a block
+            reusable = False
+            raise
+        finally:
+            self.release(recognizer, reusable)
+
+    def stats(self) -> dict:
+        acquired = self._stats["acquired"]
+        return {
+            "state": self.state,
+            "model_path": self.model_path,
+            "load_seconds": self._load_seconds,
+            "load_error": self._load_error,
+            "recognizers": {
+                "max": self.max_recognizers,
+                "created": self._created,
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                "waiting": self._waiting,
+                "utilization": round(self._in_use / self.max_recognizers, 3) if self.max_recognizers else 0.0,
+            },
+            "acquired": acquired,
+            "timeouts": self._stats["timeouts"],
+            "discarded": self._stats["discarded"],
+            "wait_seconds": {
+                "avg": round(self._stats["wait_seconds_total"] / acquired, 4) if acquired else 0.0,
+                "max": round(self._stats["max_wait_seconds"], 4),
+            },
+            "workers": config.STT_WORKERS,
+        }
+
+
+def audio_format(filename: Optional[str], content_type: Optional[str], default: str = "webm") -> str:
+    """Guess the container from the upload's file name or MIME type (``audio/webm;codecs=opus`` -> ``webm``)."""
+    if filename and "." in filename:
+        return filename.rsplit(".", 1)[1].lower()
+    if content_type and "/" in content_type:
+        subtype = content_type.split("/", 1)[1].split(";", 1)[0].strip().lower()
+        if subtype and subtype != "octet-stream":
+            return {"x-wav": "wav", "wave": "wav", "mpeg": "mp3", "x-m4a": "m4a"}.get(subtype, subtype)
+    return default
+
+
+async def iter_upload(file, size: int = _UPLOAD_READ_BYTES) -> AsyncIterator[bytes]:
+    while chunk := await file.read(size):
+        yield chunk
+
+
+class _Recognition:
+    """
+    One utterance fed to a Vosk recognizer block by block.
+
+    A recognizer is not thread-safe, but each instance is only ever used by
+    one block at a time (the caller awaits every step), so consecutive
+    blocks may run on different pool threads.
+    """
+
+    def __init__(self, recognizer, words: bool):
+        self._rec = recognizer
+        self._rec.SetWords(words)
+        self._partial = ""
+        self.segments: List[str] = []
+
+    def _segment(self, raw: str) -> List[Dict]:
+        result = json.loads(raw)
+        self._partial = ""
+        text = result.get("text", "")
+        if not text:
+            return []
+        self.segments.append(text)
+        event = {"type": "result", "text": text}
+        if "result" in result:
+            event["words"] = result["result"]
+        return [event]
+
+    def feed(self, pcm: bytes) -> List[Dict]:
+        if self._rec.AcceptWaveform(pcm):
+            return self._segment(self._rec.Result())
+        partial = json.loads(self._rec.PartialResult()).get("partial", "")
+        if partial == self._partial:
+            return []
+        self._partial = partial
+        return [{"type": "partial", "text": partial}]
+
+    def finish(self) -> List[Dict]:
+        events = self._segment(self._rec.FinalResult())
+        events.append({"type": "final", "text": " ".join(self.segments)})
+        return events
+
+
+async def _blocks(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Re-cut raw PCM into whole-sample blocks of ``STT_BLOCK_MS``."""
+    buffer = bytearray()
+    async for chunk in chunks:
+        buffer += chunk
+        while len(buffer) >= _BLOCK_BYTES:
+            yield bytes(buffer[:_BLOCK_BYTES])
+            del buffer[:_BLOCK_BYTES]
+    if len(buffer) >= 2:
+        yield bytes(buffer[:len(buffer) // 2 * 2])
+
+
+async def _feed(stdin: asyncio.StreamWriter, chunks: AsyncIterator[bytes]):
+    try:
+        async for chunk in chunks:
+            stdin.write(chunk)
+            await stdin.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        # ffmpeg stopped reading; its exit status says why
+        pass
+    finally:
+        stdin.close()
+
+
+async def _decode(chunks: AsyncIterator[bytes], fmt: str) -> AsyncIterator[bytes]:
+    """
+    Transcode any container ffmpeg understands to 16 kHz mono PCM as it arrives.
+
+    Audio is piped through ffmpeg's stdin/stdout, so nothing touches the disk
+    except MP4-style containers, which get a temp directory of their own
+    (at most ``STT_MAX_UPLOAD_BYTES``).
+    """
+    workdir = None
+    source = "pipe:0"
+    if fmt in _SEEKABLE_FORMATS:
+        workdir = tempfile.mkdtemp(prefix="privateprompt-stt-")
+        source = os.path.join(workdir, f"input.{fmt}")
+    process = None
+    feeder = None
+    try:
+        if workdir:
+            f = await run_in_threadpool(open, source, "wb")
+            try:
+                spooled = 0
+                async for chunk in chunks:
+                    spooled += len(chunk)
+                    if spooled > config.STT_MAX_UPLOAD_BYTES:
+                        raise SpeechError(f"{fmt} upload larger than {config.STT_MAX_UPLOAD_BYTES} bytes")
+                    await run_in_threadpool(f.write, chunk)
+            finally:
+                await run_in_threadpool(f.close)
+        try:
+            process = await asyncio.create_subprocess_exec(
+                config.FFMPEG_BINARY, "-hide_banner", "-loglevel", "error",
+                "-i", source, "-vn", "-f", "s16le", "-acodec", "pcm_s16le",
+                "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1",
+                stdin=asyncio.subprocess.DEVNULL if workdir else asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+        except OSError as e:
+            raise SpeechUnavailable(f"Cannot start {config.FFMPEG_BINARY}: {e}")
+        if not workdir:
+            feeder = asyncio.ensure_future(_feed(process.stdin, chunks))
+
+        while True:
+            try:
+                yield await process.stdout.readexactly(_BLOCK_BYTES)
+            except asyncio.IncompleteReadError as e:
+                if len(e.partial) >= 2:
+                    yield e.partial[:len(e.partial) // 2 * 2]
+                break
+        if feeder:
+            # Re-raises a failure of the audio source (e.g. client disconnect)
+            await feeder
+        if await process.wait() != 0:
+            detail = (await process.stderr.read()).decode(errors="replace").strip()
+            raise SpeechError(f"Could not decode {fmt} audio: {detail[-300:] or 'ffmpeg failed'}")
+    finally:
+        if feeder and not feeder.done():
+            feeder.cancel()
+        elif feeder and not feeder.cancelled():
+            # Already surfaced above, or moot because decoding was abandoned
+            feeder.exception()
+        if process and process.returncode is None:
+            process.kill()
+            await process.wait()
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+async def transcribe_stream(chunks: AsyncIterator[bytes], fmt: str = "webm", words: bool = False) -> AsyncIterator[Dict]:
+    """
+    Transcribe audio while it is still arriving.
+
+    ``chunks`` is any async source of encoded audio (upload body, WebSocket
+    frames); ``fmt="pcm"`` takes raw 16 kHz 16-bit mono and skips ffmpeg.
+    Yields ``partial`` events while a phrase is being spoken, a ``result``
+    per finished phrase and one ``final`` event with the whole text.
+    """
+    loop = asyncio.get_running_loop()
+    # Fail before reading any audio when speech-to-text cannot run at all
+    await speech_engine.ensure_loaded()
+    pcm = _blocks(chunks) if fmt == "pcm" else _decode(chunks, fmt)
+    limit = config.STT_MAX_SECONDS * _BYTES_PER_SECOND
+    received = 0
+    async with aclosing(pcm):
+        # A recognizer is only taken once there is audio for it, not while
+        # an upload is being spooled or a client has yet to speak
+        block = await anext(pcm, None)
+        async with speech_engine.recognizer() as recognizer:
+            recognition = _Recognition(recognizer, words)
+            while block is not None:
+                received += len(block)
+                if received > limit:
+                    raise SpeechError(f"Audio longer than {config.STT_MAX_SECONDS} seconds")
+                for event in await loop.run_in_executor(_pool, recognition.feed, block):
+                    yield event
+                block = await anext(pcm, None)
+            for event in await loop.run_in_executor(_pool, recognition.finish):
+                yield event
+
+
+async def transcribe(chunks: AsyncIterator[bytes], fmt: str = "webm") -> str:
+    """Whole-text transcription of a finished recording."""
+    text = ""
+    with stage("stt"):
+        async with aclosing(transcribe_stream(chunks, fmt)) as events:
+            async for event in events:
+                if event["type"] == "final":
+                    text = event["text"]
+    return text
+
+
+# Shared by every transcription route
+speech_engine = SpeechEngine()
@@ -0,0 +1,167 @@
+import asyncio
+import re
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+from uuid import uuid4
+
+from .. import config
+from .ollama_client import ollama
+from .PromptGenerator import code_generator, extract_sql_from_text, prompt_generator
+from .scheduler import scheduler, SchedulerOverloaded
+
+_LINE_COMMENT = re.compile(r"^\s*--[^\n]*$", re.MULTILINE)
+_WHITESPACE = re.compile(r"\s+")
+# Attempts per model call when the scheduler sheds load
+_OVERLOAD_ATTEMPTS = 3
+
+
+def normalize_schema(schema: str) -> str:
+    """
+    Schema text with comment-only lines dropped and whitespace collapsed.
+
+    Fewer prompt tokens, and the same schema pasted with different
+    formatting shares generation cache entries.
+    """
+    return _WHITESPACE.sub(" ", _LINE_COMMENT.sub("", schema)).strip()
+
+
+def _scheduled(session_id: str):
+    """
+    Ollama sender that runs each call in a generation scheduler slot, so
+    batches queue behind interactive chats instead of flooding Ollama.
+    Only cache misses reach it.
+    """
+    async def send(path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        for attempt in range(_OVERLOAD_ATTEMPTS):
+            try:
+                async with scheduler.slot(payload["model"], session_id):
+                    return await ollama.request(path, "POST", payload)
+            except SchedulerOverloaded as e:
+                if attempt == _OVERLOAD_ATTEMPTS - 1:
+                    raise
+                await asyncio.sleep(min(e.retry_after, 5))
+    return send
+
+
+async def _write_prompt(request: str, schema: str, cache_control: Optional[str], session_id: str) -> str:
+    prompt = await prompt_generator(request, schema, cache_control, _scheduled(session_id))
+    if not prompt:
+        raise RuntimeError("Prompt generation returned no text")
+    return prompt
+
+
+async def _write_sql(prompt: str, cache_control: Optional[str], session_id: str) -> str:
+    response = await code_generator(prompt, cache_control, _scheduled(session_id))
+    if "response" not in response:
+        raise RuntimeError(f"SQL generation failed: {response.get('error', 'no response returned')}")
+    return extract_sql_from_text(response["response"])
+
+
+async def generate_sql(request: str, schema: str, cache_control: Optional[str] = None) -> Dict[str, Any]:
+    """Run both stages for a single request."""
+    session_id = f"sql:{uuid4().hex[:8]}"
+    started = time.perf_counter()
+    prompt = await _write_prompt(request, normalize_schema(schema), cache_control, session_id)
+    prompt_ms = (time.perf_counter() - started) * 1000
+    sql = await _write_sql(prompt, cache_control, session_id)
+    return {
+        "request": request,
+        "prompt": prompt,
+        "sql": sql,
+        "prompt_ms": round(prompt_ms, 1),
+        "sql_ms": round((time.perf_counter() - started) * 1000 - prompt_ms, 1)
+    }
+
+
+async def run_sql_batch(
+    items: Sequence[Tuple[str, str]],
+    cache_control: Optional[str] = None,
+    prompt_concurrency: int = config.SQL_PROMPT_CONCURRENCY,
+    sql_concurrency: int = config.SQL_CODE_CONCURRENCY
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Turn ``(request, schema)`` pairs into SQL as a two-stage pipeline.
+
+    Stage 1 (llama3 prompt writing) and stage 2 (codellama SQL) run
+    concurrently on different items with their own worker counts, so both
+    models stay busy; a small queue between them keeps stage 1 from
+    running far ahead. Schemas should already be normalized. Yields one
+    ``result`` event per item in completion order (``index`` refers to the
+    input), then a ``summary``. Closing the generator cancels the
+    remaining work.
+    """
+    batch = uuid4().hex[:8]
+    started = time.perf_counter()
+    pending: "asyncio.Queue[Tuple[int, str, str]]" = asyncio.Queue()
+    for index, (request, schema) in enumerate(items):
+        pending.put_nowait((index, request, schema))
+    prompted: "asyncio.Queue[Optional[Tuple[int, str, str, float, float]]]" = asyncio.Queue(maxsize=max(1, sql_concurrency) * 2)
+    results: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
+
+    def failed(index: int, request: str, error: Exception) -> Dict[str, Any]:
+        event = {"type": "result", "index": index, "status": "error", "request": request, "error": str(error)}
+        if isinstance(error, SchedulerOverloaded):
+            event["retry_after"] = error.retry_after
+        return event
+
+    async def prompt_worker(worker: int):
+        # One scheduler session per worker: each has at most one call queued
+        session_id = f"sql:{batch}:prompt{worker}"
+        while not pending.empty():
+            index, request, schema = pending.get_nowait()
+            item_started = time.perf_counter()
+            try:
+                prompt = await _write_prompt(request, schema, cache_control, session_id)
+            except Exception as e:
+                await results.put(failed(index, request, e))
+                continue
+            await prompted.put((index, request, prompt, item_started, time.perf_counter()))
+
+    async def sql_worker(worker: int):
+        session_id = f"sql:{batch}:sql{worker}"
+        while (job := await prompted.get()) is not None:
+            index, request, prompt, item_started, prompt_done = job
+            try:
+                sql = await _write_sql(prompt, cache_control, session_id)
+            except Exception as e:
+                await results.put(failed(index, request, e))
+                continue
+            done = time.perf_counter()
+            await results.put({
+                "type": "result",
+                "index": index,
+                "status": "ok",
+                "request": request,
+                "prompt": prompt,
+                "sql": sql,
+                "prompt_ms": round((prompt_done - item_started) * 1000, 1),
+                "sql_ms": round((done - prompt_done) * 1000, 1)
+            })
+
+    async def drain_stage_one(workers: List[asyncio.Task], sql_workers: int):
+        await asyncio.gather(*workers)
+        for _ in range(sql_workers):
+            await prompted.put(None)
+
+    total = len(items)
+    prompt_tasks = [asyncio.create_task(prompt_worker(i)) for i in range(max(1, min(prompt_concurrency, total)))]
+    sql_count = max(1, min(sql_concurrency, total))
+    sql_tasks = [asyncio.create_task(sql_worker(i)) for i in range(sql_count)]
+    tasks = [*prompt_tasks, *sql_tasks, asyncio.create_task(drain_stage_one(prompt_tasks, sql_count))]
+    ok = 0
+    try:
+        for _ in range(total):
+            event = await results.get()
+            ok += event["status"] == "ok"
+            yield event
+        yield {
+            "type": "summary",
+            "items": total,
+            "ok": ok,
+            "errors": total - ok,
+            "elapsed_s": round(time.perf_counter() - started, 3)
+        }
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
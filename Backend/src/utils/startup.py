@@ -0,0 +1,82 @@
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+from .model_catalog import model_catalog
+from .model_registry import model_registry
+from .rag_instance import rag
+from .speech import speech_engine
+
+# Subsystems warmed up inside the process; /ready waits until none of them is still loading.
+# Ollama is reported too, but it is an external service and does not gate readiness.
+LOCAL_SUBSYSTEMS = ("database", "rag", "speech", "model_catalog")
+
+
+class Startup:
+    """
+    Startup timings and the state of each subsystem, behind ``GET /ready``.
+
+    Every subsystem reports one of ``not_loaded`` (loads on first use),
+    ``loading``, ``ready``, ``failed`` or ``disabled``. The app is ready
+    once the database is migrated and no local warm-up is still running;
+    a failed subsystem does not block readiness but is listed as degraded.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.timings: Dict[str, float] = {}
+        # Set once the migrations ran; the app does not start without them
+        self.database = "not_loaded"
+
+    @contextmanager
+    def step(self, name: str):
+        """``with startup.step("migrate"):`` records how long a startup step took."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[f"{name}_seconds"] = round(time.perf_counter() - started, 3)
+
+    def _catalog(self) -> dict:
+        stats = model_catalog.stats()
+        if stats["models"]:
+            state = "ready"
+        elif stats["refreshing"]:
+            state = "loading"
+        else:
+            state = "failed" if stats["last_error"] else "not_loaded"
+        return {"state": state, "models": stats["models"], "source": stats["source"], "error": stats["last_error"]}
+
+    def _ollama(self) -> dict:
+        stats = model_registry.stats()
+        if stats["age_s"] is None:
+            state = "not_loaded"
+        else:
+            state = "ready" if stats["ollama_up"] else "unreachable"
+        return {"state": state, "installed": stats["installed"], "running": stats["running"], "age_s": stats["age_s"]}
+
+    def subsystems(self) -> Dict[str, dict]:
+        speech = speech_engine.stats()
+        return {
+            "database": {"state": self.database},
+            "rag": rag.load_stats(),
+            "speech": {"state": speech["state"], "load_seconds": speech["load_seconds"], "load_error": speech["load_error"]},
+            "model_catalog": self._catalog(),
+            "ollama": self._ollama(),
+        }
+
+    def report(self) -> dict:
+        subsystems = self.subsystems()
+        ready = subsystems["database"]["state"] == "ready" and not any(
+            subsystems[name]["state"] == "loading" for name in LOCAL_SUBSYSTEMS
+        )
+        return {
+            "ready": ready,
+            "warming": [name for name in LOCAL_SUBSYSTEMS if subsystems[name]["state"] == "loading"],
+            "degraded": [name for name, s in subsystems.items() if s["state"] in ("failed", "unreachable")],
+            "subsystems": subsystems,
+            "startup": {**self.timings, "uptime_seconds": round(time.monotonic() - self.started, 1)},
+        }
+
+
+startup = Startup()
@@ -0,0 +1,132 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import func, select
+
+from .. import config
+from ..database.db import AsyncSessionLocal
+from ..models.chat_models import ChatConversations, ChatSummary
+from .ollama_client import ollama
+from .scheduler import scheduler, SchedulerOverloaded
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation between a user and an assistant. "
+    "Update the summary with the new turns below. Keep facts, decisions, names, numbers, "
+    "open questions and user preferences; drop small talk. Write plain prose, at most "
+    "{max_words} words, and reply with the summary only."
+)
+
+
+def summary_target(total_turns: int) -> int:
+    """How many of the oldest turns should be folded into the summary for a session of ``total_turns``."""
+    block = max(1, config.SUMMARY_BLOCK_TURNS)
+    return max(0, (total_turns - config.SUMMARY_KEEP_RECENT_TURNS) // block * block)
+
+
+async def _load_pending(session_id: str, limit: int) -> Tuple[str, int, List[Tuple[str, Optional[str]]]]:
+    """Current summary, the number of turns it covers and up to ``limit`` turns still to fold in."""
+    async with AsyncSessionLocal() as db:
+        row = await db.get(ChatSummary, session_id)
+        summary, covered = (row.summary, row.summarized_turns) if row else ("", 0)
+        total = await db.scalar(
+            select(func.count()).select_from(ChatConversations).where(ChatConversations.session_id == session_id)
+        )
+        target = summary_target(total)
+        turns = []
+        if target > covered:
+            result = await db.execute(
+                select(ChatConversations.user_message, ChatConversations.assistant_response).where(
+                    ChatConversations.session_id == session_id
+                ).order_by(ChatConversations.created_at).offset(covered).limit(min(limit, target - covered))
+            )
+            turns = [tuple(row) for row in result.all()]
+        return summary, covered, turns
+
+
+async def _store(session_id: str, summary: str, covered: int, expected_previous: int):
+    async with AsyncSessionLocal() as db:
+        try:
+            row = await db.get(ChatSummary, session_id)
+            if row is None:
+                db.add(ChatSummary(session_id=session_id, summary=summary, summarized_turns=covered))
+            elif row.summarized_turns == expected_previous:
+                row.summary = summary
+                row.summarized_turns = covered
+            else:
+                return  # Someone else advanced it meanwhile
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+
+
+class ConversationSummarizer:
+    """
+    Folds old turns of long sessions into a stored running summary.
+
+    After every chat turn ``schedule`` starts a background update when at
+    least one block of turns has aged out of the verbatim window. Updates go
+    through the generation scheduler like chat requests, and run at most once
+    at a time per session.
+    """
+
+    def __init__(self):
+        self._running: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self.stats: Dict[str, int] = {"updates": 0, "turns_summarized": 0, "failures": 0, "skipped_overloaded": 0}
+
+    def schedule(self, session_id: str, model: str) -> None:
+        if not config.SUMMARY_ENABLED or session_id in self._running:
+            return
+        self._running.add(session_id)
+        task = asyncio.create_task(self._update(session_id, config.SUMMARY_MODEL or model))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _update(self, session_id: str, model: str) -> None:
+        try:
+            # Catch up in chunks so a long backlog never overflows the summarizer's context
+            limit = max(1, config.SUMMARY_BLOCK_TURNS) * 4
+            while True:
+                summary, covered, turns = await _load_pending(session_id, limit)
+                if not turns:
+                    return
+                await self._fold(session_id, model, summary, covered, turns)
+        except SchedulerOverloaded:
+            # Busy; the next turn will try again
+            self.stats["skipped_overloaded"] += 1
+        except Exception as e:
+            self.stats["failures"] += 1
+            logger.warning(f"Summarizing session {session_id} failed: {e}")
+        finally:
+            self._running.discard(session_id)
+
+    async def _fold(self, session_id: str, model: str, summary: str, covered: int,
+                    turns: List[Tuple[str, Optional[str]]]) -> None:
+        transcript = "\n\n".join(
+            f"User: {user}\nAssistant: {assistant or ''}" for user, assistant in turns
+        )
+        messages = [
+            {"role": "system", "content": SUMMARY_PROMPT.format(max_words=config.SUMMARY_MAX_WORDS)},
+            {"role": "user", "content": f"Current summary:\n{summary or '(none yet)'}\n\nNew turns:\n{transcript}"},
+        ]
+        async with scheduler.slot(model, f"summary:{session_id}"):
+            response = await ollama.request("chat", "POST", {
+                "model": model,
+                "stream": False,
+                "messages": messages,
+                "options": {"temperature": 0},
+            })
+        new_summary = (response.get("message") or {}).get("content", "").strip()
+        if not new_summary:
+            raise ValueError(response.get("error", "empty summary"))
+        await _store(session_id, new_summary, covered + len(turns), covered)
+        self.stats["updates"] += 1
+        self.stats["turns_summarized"] += len(turns)
+        logger.info(f"Summarized turns {covered}-{covered + len(turns)} of session {session_id}")
+
+
+summarizer = ConversationSummarizer()
@@ -0,0 +1,533 @@
+import json
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .. import config
+
+logger = logging.getLogger(__name__)
+
+
+class SearchHit(NamedTuple):
+    id: str
+    text: str
+    metadata: Dict[str, Any]
+    score: float  # cosine similarity, higher is better
+    vector: Optional[np.ndarray] = None  # stored embedding, when the backend returns it
+
+
+class VectorStore(ABC):
+    """
+    Interface RAGEngine talks to. Embeddings are computed by the caller, so
+    every backend stores and searches plain vectors.
+
+    ``where`` filters are ``{"field": value}`` equality constraints, all of
+    which must hold.
+    """
+
+    @abstractmethod
+    def add(self, ids: Sequence[str], texts: Sequence[str], embeddings: Sequence[Sequence[float]],
+            metadatas: Sequence[Dict[str, Any]]) -> None:
+        ...
+
+    @abstractmethod
+    def search(self, embedding: Sequence[float], k: int, where: Optional[Dict[str, Any]] = None) -> List[SearchHit]:
+        ...
+
+    @abstractmethod
+    def get_vectors(self, ids: Sequence[str]) -> Dict[str, np.ndarray]:
+        """Stored embeddings by document id; unknown ids are left out."""
+
+    @abstractmethod
+    def count(self) -> int:
+        ...
+
+    @abstractmethod
+    def iter_documents(self) -> Iterator[Tuple[str, str, Dict[str, Any]]]:
+        """Yield ``(id, text, metadata)`` for every stored document."""
+
+    def persist(self) -> None:
+        """Flush buffered writes to disk. Backends that write through can ignore it."""
+
+
+class ChromaVectorStore(VectorStore):
+    """Chroma persistent collection (the collection LangChain's Chroma wrapper used before)."""
+
+    def __init__(self, path: str, collection: str = "langchain"):
+        import chromadb
+
+        self._client = chromadb.PersistentClient(path=path)
+        self._collection = self._client.get_or_create_collection(collection)
+        self._space = (self._collection.metadata or {}).get("hnsw:space", "l2")
+        self._max_batch = self._client.get_max_batch_size()
+
+    def add(self, ids, texts, embeddings, metadatas):
+        for start in range(0, len(ids), self._max_batch):
+            end = start + self._max_batch
+            self._collection.upsert(
+                ids=list(ids[start:end]),
+                documents=list(texts[start:end]),
+                embeddings=[list(map(float, e)) for e in embeddings[start:end]],
+                # Chroma rejects empty metadata dicts
+                metadatas=[m or None for m in metadatas[start:end]],
+            )
+
+    def search(self, embedding, k, where=None):
+        if len(where or {}) > 1:
+            where = {"$and": [{key: value} for key, value in where.items()]}
+        result = self._collection.query(
+            query_embeddings=[list(map(float, embedding))],
+            n_results=k,
+            where=where or None,
+            include=["documents", "metadatas", "distances", "embeddings"],
+        )
+        hits = []
+        for id_, text, metadata, distance, vector in zip(
+            result["ids"][0], result["documents"][0], result["metadatas"][0], result["distances"][0],
+            result["embeddings"][0]
+        ):
+            hits.append(SearchHit(id_, text or "", metadata or {}, self._similarity(distance),
+                                  np.asarray(vector, dtype=np.float32)))
+        return hits
+
+    def get_vectors(self, ids):
+        if not ids:
+            return {}
+        result = self._collection.get(ids=list(ids), include=["embeddings"])
+        return {id_: np.asarray(vector, dtype=np.float32) for id_, vector in zip(result["ids"], result["embeddings"])}
+
+    def _similarity(self, distance: float) -> float:
+        if self._space == "cosine":
+            return 1.0 - distance
+        if self._space == "ip":
+            return -distance
+        # Squared L2 between unit vectors: d = 2 - 2cos
+        return 1.0 - distance / 2.0
+
+    def count(self):
+        return self._collection.count()
+
+    def iter_documents(self, page_size: int = 1000):
+        offset = 0
+        while True:
+            page = self._collection.get(limit=page_size, offset=offset, include=["documents", "metadatas"])
+            if not page["ids"]:
+                return
+            for id_, text, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+                yield id_, text or "", metadata or {}
+            offset += len(page["ids"])
+
+
+class _RowList:
+    """Append-friendly int64 row list: a compact array plus a Python tail."""
+
+    __slots__ = ("base", "tail")
+
+    def __init__(self, base: Optional[np.ndarray] = None):
+        self.base = base if base is not None else np.empty(0, dtype=np.int64)
+        self.tail: List[int] = []
+
+    def append(self, row: int):
+        self.tail.append(row)
+
+    def array(self) -> np.ndarray:
+        if self.tail:
+            self.base = np.concatenate([self.base, np.asarray(self.tail, dtype=np.int64)])
+            self.tail = []
+        return self.base
+
+    def __len__(self):
+        return len(self.base) + len(self.tail)
+
+
+class AnnVectorStore(VectorStore):
+    """
+    Built-in in-process vector index.
+
+    Vectors are L2-normalized and appended to a memory-mapped float32 (or
+    int8 with a per-row scale) matrix; documents go to an append-only JSONL
+    file with a row -> byte offset table, so every ``add`` persists
+    incrementally without rewriting anything. Once the store holds
+    ``ivf_min_vectors`` vectors an IVF index (k-means coarse quantizer) is
+    trained in the background and searches only scan the ``nprobe``
+    closest lists. Metadata fields listed in ``indexed_fields`` get inverted
+    row lists, so filters such as ``{"session_id": ...}`` touch only
+    matching rows and small result sets are searched exactly.
+    """
+
+    INDEXED_FIELDS = ("session_id", "type", "source", "chat_id")
+
+    def __init__(self, path: str, quantization: str = config.ANN_QUANTIZATION, nprobe: int = config.ANN_NPROBE,
+                 ivf_min_vectors: int = config.ANN_IVF_MIN_VECTORS, exact_search_limit: int = 20000,
+                 indexed_fields: Sequence[str] = INDEXED_FIELDS):
+        if quantization not in ("float32", "int8"):
+            raise ValueError(f"Unsupported quantization: {quantization}")
+        self.path = path
+        self.nprobe = nprobe
+        self.ivf_min_vectors = ivf_min_vectors
+        self.exact_search_limit = exact_search_limit
+        self.indexed_fields = tuple(indexed_fields)
+        self._lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+
+        manifest = self._read_manifest()
+        self.quantization = manifest.get("quantization", quantization)
+        self.dim: Optional[int] = manifest.get("dim")
+
+        self._vectors_path = os.path.join(path, "vectors.i8" if self.quantization == "int8" else "vectors.f32")
+        self._scales_path = os.path.join(path, "scales.f32")
+        self._offsets_path = os.path.join(path, "offsets.i64")
+        self._docs_path = os.path.join(path, "docs.jsonl")
+        self._ivf_path = os.path.join(path, "ivf.npz")
+        self._assign_path = os.path.join(path, "assign.i32")
+
+        self._count = self._recover_count()
+        self._matrix: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+        self._offsets: Optional[np.ndarray] = None
+        self._mapped_count = -1
+
+        self._field_index: Dict[str, Dict[Any, _RowList]] = {f: {} for f in self.indexed_fields}
+        self._id_rows: Dict[str, int] = {}
+        self._field_index_loaded = False
+
+        self._centroids: Optional[np.ndarray] = None
+        self._lists: List[_RowList] = []
+        self._trained_at = 0
+        self._training: Optional[threading.Thread] = None
+        self._load_ivf()
+
+    # ----- persistence -------------------------------------------------------------
+
+    def _read_manifest(self) -> dict:
+        try:
+            with open(os.path.join(self.path, "manifest.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_manifest(self):
+        tmp = os.path.join(self.path, "manifest.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump({"dim": self.dim, "quantization": self.quantization, "count": self._count}, f)
+        os.replace(tmp, os.path.join(self.path, "manifest.json"))
+
+    def _row_bytes(self) -> int:
+        return self.dim * (1 if self.quantization == "int8" else 4)
+
+    def _recover_count(self) -> int:
+        """Rows fully present in every file; trims a torn write from a crash."""
+        if not self.dim or not os.path.exists(self._vectors_path):
+            return 0
+        counts = [os.path.getsize(self._vectors_path) // self._row_bytes(),
+                  os.path.getsize(self._offsets_path) // 8 if os.path.exists(self._offsets_path) else 0]
+        if self.quantization == "int8":
+            counts.append(os.path.getsize(self._scales_path) // 4 if os.path.exists(self._scales_path) else 0)
+        count = min(counts)
+        for file_path, width in ((self._vectors_path, self._row_bytes()), (self._offsets_path, 8), (self._scales_path, 4)):
+            if os.path.exists(file_path) and os.path.getsize(file_path) > count * width:
+                with open(file_path, "r+b") as f:
+                    f.truncate(count * width)
+        # Drop document lines past the last complete row so row numbers stay aligned
+        docs_end = 0
+        if count:
+            last_offset = int(np.fromfile(self._offsets_path, dtype=np.int64, count=1, offset=(count - 1) * 8)[0])
+            with open(self._docs_path, "rb") as f:
+                f.seek(last_offset)
+                docs_end = last_offset + len(f.readline())
+        if os.path.exists(self._docs_path) and os.path.getsize(self._docs_path) > docs_end:
+            with open(self._docs_path, "r+b") as f:
+                f.truncate(docs_end)
+        return count
+
+    def _mapped(self):
+        """Memory-map the vector matrix (re-mapped after appends)."""
+        if self._mapped_count != self._count:
+            if self._count:
+                dtype = np.int8 if self.quantization == "int8" else np.float32
+                self._matrix = np.memmap(self._vectors_path, dtype=dtype, mode="r", shape=(self._count, self.dim))
+                self._offsets = np.memmap(self._offsets_path, dtype=np.int64, mode="r", shape=(self._count,))
+                if self.quantization == "int8":
+                    self._scales = np.memmap(self._scales_path, dtype=np.float32, mode="r", shape=(self._count,))
+            self._mapped_count = self._count
+        return self._matrix
+
+    def _rows(self, rows: np.ndarray) -> np.ndarray:
+        matrix = self._mapped()
+        block = matrix[rows]
+        if self.quantization == "int8":
+            return block.astype(np.float32) * self._scales[rows][:, None]
+        return block
+
+    def _load_field_index(self):
+        if self._field_index_loaded:
+            return
+        if self._count:
+            with open(self._docs_path, "rb") as f:
+                for row, line in enumerate(f):
+                    if row >= self._count:
+                        break
+                    doc = json.loads(line)
+                    self._index_fields(row, doc["id"], doc.get("metadata") or {})
+        self._field_index_loaded = True
+
+    def _index_fields(self, row: int, id_: str, metadata: Dict[str, Any]):
+        self._id_rows[id_] = row
+        for field in self.indexed_fields:
+            value = metadata.get(field)
+            if value is not None:
+                self._field_index[field].setdefault(value, _RowList()).append(row)
+
+    def _load_ivf(self):
+        if not os.path.exists(self._ivf_path) or not self._count:
+            return
+        data = np.load(self._ivf_path)
+        self._centroids = data["centroids"]
+        self._trained_at = int(data["trained_at"])
+        assign = np.fromfile(self._assign_path, dtype=np.int32)[: self._count]
+        if len(assign) < self._count:
+            # Rows written after the last assignment flush
+            extra = self._nearest_centroid(self._rows(np.arange(len(assign), self._count)))
+            assign = np.concatenate([assign, extra])
+            assign.tofile(self._assign_path)
+        self._build_lists(assign)
+
+    def _build_lists(self, assign: np.ndarray):
+        order = np.argsort(assign, kind="stable")
+        bounds = np.searchsorted(assign[order], np.arange(len(self._centroids) + 1))
+        self._lists = [_RowList(order[bounds[i]:bounds[i + 1]].astype(np.int64)) for i in range(len(self._centroids))]
+
+    # ----- writes ------------------------------------------------------------------
+
+    def add(self, ids, texts, embeddings, metadatas):
+        if not len(ids):
+            return
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.maximum(norms, 1e-12)
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match store dimension {self.dim}")
+            self._load_field_index()
+
+            first_row = self._count
+            offsets = []
+            with open(self._docs_path, "ab") as f:
+                position = f.tell()
+                for id_, text, metadata in zip(ids, texts, metadatas):
+                    line = (json.dumps({"id": id_, "text": text, "metadata": metadata or {}}) + "\n").encode("utf-8")
+                    offsets.append(position)
+                    f.write(line)
+                    position += len(line)
+            if self.quantization == "int8":
+                scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+                with open(self._scales_path, "ab") as f:
+                    scales.astype(np.float32).tofile(f)
+                with open(self._vectors_path, "ab") as f:
+                    np.round(vectors / scales[:, None]).astype(np.int8).tofile(f)
+            else:
+                with open(self._vectors_path, "ab") as f:
+                    vectors.tofile(f)
+            # Offsets go last: a row only counts once its offset is on disk
+            with open(self._offsets_path, "ab") as f:
+                np.asarray(offsets, dtype=np.int64).tofile(f)
+
+            self._count += len(ids)
+            self._write_manifest()
+            for i, (id_, metadata) in enumerate(zip(ids, metadatas)):
+                self._index_fields(first_row + i, id_, metadata or {})
+
+            if self._centroids is not None:
+                assign = self._nearest_centroid(vectors)
+                with open(self._assign_path, "ab") as f:
+                    assign.tofile(f)
+                for i, cluster in enumerate(assign):
+                    self._lists[int(cluster)].append(first_row + i)
+                if self._count >= 2 * self._trained_at:
+                    self._schedule_training()
+            elif self._count >= self.ivf_min_vectors:
+                self._schedule_training()
+
+    def _nearest_centroid(self, vectors: np.ndarray) -> np.ndarray:
+        return np.argmax(vectors @ self._centroids.T, axis=1).astype(np.int32)
+
+    def _schedule_training(self):
+        if self._training is None or not self._training.is_alive():
+            self._training = threading.Thread(target=self._train_ivf, name="ann-ivf-train", daemon=True)
+            self._training.start()
+
+    def _snapshot_rows(self, count: int):
+        """Row reader over the first ``count`` rows that does not depend on the shared maps."""
+        dtype = np.int8 if self.quantization == "int8" else np.float32
+        matrix = np.memmap(self._vectors_path, dtype=dtype, mode="r", shape=(count, self.dim))
+        if self.quantization == "int8":
+            scales = np.memmap(self._scales_path, dtype=np.float32, mode="r", shape=(count,))
+            return lambda rows: matrix[rows].astype(np.float32) * scales[rows][:, None]
+        return lambda rows: np.asarray(matrix[rows], dtype=np.float32)
+
+    def _train_ivf(self, iterations: int = 8, seed: int = 0):
+        """
+        Spherical k-means on a sample, then assign every row to its closest centroid.
+
+        Runs on a background thread over a snapshot of the rows so searches and
+        writes continue meanwhile; the lock is only taken to swap the index in.
+        """
+        try:
+            with self._lock:
+                count = self._count
+            read = self._snapshot_rows(count)
+            n_lists = max(1, int(2 * np.sqrt(count)))
+            rng = np.random.default_rng(seed)
+            sample_rows = np.sort(rng.choice(count, size=min(count, n_lists * 32), replace=False))
+            sample = read(sample_rows)
+            centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+            for _ in range(iterations):
+                labels = np.argmax(sample @ centroids.T, axis=1)
+                order = np.argsort(labels, kind="stable")
+                present, starts = np.unique(labels[order], return_index=True)
+                sums = sample[rng.choice(len(sample), size=n_lists)]  # reseeds empty clusters
+                sums[present] = np.add.reduceat(sample[order], starts, axis=0)
+                centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+            centroids = centroids.astype(np.float32)
+
+            assign = np.empty(count, dtype=np.int32)
+            for start in range(0, count, 65536):
+                rows = np.arange(start, min(count, start + 65536))
+                assign[start:start + len(rows)] = np.argmax(read(rows) @ centroids.T, axis=1)
+
+            with self._lock:
+                if self._count > count:
+                    # Rows added while training
+                    extra = np.argmax(self._rows(np.arange(count, self._count)) @ centroids.T, axis=1)
+                    assign = np.concatenate([assign, extra.astype(np.int32)])
+                self._centroids = centroids
+                self._trained_at = count
+                assign.tofile(self._assign_path)
+                np.savez(self._ivf_path, centroids=self._centroids, trained_at=self._trained_at)
+                self._build_lists(assign)
+            logger.info(f"Trained IVF index with {n_lists} lists over {count} vectors")
+        except Exception:
+            logger.exception("IVF training failed")
+
+    # ----- reads -------------------------------------------------------------------
+
+    def search(self, embedding, k, where=None):
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        with self._lock:
+            if not self._count or k <= 0:
+                return []
+            self._load_field_index()
+            allowed = None
+            post_filter = {}
+            for field, value in (where or {}).items():
+                if field in self._field_index:
+                    rows = self._field_index[field].get(value)
+                    if rows is None:
+                        return []
+                    rows = rows.array()
+                    allowed = rows if allowed is None else np.intersect1d(allowed, rows, assume_unique=True)
+                else:
+                    post_filter[field] = value
+            # Over-fetch when some conditions can only be checked on the documents
+            fetch = k * 4 if post_filter else k
+
+            if allowed is not None and (len(allowed) <= self.exact_search_limit or self._centroids is None):
+                candidates = allowed
+            elif self._centroids is not None:
+                probes = np.argsort(-(self._centroids @ query))[: self.nprobe]
+                candidates = np.concatenate([self._lists[int(p)].array() for p in probes])
+                if allowed is not None:
+                    candidates = np.intersect1d(candidates, allowed, assume_unique=True)
+                    if len(candidates) < fetch:
+                        # Probed lists missed the filtered rows; fall back to scanning them exactly
+                        candidates = allowed
+            else:
+                candidates = None
+
+            rows, scores = self._top_k(query, candidates, fetch)
+            vectors = self._rows(np.asarray(rows, dtype=np.int64)) if len(rows) else []
+            hits = [self._hit(int(r), float(s), np.array(v, dtype=np.float32)) for r, s, v in zip(rows, scores, vectors)]
+        if post_filter:
+            hits = [h for h in hits if all(h.metadata.get(f) == v for f, v in post_filter.items())]
+        return hits[:k]
+
+    def _top_k(self, query: np.ndarray, candidates: Optional[np.ndarray], k: int):
+        if candidates is None:
+            # Exact scan of the whole matrix in blocks
+            best_rows, best_scores = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+            for start in range(0, self._count, 262144):
+                rows = np.arange(start, min(self._count, start + 262144))
+                scores = self._rows(rows) @ query
+                best_rows = np.concatenate([best_rows, rows])
+                best_scores = np.concatenate([best_scores, scores])
+                if len(best_rows) > k:
+                    keep = np.argpartition(-best_scores, k)[:k]
+                    best_rows, best_scores = best_rows[keep], best_scores[keep]
+            rows, scores = best_rows, best_scores
+        else:
+            if not len(candidates):
+                return [], []
+            candidates = np.sort(candidates)  # sequential reads from the memory map
+            rows, scores = candidates, self._rows(candidates) @ query
+            if len(rows) > k:
+                keep = np.argpartition(-scores, k)[:k]
+                rows, scores = rows[keep], scores[keep]
+        order = np.argsort(-scores)
+        return rows[order], scores[order]
+
+    def _hit(self, row: int, score: float, vector: Optional[np.ndarray] = None) -> SearchHit:
+        self._mapped()
+        with open(self._docs_path, "rb") as f:
+            f.seek(int(self._offsets[row]))
+            doc = json.loads(f.readline())
+        return SearchHit(doc["id"], doc["text"], doc["metadata"], score, vector)
+
+    def get_vectors(self, ids):
+        with self._lock:
+            self._load_field_index()
+            found = [(id_, self._id_rows[id_]) for id_ in ids if id_ in self._id_rows]
+            if not found:
+                return {}
+            vectors = self._rows(np.asarray([row for _, row in found], dtype=np.int64))
+            return {id_: np.array(vector, dtype=np.float32) for (id_, _), vector in zip(found, vectors)}
+
+    def count(self):
+        return self._count
+
+    def iter_documents(self):
+        count = self._count
+        if not count:
+            return
+        with open(self._docs_path, "rb") as f:
+            for row, line in enumerate(f):
+                if row >= count:
+                    return
+                doc = json.loads(line)
+                yield doc["id"], doc["text"], doc["metadata"]
+
+    def stats(self) -> dict:
+        return {
+            "backend": "ann",
+            "count": self._count,
+            "dim": self.dim,
+            "quantization": self.quantization,
+            "ivf_lists": len(self._lists),
+            "nprobe": self.nprobe,
+        }
+
+
+def make_vector_store(backend: str = config.VECTOR_STORE_BACKEND, path: str = config.VECTOR_STORE_PATH,
+                      collection: str = "langchain") -> VectorStore:
+    """Build the configured vector store backend."""
+    if backend == "chroma":
+        return ChromaVectorStore(path, collection=collection)
+    if backend == "ann":
+        return AnnVectorStore(os.path.join(path, f"ann_{collection}"))
+    raise ValueError(f"Unknown vector store backend: {backend}")
@@ -1,54 +1,110 @@
-import os
-import json
-import requests
-from bs4 import BeautifulSoup
-
-def scrape_ollama_search(url):
-    file_path = 'ollama_models_list.json'
-    
-    # If the file already exists, load from file
-    if os.path.exists(file_path):
-        print("Loading models from local file (offline)...")
-        with open(file_path, 'r') as f:
-            data = json.load(f)
-        return data
-
-    # Else, scrape online
-    data = {}
-    response = requests.get(url)
-    if response.status_code == 200:
-        print("Successfully retrieved data from Ollama search page (online scrape)")
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        for li in soup.find_all('li', class_="flex items-baseline border-b border-neutral-200 py-6"):
-            model_name = li.find('h2', class_="truncate text-xl font-medium underline-offset-2 group-hover:underline md:text-2xl").find('span').text.strip()
-            model_link = li.find('a', class_="group w-full")['href']
-            model_description = li.find('p', class_="max-w-lg break-words text-neutral-800 text-md")
-            model_capability = [mod_cap.text.strip() for mod_cap in li.find_all('span', attrs={"x-test-capability": True})]
-            model_sizes = [mod_size.text.strip() for mod_size in li.find_all('span', attrs={"x-test-size": True})]
-            model_pulls = li.find('p', class_="my-1 flex space-x-5 text-[13px] font-medium text-neutral-500").find('span', attrs={"x-test-pull-count": True}).text.strip()
-            model_tags = li.find('p', class_="my-1 flex space-x-5 text-[13px] font-medium text-neutral-500").find('span', attrs={"x-test-tag-count": True}).text.strip()
-            model_last_updated = li.find('p', class_="my-1 flex space-x-5 text-[13px] font-medium text-neutral-500").find('span', attrs={"x-test-updated": True}).text.strip()
-
-            data[model_name] = {
-                "model_name": model_name,
-                "link": model_link,
-                "description": model_description.text.strip() if model_description else "",
-                "capability": model_capability,
-                "sizes": model_sizes,
-                "pulls": model_pulls,
-                "tags": model_tags,
-                "last_updated": model_last_updated
-            }
-
-        # Save to local file
-        with open(file_path, 'w') as f:
-            json.dump(data, f, indent=4)
-                
-        return data
-
-    else:
-        return {
-            "error": "Failed to retrieve data from Ollama search page",
-            "status_code": response.status_code
-        }
+import re
+from html.parser import HTMLParser
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from .. import config
+
+# Elements that never get an end tag, so they must not change the nesting depth
+_VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "track", "wbr"}
+# x-test-* marker attribute -> field it fills
+_MARKED_FIELDS = {
+    "x-test-capability": "capability",
+    "x-test-size": "sizes",
+    "x-test-pull-count": "pulls",
+    "x-test-tag-count": "tags",
+    "x-test-updated": "last_updated",
+}
+_LIST_FIELDS = {"capability", "sizes"}
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _classes(attrs: Dict[str, Optional[str]]) -> set:
+    return set((attrs.get("class") or "").split())
+
+
+class _SearchPageParser(HTMLParser):
+    """
+    Single pass over the ollama.com search page.
+
+    Only the ``<li>`` of each result is looked at, and fields are found
+    through the page's ``x-test-*`` markers and a couple of class tokens
+    rather than full class strings, so cosmetic restyling does not break it.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.models: List[Dict[str, Any]] = []
+        self._model: Optional[Dict[str, Any]] = None
+        self._depth = 0
+        self._model_depth = 0
+        self._in_title = False
+        # (field, depth at which the captured element closes, collected text)
+        self._capture: Optional[list] = None
+
+    def handle_starttag(self, tag, attr_list):
+        if tag in _VOID_TAGS:
+            return
+        self._depth += 1
+        attrs = dict(attr_list)
+        if self._model is None:
+            if tag == "li" and ("x-test-model" in attrs or {"items-baseline", "py-6"} <= _classes(attrs)):
+                self._model = {"model_name": "", "link": "", "description": "", "capability": [], "sizes": [],
+                               "pulls": "", "tags": "", "last_updated": ""}
+                self._model_depth = self._depth
+            return
+        if self._capture is not None:
+            return
+        if tag == "a" and not self._model["link"] and attrs.get("href"):
+            self._model["link"] = attrs["href"]
+        elif tag == "h2":
+            self._in_title = True
+        elif tag == "span" and (self._in_title and not self._model["model_name"] or "x-test-search-response-title" in attrs):
+            self._capture = ["model_name", self._depth, []]
+        elif tag == "p" and "break-words" in _classes(attrs) and not self._model["description"]:
+            self._capture = ["description", self._depth, []]
+        else:
+            for marker, field in _MARKED_FIELDS.items():
+                if marker in attrs:
+                    self._capture = [field, self._depth, []]
+                    break
+
+    def handle_endtag(self, tag):
+        if tag in _VOID_TAGS:
+            return
+        if self._capture is not None and self._depth == self._capture[1]:
+            field, _, parts = self._capture
+            value = _WHITESPACE.sub(" ", "".join(parts)).strip()
+            if field in _LIST_FIELDS:
+                self._model[field].append(value)
+            else:
+                self._model[field] = value
+            self._capture = None
+        if tag == "h2":
+            self._in_title = False
+        if self._model is not None and self._depth == self._model_depth:
+            if self._model["model_name"]:
+                self.models.append(self._model)
+            self._model = None
+        self._depth -= 1
+
+    def handle_data(self, data):
+        if self._capture is not None:
+            self._capture[2].append(data)
+
+
+def parse_search_page(html: str) -> List[Dict[str, Any]]:
+    """Models listed on an ollama.com search page, in page order."""
+    parser = _SearchPageParser()
+    parser.feed(html)
+    parser.close()
+    return parser.models
+
+
+async def fetch_search_page(url: str = config.MODEL_CATALOG_URL) -> str:
+    """Download the search page; raises ``httpx.HTTPError`` on failure."""
+    async with httpx.AsyncClient(timeout=config.MODEL_CATALOG_TIMEOUT, follow_redirects=True) as client:
+        response = await client.get(url)
+        response.raise_for_status()
+        return response.text
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Tests import the backend as the ``src`` package, like uvicorn does from the Backend folder
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
@@ -0,0 +1,77 @@
+import io
+
+from src.utils import document_ingest
+from src.utils.context_builder import token_counter
+from src.utils.document_ingest import TokenChunker, _read_block
+
+
+def _sentences(start, count):
+    return " ".join(f"Sentence {i} is about topic number {i}." for i in range(start, start + count))
+
+
+def _chunks(chunker, pages):
+    chunks = []
+    for page, text in pages:
+        chunks.extend(chunker.feed(text, page))
+    return chunks + chunker.finish()
+
+
+def _overlap(previous, chunk):
+    """Longest run of words ending ``previous`` that also starts ``chunk``."""
+    before, after = previous.split(" "), chunk.split(" ")
+    for size in range(min(len(before), len(after)), 0, -1):
+        if before[-size:] == after[:size]:
+            return " ".join(after[:size])
+    return ""
+
+
+def test_chunks_fit_the_token_limit():
+    chunker = TokenChunker(max_tokens=40, overlap_tokens=10)
+    chunks = _chunks(chunker, [(1, _sentences(0, 60))])
+
+    assert len(chunks) > 1
+    assert all(token_counter.count("embedding", text) <= 40 for text, _ in chunks)
+
+
+def test_overlap_stays_within_overlap_tokens():
+    chunker = TokenChunker(max_tokens=40, overlap_tokens=12)
+    chunks = [text for text, _ in _chunks(chunker, [(1, _sentences(0, 60))])]
+
+    overlaps = [_overlap(previous, chunk) for previous, chunk in zip(chunks, chunks[1:])]
+    assert all(overlaps)
+    assert all(token_counter.count("embedding", overlap) <= 12 for overlap in overlaps)
+
+
+def test_chunk_spanning_pages_reports_its_first_page():
+    chunker = TokenChunker(max_tokens=60, overlap_tokens=0)
+    chunks = _chunks(chunker, [(1, _sentences(0, 2)), (2, _sentences(2, 2)), (3, _sentences(4, 30))])
+
+    text, page = chunks[0]
+    assert page == 1
+    assert "Sentence 0 " in text and "Sentence 2 " in text
+    assert [page for _, page in chunks[1:]] == [3] * (len(chunks) - 1)
+
+
+def test_read_block_without_newlines(monkeypatch):
+    monkeypatch.setattr(document_ingest, "_TEXT_BLOCK_CHARS", 1000)
+    text = "x" * 2500
+    reader = io.StringIO(text)
+
+    blocks, carry, ended = [], "", False
+    while not ended:
+        block, carry, ended = _read_block(reader, carry)
+        blocks.append(block)
+
+    assert [len(block) for block in blocks] == [1000, 1000, 500, 0]
+    assert "".join(blocks) == text
+
+
+def test_read_block_cuts_at_a_paragraph_break(monkeypatch):
+    monkeypatch.setattr(document_ingest, "_TEXT_BLOCK_CHARS", 1000)
+    text = "a" * 700 + "\n\n" + "b" * 700
+
+    block, carry, ended = _read_block(io.StringIO(text), "")
+
+    assert block == "a" * 700
+    assert carry == "\n\n" + "b" * 298
+    assert not ended
@@ -0,0 +1,35 @@
+import numpy as np
+
+from src.utils.embedding_cache import EmbeddingCache
+
+
+def test_disk_tier_drops_oldest_beyond_max_entries(tmp_path, monkeypatch):
+    monkeypatch.setattr("src.utils.embedding_cache._PRUNE_EVERY", 1)
+    cache = EmbeddingCache(str(tmp_path / "cache.db"), memory_budget_bytes=0, max_entries=3)
+    for i in range(5):
+        cache.put_many("m", [f"text {i}"], [np.full(4, i, dtype=np.float32)])
+
+    assert cache.stats()["disk_entries"] == 3
+    found = cache.get_many("m", [f"text {i}" for i in range(5)])
+    assert found[0] is None and found[1] is None
+    assert [float(v[0]) for v in found[2:]] == [2.0, 3.0, 4.0]
+
+
+def test_rewritten_entry_counts_as_new(tmp_path, monkeypatch):
+    monkeypatch.setattr("src.utils.embedding_cache._PRUNE_EVERY", 1)
+    cache = EmbeddingCache(str(tmp_path / "cache.db"), memory_budget_bytes=0, max_entries=2)
+    cache.put_many("m", ["a", "b"], [np.zeros(4), np.zeros(4)])
+    cache.put_many("m", ["a"], [np.ones(4)])
+    cache.put_many("m", ["c"], [np.ones(4)])
+
+    a, b, c = cache.get_many("m", ["a", "b", "c"])
+    assert b is None and a is not None and c is not None
+
+
+def test_file_is_created_on_first_use(tmp_path):
+    path = tmp_path / "data" / "cache.db"
+    cache = EmbeddingCache(str(path))
+    assert not path.parent.exists()
+
+    assert cache.get_many("m", ["a"]) == [None]
+    assert path.exists()
@@ -0,0 +1,43 @@
+import asyncio
+
+from src.utils import generation_cache as gc
+
+
+def test_deterministic_request_is_answered_from_cache(tmp_path, monkeypatch):
+    cache = gc.GenerationCache(str(tmp_path / "generations.db"))
+    cache.set_model_digest("llama3", "sha256:1")
+    monkeypatch.setattr(gc, "generation_cache", cache)
+    calls = []
+
+    async def send(path, payload):
+        calls.append(path)
+        return {"message": {"content": "4"}, "done": True}
+
+    payload = {"model": "llama3", "messages": [{"role": "user", "content": "2+2?"}], "options": {"temperature": 0}}
+    first = asyncio.run(gc.cached_request("chat", payload, send=send))
+    second = asyncio.run(gc.cached_request("chat", payload, send=send))
+
+    assert first == ({"message": {"content": "4"}, "done": True}, "miss")
+    assert second == ({"message": {"content": "4"}, "done": True}, "hit")
+    assert calls == ["chat"]
+
+
+def test_sampled_request_bypasses_cache(tmp_path, monkeypatch):
+    cache = gc.GenerationCache(str(tmp_path / "generations.db"))
+    cache.set_model_digest("llama3", "sha256:1")
+    monkeypatch.setattr(gc, "generation_cache", cache)
+
+    async def send(path, payload):
+        return {"response": "x", "done": True}
+
+    _, status = asyncio.run(gc.cached_request("generate", {"model": "llama3", "prompt": "hi"}, send=send))
+    assert status == "bypass"
+
+
+def test_digests_of_earlier_runs_are_read_on_first_use(tmp_path):
+    path = tmp_path / "data" / "generations.db"
+    gc.GenerationCache(str(path)).set_model_digest("llama3", "sha256:1")
+
+    cache = gc.GenerationCache(str(path))
+    assert cache._connection is None
+    assert cache.digest("llama3:latest") == "sha256:1"
@@ -0,0 +1,66 @@
+import os
+
+import pytest
+
+from src import config
+from src.utils.model_catalog import ModelCatalog, parse_count, parse_param_size
+
+HTML_FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "ollama_search.html")
+
+
+@pytest.mark.parametrize("size, billions", [
+    ("7b", 7.0),
+    ("1.5b", 1.5),
+    ("8x7b", 56.0),
+    ("8x22b", 176.0),
+    ("335m", 0.335),
+    ("e2b", 2.0),
+    ("1t", 1000.0),
+    (" 70B ", 70.0),
+])
+def test_parse_param_size(size, billions):
+    assert parse_param_size(size) == pytest.approx(billions)
+
+
+@pytest.mark.parametrize("size", ["", "latest", "7", "7gb", "x7b"])
+def test_unparseable_param_size(size):
+    assert parse_param_size(size) is None
+
+
+@pytest.mark.parametrize("count, value", [
+    ("49.1M", 49_100_000),
+    ("6.3M", 6_300_000),
+    ("812.4K", 812_400),
+    ("1.2B", 1_200_000_000),
+    ("3,456", 3456),
+    ("35", 35),
+    ("", 0),
+    ("many", 0),
+])
+def test_parse_count(count, value):
+    assert parse_count(count) == value
+
+
+def _fixture_entries(tmp_path, fixture):
+    catalog = ModelCatalog(path=str(tmp_path / "catalog.json"), fixture=fixture, offline=True)
+    assert catalog._load_fixture()
+    return catalog._entries
+
+
+def test_bundled_fixture_loads_and_parses(tmp_path):
+    entries = _fixture_entries(tmp_path, config.MODEL_CATALOG_FIXTURE)
+
+    assert len(entries) > 100
+    assert all(entry.name for entry in entries)
+    # Every size and pull count in the bundled list is understood
+    assert all(entry.pulls > 0 for entry in entries)
+    assert all(parse_param_size(size) is not None for entry in entries for size in entry.model["sizes"])
+
+
+def test_saved_search_page_as_fixture(tmp_path):
+    entries = _fixture_entries(tmp_path, HTML_FIXTURE)
+
+    mixtral = next(entry for entry in entries if entry.name == "mixtral")
+    assert (mixtral.min_size, mixtral.max_size) == (56.0, 176.0)
+    assert mixtral.pulls == 1_200_000
+    assert {entry.name for entry in entries} == {"deepseek-r1", "mixtral", "mxbai-embed-large"}
@@ -0,0 +1,55 @@
+import math
+from datetime import datetime, timezone
+
+import pytest
+
+from src.utils import model_lifecycle
+from src.utils.model_lifecycle import _seconds_left, keep_alive_seconds
+
+_NOW = datetime(2026, 1, 1, tzinfo=timezone.utc).timestamp()
+
+
+@pytest.mark.parametrize("value, seconds", [
+    ("1h30m", 5400.0),
+    ("30m", 1800.0),
+    ("1.5s", 1.5),
+    ("250ms", 0.25),
+    ("300", 300.0),
+    (" 300 ", 300.0),
+    ("0", 0.0),
+    ("-1", None),
+    ("-5m", None),
+])
+def test_keep_alive_seconds(value, seconds):
+    assert keep_alive_seconds(value) == seconds
+
+
+@pytest.mark.parametrize("value", ["", "soon", "5x", "1h 30m", "m", "30m5"])
+def test_invalid_keep_alive_is_rejected(value):
+    with pytest.raises(ValueError):
+        keep_alive_seconds(value)
+
+
+@pytest.mark.parametrize("expires_at, seconds", [
+    ("2026-01-01T00:05:00Z", 300.0),
+    ("2026-01-01T00:05:00", 300.0),
+    ("2026-01-01T01:05:00+01:00", 300.0),
+    ("2026-01-01T00:05:00.5Z", 300.5),
+    # Ollama writes nanoseconds; the digits past microseconds are dropped
+    ("2026-01-01T00:05:00.123456789Z", 300.123456),
+    ("2025-12-31T23:59:00Z", -60.0),
+])
+def test_seconds_left(monkeypatch, expires_at, seconds):
+    monkeypatch.setattr(model_lifecycle.time, "time", lambda: _NOW)
+    assert _seconds_left(expires_at) == pytest.approx(seconds, abs=1e-6)
+
+
+def test_model_kept_loaded_forever_never_expires(monkeypatch):
+    monkeypatch.setattr(model_lifecycle.time, "time", lambda: _NOW)
+    # What /api/ps reports for a model loaded with a negative keep_alive
+    assert _seconds_left("2318-08-27T06:45:08.123456789+02:00") == math.inf
+
+
+@pytest.mark.parametrize("expires_at", [None, "", "soon", "2026-01-01 00:05:00", "2026-01-01T00:05Z"])
+def test_unparsable_expiry_is_unknown(expires_at):
+    assert _seconds_left(expires_at) is None
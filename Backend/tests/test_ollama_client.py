@@ -0,0 +1,48 @@
+import asyncio
+
+import httpx
+
+from src.utils.ollama_client import OllamaClient
+
+
+def _client(handler) -> OllamaClient:
+    client = OllamaClient("http://ollama.test/api/")
+    client._client = httpx.AsyncClient(base_url=client.base_url, transport=httpx.MockTransport(handler))
+    return client
+
+
+def _dropping(calls):
+    def handler(request):
+        calls.append(request.url.path)
+        raise httpx.RemoteProtocolError("Server disconnected without sending a response", request=request)
+    return handler
+
+
+def test_dropped_generation_is_not_retried():
+    calls = []
+    response = asyncio.run(_client(_dropping(calls)).request("chat", "POST", {"model": "m", "messages": []}, retries=2))
+    assert "error" in response
+    assert calls == ["/api/chat"]
+
+
+def test_dropped_metadata_call_is_retried(monkeypatch):
+    monkeypatch.setattr("src.utils.ollama_client.config.OLLAMA_RETRY_BACKOFF", 0)
+    calls = []
+    response = asyncio.run(_client(_dropping(calls)).request("tags", "GET", retries=2))
+    assert "error" in response
+    assert calls == ["/api/tags"] * 3
+
+
+def test_connect_error_is_retried_for_generations(monkeypatch):
+    monkeypatch.setattr("src.utils.ollama_client.config.OLLAMA_RETRY_BACKOFF", 0)
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        if len(calls) == 1:
+            raise httpx.ConnectError("Connection refused", request=request)
+        return httpx.Response(200, json={"message": {"content": "hi"}, "done": True})
+
+    response = asyncio.run(_client(handler).request("chat", "POST", {"model": "m", "messages": [{"role": "user", "content": "x"}]}))
+    assert response["message"]["content"] == "hi"
+    assert len(calls) == 2
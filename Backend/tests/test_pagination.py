@@ -0,0 +1,16 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from src.utils.pagination import decode_cursor, encode_cursor
+
+
+def test_cursor_round_trips():
+    created_at = datetime(2026, 1, 2, 3, 4, 5, 678000, tzinfo=timezone.utc)
+    assert decode_cursor(encode_cursor(created_at, "abc")) == (created_at, "abc")
+
+
+@pytest.mark.parametrize("cursor", ["", "not-a-cursor", "WyJ4Il0"])
+def test_malformed_cursor_is_a_value_error(cursor):
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        decode_cursor(cursor)
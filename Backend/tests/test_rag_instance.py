@@ -0,0 +1,12 @@
+from src.utils.rag_instance import RAGEngine
+
+
+def test_is_initialized_does_not_load(tmp_path, monkeypatch):
+    engine = RAGEngine(db_path=str(tmp_path / "rag"))
+
+    def load():
+        raise AssertionError("is_initialized loaded RAG")
+    monkeypatch.setattr(engine, "load", load)
+
+    assert not engine.is_initialized
+    assert engine.state == "not_loaded"
@@ -0,0 +1,98 @@
+import asyncio
+
+from src.utils.scheduler import GenerationScheduler
+
+
+def _scheduler(**limits) -> GenerationScheduler:
+    scheduler = GenerationScheduler(**{"max_inflight": 4, "max_inflight_per_model": 1, "ps_refresh_seconds": 3600, **limits})
+    # Nothing loaded, and no /api/ps call to a real Ollama
+    scheduler.update_loaded_models([])
+    return scheduler
+
+
+async def _settle():
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+
+def test_runnable_request_is_not_held_behind_unrelated_queue():
+    async def scenario():
+        scheduler = _scheduler()
+        running = await scheduler.acquire("a", "s1")
+        queued_a = asyncio.create_task(scheduler.acquire("a", "s2"))
+        await _settle()
+        assert not queued_a.done()
+
+        # "b" has free capacity even though an "a" request is queued
+        ticket_b = await asyncio.wait_for(scheduler.acquire("b", "s3"), timeout=1)
+        assert ticket_b.model == "b:latest"
+        assert not queued_a.done()
+
+        scheduler.release(running)
+        ticket_a = await asyncio.wait_for(queued_a, timeout=1)
+        assert ticket_a.model == "a:latest"
+        scheduler.release(ticket_a)
+        scheduler.release(ticket_b)
+        assert scheduler.stats()["inflight"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_head_waiter_unblocks_its_session():
+    async def scenario():
+        scheduler = _scheduler()
+        running = await scheduler.acquire("a", "s1")
+        head = asyncio.create_task(scheduler.acquire("a", "s2"))
+        await _settle()
+        behind = asyncio.create_task(scheduler.acquire("b", "s2"))
+        await _settle()
+        # Same session: "b" waits its turn behind the blocked "a"
+        assert not behind.done()
+
+        head.cancel()
+        ticket_b = await asyncio.wait_for(behind, timeout=1)
+        assert ticket_b.model == "b:latest"
+        assert scheduler.stats()["queue_depth"] == 0
+        scheduler.release(ticket_b)
+        scheduler.release(running)
+
+    asyncio.run(scenario())
+
+
+def test_queue_waits_while_global_limit_is_reached():
+    async def scenario():
+        scheduler = _scheduler(max_inflight=1)
+        running = await scheduler.acquire("a", "s1")
+        queued = asyncio.create_task(scheduler.acquire("b", "s2"))
+        await _settle()
+        assert not queued.done()
+        scheduler.release(running)
+        ticket = await asyncio.wait_for(queued, timeout=1)
+        assert ticket.model == "b:latest"
+        scheduler.release(ticket)
+
+    asyncio.run(scenario())
+
+
+def test_model_aliases_share_the_per_model_limit():
+    async def scenario():
+        scheduler = _scheduler(max_inflight_per_model=2, max_active_models=2)
+        tickets = [await scheduler.acquire("llama3", "s1"), await scheduler.acquire("llama3:latest", "s2")]
+        queued = [asyncio.create_task(scheduler.acquire(model, "s3")) for model in ("llama3", "llama3:latest")]
+        await _settle()
+        assert not any(task.done() for task in queued)
+        assert scheduler.stats()["inflight_per_model"] == {"llama3:latest": 2}
+        assert scheduler.busy("llama3")
+
+        # The alias did not take a second active-model slot
+        other = await asyncio.wait_for(scheduler.acquire("mistral", "s4"), timeout=1)
+        scheduler.release(other)
+
+        for ticket in tickets:
+            scheduler.release(ticket)
+        for ticket in await asyncio.wait_for(asyncio.gather(*queued), timeout=1):
+            scheduler.release(ticket)
+        assert scheduler.stats()["inflight"] == 0
+        assert not scheduler.busy("llama3:latest")
+
+    asyncio.run(scenario())
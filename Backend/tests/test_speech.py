@@ -0,0 +1,77 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+
+import pytest
+
+from src.utils import speech
+
+
+class _Recognizer:
+    def SetWords(self, words):
+        pass
+
+    def AcceptWaveform(self, pcm):
+        return False
+
+    def PartialResult(self):
+        return '{"partial": ""}'
+
+    def FinalResult(self):
+        return '{"text": "hello"}'
+
+
+class _Engine:
+    def __init__(self):
+        self.acquired = 0
+
+    async def ensure_loaded(self):
+        pass
+
+    @asynccontextmanager
+    async def recognizer(self):
+        self.acquired += 1
+        yield _Recognizer()
+
+
+async def _chunks(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+def test_spooled_upload_over_the_limit_is_rejected(tmp_path, monkeypatch):
+    monkeypatch.setattr(speech.config, "STT_MAX_UPLOAD_BYTES", 100)
+    monkeypatch.setattr(speech.tempfile, "tempdir", str(tmp_path))
+
+    async def scenario():
+        async for _ in speech._decode(_chunks(b"\0" * 64, b"\0" * 64), "m4a"):
+            pass
+
+    with pytest.raises(speech.SpeechError, match="larger than 100 bytes"):
+        asyncio.run(scenario())
+    # The spool directory is gone and ffmpeg was never started
+    assert os.listdir(tmp_path) == []
+
+
+def test_recognizer_is_taken_once_audio_arrives(monkeypatch):
+    engine = _Engine()
+    monkeypatch.setattr(speech, "speech_engine", engine)
+
+    async def scenario():
+        spoken = asyncio.Event()
+
+        async def chunks():
+            await spoken.wait()
+            yield b"\0" * 3200
+
+        events = speech.transcribe_stream(chunks(), "pcm")
+        first = asyncio.ensure_future(anext(events))
+        await asyncio.sleep(0.05)
+        assert engine.acquired == 0
+
+        spoken.set()
+        return [await first] + [event async for event in events]
+
+    events = asyncio.run(scenario())
+    assert engine.acquired == 1
+    assert events[-1] == {"type": "final", "text": "hello"}
@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+
+from src.utils.vector_store import AnnVectorStore, VectorStore
+
+
+def test_incomplete_backend_fails_at_construction():
+    class Partial(VectorStore):
+        def add(self, ids, texts, embeddings, metadatas):
+            pass
+
+    with pytest.raises(TypeError):
+        Partial()
+
+
+def test_ann_search_returns_stored_vectors(tmp_path):
+    store = AnnVectorStore(str(tmp_path / "ann"))
+    vectors = np.eye(4, dtype=np.float32)
+    store.add(["a", "b", "c", "d"], ["A", "B", "C", "D"], vectors, [{"session_id": "s"}] * 4)
+
+    hit = store.search(vectors[1], 1)[0]
+    assert hit.id == "b"
+    assert np.allclose(hit.vector, vectors[1])
+    assert set(store.get_vectors(["c", "missing"])) == {"c"}
+    # Ids are found again after reopening the store
+    assert np.allclose(AnnVectorStore(str(tmp_path / "ann")).get_vectors(["d"])["d"], vectors[3])
@@ -0,0 +1,48 @@
+import os
+
+from src.utils.webscraper import _SearchPageParser, parse_search_page
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "ollama_search.html")
+
+
+def _page():
+    with open(FIXTURE, encoding="utf-8") as f:
+        return f.read()
+
+
+def test_search_page_results_are_parsed_in_order():
+    models = parse_search_page(_page())
+
+    assert [m["model_name"] for m in models] == ["deepseek-r1", "mixtral", "mxbai-embed-large"]
+    assert models[0] == {
+        "model_name": "deepseek-r1",
+        "link": "/library/deepseek-r1",
+        "description": "DeepSeek-R1 is a family of open reasoning models with performance approaching "
+                       "that of leading models, such as O3 and Gemini 2.5 Pro.",
+        "capability": ["tools", "thinking"],
+        "sizes": ["1.5b", "7b", "671b"],
+        "pulls": "49.1M",
+        "tags": "35",
+        "last_updated": "yesterday",
+    }
+
+
+def test_title_without_marker_and_entities():
+    mixtral = parse_search_page(_page())[1]
+
+    # No x-test-search-response-title: the first span of the <h2> names the model
+    assert mixtral["model_name"] == "mixtral"
+    assert mixtral["description"] == ("A set of Mixture of Experts (MoE) model with open weights by Mistral AI "
+                                      "in 8x7b & 8x22b parameter sizes.")
+    assert mixtral["sizes"] == ["8x7b", "8x22b"]
+    # A <br> inside the result does not throw off where it ends
+    assert (mixtral["pulls"], mixtral["tags"], mixtral["last_updated"]) == ("1.2M", "70", "8 months ago")
+
+
+def test_navigation_lists_are_not_results():
+    parser = _SearchPageParser()
+    parser.feed('<ul><li><a href="/models">Models</a></li></ul>'
+                '<li x-test-model><a href="/library/phi3"><h2><span>phi3</span></h2></a></li>')
+    parser.close()
+
+    assert [(m["model_name"], m["link"]) for m in parser.models] == [("phi3", "/library/phi3")]